@@ -10,7 +10,6 @@ import os
 
 from app.db import Base
 from app import models  # noqa
-from app.config import settings
 
 config = context.config
 fileConfig(config.config_file_name)
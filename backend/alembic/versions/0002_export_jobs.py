@@ -0,0 +1,38 @@
+"""export jobs
+
+Revision ID: 0002_export_jobs
+Revises: 0001_init
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002_export_jobs"
+down_revision = "0001_init"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "export_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("instance_id", sa.Integer(), sa.ForeignKey("instances.id"), nullable=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer(), nullable=False, server_default="3"),
+        sa.Column("error", sa.Text(), nullable=False, server_default=""),
+        sa.Column("result_filename", sa.String(length=255), nullable=False, server_default=""),
+        sa.Column("result_bytes", sa.LargeBinary(), nullable=True),
+        sa.Column("run_after", sa.DateTime(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_export_jobs_instance_id", "export_jobs", ["instance_id"])
+    op.create_index("ix_export_jobs_status", "export_jobs", ["status"])
+
+def downgrade():
+    op.drop_index("ix_export_jobs_status", table_name="export_jobs")
+    op.drop_index("ix_export_jobs_instance_id", table_name="export_jobs")
+    op.drop_table("export_jobs")
@@ -0,0 +1,102 @@
+"""move template bytes into the blob store
+
+Revision ID: 0003_template_blobs
+Revises: 0002_export_jobs
+Create Date: 2026-10-18
+"""
+import hashlib, os
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_template_blobs"
+down_revision = "0002_export_jobs"
+branch_labels = None
+depends_on = None
+
+templates = sa.table(
+    "templates",
+    sa.column("id", sa.Integer()),
+    sa.column("file_bytes", sa.LargeBinary()),
+    sa.column("file_sha256", sa.String()),
+    sa.column("file_size", sa.Integer()),
+)
+blobs = sa.table(
+    "blobs",
+    sa.column("sha256", sa.String()),
+    sa.column("size", sa.Integer()),
+    sa.column("data", sa.LargeBinary()),
+)
+
+# The blob backends as they stood at this revision, inlined so later changes to app.blobstore
+# cannot change what this migration does. Only the backend settings are read from the app.
+def _backend():
+    from app.config import get_settings
+    s = get_settings()
+    if s.BLOB_BACKEND not in ("db", "local", "s3"):
+        raise ValueError(f"Unknown BLOB_BACKEND {s.BLOB_BACKEND!r}")
+    return s
+
+def _local_path(s, key: str) -> str:
+    return os.path.join(s.BLOB_DIR, key[:2], key[2:4], key)
+
+def _s3(s):
+    import boto3
+    return boto3.client("s3", endpoint_url=s.S3_ENDPOINT_URL or None)
+
+def _put(conn, s, key: str, data: bytes):
+    if s.BLOB_BACKEND == "db":
+        if conn.execute(sa.select(blobs.c.sha256).where(blobs.c.sha256 == key)).first() is None:
+            conn.execute(blobs.insert().values(sha256=key, size=len(data), data=data))
+    elif s.BLOB_BACKEND == "local":
+        path = _local_path(s, key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+    else:
+        _s3(s).put_object(Bucket=s.S3_BUCKET, Key=s.S3_PREFIX + key, Body=data)
+
+def _get(conn, s, key: str) -> bytes:
+    if s.BLOB_BACKEND == "db":
+        return conn.execute(sa.select(blobs.c.data).where(blobs.c.sha256 == key)).scalar_one()
+    if s.BLOB_BACKEND == "local":
+        with open(_local_path(s, key), "rb") as f:
+            return f.read()
+    return _s3(s).get_object(Bucket=s.S3_BUCKET, Key=s.S3_PREFIX + key)["Body"].read()
+
+def upgrade():
+    op.create_table(
+        "blobs",
+        sa.Column("sha256", sa.String(length=64), primary_key=True),
+        sa.Column("size", sa.Integer(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.add_column("templates", sa.Column("file_sha256", sa.String(length=64), nullable=True))
+    op.add_column("templates", sa.Column("file_size", sa.Integer(), nullable=False, server_default="0"))
+
+    conn = op.get_bind()
+    settings = _backend()
+    ids = [r.id for r in conn.execute(sa.select(templates.c.id))]
+    for template_id in ids:  # one row at a time to keep memory flat
+        data = conn.execute(sa.select(templates.c.file_bytes).where(templates.c.id == template_id)).scalar_one()
+        key = hashlib.sha256(data).hexdigest()
+        _put(conn, settings, key, data)
+        conn.execute(templates.update().where(templates.c.id == template_id).values(file_sha256=key, file_size=len(data)))
+
+    op.alter_column("templates", "file_sha256", nullable=False)
+    op.create_index("ix_templates_file_sha256", "templates", ["file_sha256"])
+    op.drop_column("templates", "file_bytes")
+
+def downgrade():
+    op.add_column("templates", sa.Column("file_bytes", sa.LargeBinary(), nullable=True))
+    conn = op.get_bind()
+    settings = _backend()
+    for r in conn.execute(sa.select(templates.c.id, templates.c.file_sha256)).all():
+        conn.execute(templates.update().where(templates.c.id == r.id).values(file_bytes=_get(conn, settings, r.file_sha256)))
+    op.alter_column("templates", "file_bytes", nullable=False)
+    op.drop_index("ix_templates_file_sha256", table_name="templates")
+    op.drop_column("templates", "file_size")
+    op.drop_column("templates", "file_sha256")
+    op.drop_table("blobs")
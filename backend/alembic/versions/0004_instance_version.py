@@ -0,0 +1,19 @@
+"""instance version for optimistic concurrency
+
+Revision ID: 0004_instance_version
+Revises: 0003_template_blobs
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_instance_version"
+down_revision = "0003_template_blobs"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("instances", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+
+def downgrade():
+    op.drop_column("instances", "version")
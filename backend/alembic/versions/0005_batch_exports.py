@@ -0,0 +1,30 @@
+"""batch export jobs
+
+Revision ID: 0005_batch_exports
+Revises: 0004_instance_version
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_batch_exports"
+down_revision = "0004_instance_version"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("export_jobs", sa.Column("kind", sa.String(length=20), nullable=False, server_default="single"))
+    op.add_column("export_jobs", sa.Column("params_json", sa.Text(), nullable=False, server_default="{}"))
+    op.add_column("export_jobs", sa.Column("progress_done", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("export_jobs", sa.Column("progress_total", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("export_jobs", sa.Column("result_path", sa.String(length=500), nullable=False, server_default=""))
+    op.alter_column("export_jobs", "instance_id", nullable=True)
+
+def downgrade():
+    op.execute("DELETE FROM export_jobs WHERE kind = 'batch'")
+    op.alter_column("export_jobs", "instance_id", nullable=False)
+    op.drop_column("export_jobs", "result_path")
+    op.drop_column("export_jobs", "progress_total")
+    op.drop_column("export_jobs", "progress_done")
+    op.drop_column("export_jobs", "params_json")
+    op.drop_column("export_jobs", "kind")
@@ -0,0 +1,26 @@
+"""composite indexes for keyset pagination
+
+Revision ID: 0006_keyset_indexes
+Revises: 0005_batch_exports
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0006_keyset_indexes"
+down_revision = "0005_batch_exports"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # audit_events is the big table: build without blocking writers on Postgres.
+    with op.get_context().autocommit_block():
+        op.create_index("ix_audit_events_instance_created_id", "audit_events", ["instance_id", "created_at", "id"],
+                        postgresql_concurrently=True)
+        op.drop_index("ix_audit_events_instance_id", table_name="audit_events", postgresql_concurrently=True)
+    op.create_index("ix_templates_created_at_id", "templates", ["created_at", "id"])
+
+def downgrade():
+    op.drop_index("ix_templates_created_at_id", table_name="templates")
+    with op.get_context().autocommit_block():
+        op.create_index("ix_audit_events_instance_id", "audit_events", ["instance_id"], postgresql_concurrently=True)
+        op.drop_index("ix_audit_events_instance_created_id", table_name="audit_events", postgresql_concurrently=True)
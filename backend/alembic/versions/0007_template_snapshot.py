@@ -0,0 +1,20 @@
+"""precomputed sheet snapshot index on templates
+
+Revision ID: 0007_template_snapshot
+Revises: 0006_keyset_indexes
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_template_snapshot"
+down_revision = "0006_keyset_indexes"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing templates get their snapshot built on first request.
+    op.add_column("templates", sa.Column("snapshot_json", sa.Text(), nullable=False, server_default=""))
+
+def downgrade():
+    op.drop_column("templates", "snapshot_json")
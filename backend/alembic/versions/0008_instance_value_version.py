@@ -0,0 +1,19 @@
+"""per-cell version on instance values for live-editing conflict detection
+
+Revision ID: 0008_instance_value_version
+Revises: 0007_template_snapshot
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_instance_value_version"
+down_revision = "0007_template_snapshot"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("instance_values", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+
+def downgrade():
+    op.drop_column("instance_values", "version")
@@ -0,0 +1,99 @@
+"""typed shadows of instance values and report indexes
+
+Revision ID: 0009_typed_values
+Revises: 0008_instance_value_version
+Create Date: 2026-10-18
+"""
+import math, re
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_typed_values"
+down_revision = "0008_instance_value_version"
+branch_labels = None
+depends_on = None
+
+BATCH = 5000
+
+# Number and date parsing as app.typed had it at this revision, inlined so later changes there
+# cannot change what this backfill stores.
+_PLAIN_NUMBER = re.compile(r"[+-]?\d+(?:\.\d+)?")
+_DECIMAL = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_GROUPED_DOT = re.compile(r"[+-]?\d{1,3}(?:\.\d{3})+(?:,\d+)?")
+_GROUPED_COMMA = re.compile(r"[+-]?\d{1,3}(?:,\d{3})+(?:\.\d+)?")
+
+def _number(v: str) -> float | None:
+    v = v.replace(" ", "").replace("\u00a0", "")
+    if not _PLAIN_NUMBER.fullmatch(v):
+        if _GROUPED_DOT.fullmatch(v) and (v.count(".") > 1 or "," in v):
+            v = v.replace(".", "").replace(",", ".")
+        elif _GROUPED_COMMA.fullmatch(v) and (v.count(",") > 1 or "." in v):
+            v = v.replace(",", "")
+        elif v.count(",") == 1 and "." not in v:
+            v = v.replace(",", ".")
+        if not _DECIMAL.fullmatch(v):
+            return None
+    n = float(v)
+    return n if math.isfinite(n) else None
+
+def _date(v: str) -> datetime | None:
+    try:
+        return datetime.fromisoformat(v).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for fmt in ("%d/%m/%Y", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(v, fmt)
+        except ValueError:
+            continue
+    return None
+
+def _backfill():
+    conn = op.get_bind()
+    values = sa.table("instance_values", sa.column("id"), sa.column("value"), sa.column("sheet_name"), sa.column("cell_ref"),
+                      sa.column("instance_id"), sa.column("num_value"), sa.column("date_value"))
+    instances = sa.table("instances", sa.column("id"), sa.column("template_id"))
+    cells = sa.table("template_cells", sa.column("template_id"), sa.column("sheet_name"), sa.column("cell_ref"), sa.column("data_type"))
+    typed = (
+        sa.select(values.c.id, values.c.value, cells.c.data_type)
+        .join(instances, instances.c.id == values.c.instance_id)
+        .join(cells, sa.and_(cells.c.template_id == instances.c.template_id, cells.c.sheet_name == values.c.sheet_name,
+                             cells.c.cell_ref == values.c.cell_ref))
+        .where(cells.c.data_type.in_(("number", "date")))
+        .order_by(values.c.id)
+    )
+    last = 0
+    while True:
+        rows = conn.execute(typed.where(values.c.id > last).limit(BATCH)).all()
+        if not rows:
+            break
+        params = []
+        for id_, value, data_type in rows:
+            v = (value or "").strip()  # legacy invalid strings simply stay untyped
+            num = _number(v) if v and data_type == "number" else None
+            date = _date(v) if v and data_type == "date" else None
+            if num is not None or date is not None:
+                params.append({"pk": id_, "num": num, "date": date})
+        if params:
+            conn.execute(values.update().where(values.c.id == sa.bindparam("pk"))
+                         .values(num_value=sa.bindparam("num"), date_value=sa.bindparam("date")), params)
+        last = rows[-1][0]
+
+def upgrade():
+    op.add_column("instance_values", sa.Column("num_value", sa.Float(), nullable=True))
+    op.add_column("instance_values", sa.Column("date_value", sa.DateTime(), nullable=True))
+    _backfill()
+    with op.get_context().autocommit_block():
+        op.create_index("ix_instance_values_cell", "instance_values", ["sheet_name", "cell_ref", "instance_id"],
+                        postgresql_include=["num_value", "date_value"], postgresql_concurrently=True)
+        op.create_index("ix_instances_template_created", "instances", ["template_id", "created_at"], postgresql_concurrently=True)
+        op.drop_index("ix_instances_template_id", table_name="instances", postgresql_concurrently=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index("ix_instances_template_id", "instances", ["template_id"], postgresql_concurrently=True)
+        op.drop_index("ix_instances_template_created", table_name="instances", postgresql_concurrently=True)
+        op.drop_index("ix_instance_values_cell", table_name="instance_values", postgresql_concurrently=True)
+    op.drop_column("instance_values", "date_value")
+    op.drop_column("instance_values", "num_value")
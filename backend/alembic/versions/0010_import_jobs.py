@@ -0,0 +1,19 @@
+"""summary of bulk import jobs
+
+Revision ID: 0010_import_jobs
+Revises: 0009_typed_values
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010_import_jobs"
+down_revision = "0009_typed_values"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("export_jobs", sa.Column("summary_json", sa.Text(), nullable=False, server_default="{}"))
+
+def downgrade():
+    op.drop_column("export_jobs", "summary_json")
@@ -0,0 +1,27 @@
+"""upload source hash and processing status on templates
+
+Revision ID: 0011_template_processing
+Revises: 0010_import_jobs
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0011_template_processing"
+down_revision = "0010_import_jobs"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("templates", sa.Column("source_sha256", sa.String(64), nullable=False, server_default=""))
+    op.add_column("templates", sa.Column("status", sa.String(20), nullable=False, server_default="ready"))
+    op.add_column("templates", sa.Column("error", sa.Text(), nullable=False, server_default=""))
+    # xlsx uploads are stored unchanged, so their source is the stored file; converted ones stay unknown
+    op.execute("UPDATE templates SET source_sha256 = file_sha256 WHERE lower(original_filename) LIKE '%.xlsx'")
+    op.create_index("ix_templates_source_sha256", "templates", ["source_sha256"])
+
+def downgrade():
+    op.drop_index("ix_templates_source_sha256", table_name="templates")
+    op.drop_column("templates", "error")
+    op.drop_column("templates", "status")
+    op.drop_column("templates", "source_sha256")
@@ -0,0 +1,80 @@
+"""audit archives; monthly partitions of audit_events on Postgres
+
+Revision ID: 0012_audit_partitions
+Revises: 0011_template_processing
+Create Date: 2026-10-18
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0012_audit_partitions"
+down_revision = "0011_template_processing"
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 3
+
+def _month(d) -> date:
+    return date(d.year, d.month, 1)
+
+def _next(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+def _constraints(table: str):
+    op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY (instance_id) REFERENCES instances (id)")
+    op.execute(f"ALTER TABLE {table} ADD FOREIGN KEY (user_id) REFERENCES users (id)")
+    op.execute(f"CREATE INDEX ix_audit_events_instance_created_id ON {table} (instance_id, created_at, id)")
+
+def upgrade():
+    op.create_table(
+        "audit_archives",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("period_start", sa.DateTime(), nullable=False),
+        sa.Column("period_end", sa.DateTime(), nullable=False),
+        sa.Column("file_sha256", sa.String(64), nullable=False),
+        sa.Column("row_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("size_bytes", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_audit_archives_period_start", "audit_archives", ["period_start"])
+
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    # Rebuild audit_events as a table partitioned by month of created_at. The primary key of a
+    # partitioned table must contain the partition key, hence (id, created_at).
+    op.execute("ALTER TABLE audit_events RENAME TO audit_events_flat")
+    op.execute("ALTER TABLE audit_events_flat RENAME CONSTRAINT audit_events_pkey TO audit_events_flat_pkey")
+    op.execute("ALTER INDEX ix_audit_events_instance_created_id RENAME TO ix_audit_events_flat_instance_created_id")
+    op.execute("CREATE TABLE audit_events (LIKE audit_events_flat INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+               "PARTITION BY RANGE (created_at)")
+    op.execute("ALTER TABLE audit_events ADD PRIMARY KEY (id, created_at)")
+    _constraints("audit_events")
+    op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY audit_events.id")
+    op.execute("CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT")
+
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM audit_events_flat")).scalar()
+    now = _month(datetime.utcnow())
+    month, last = _month(oldest or now), now
+    for _ in range(PARTITIONS_AHEAD):
+        last = _next(last)
+    while month <= last:
+        op.execute(f"CREATE TABLE audit_events_y{month.year:04d}m{month.month:02d} PARTITION OF audit_events "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next(month).isoformat()}')")
+        month = _next(month)
+
+    op.execute("INSERT INTO audit_events SELECT * FROM audit_events_flat")
+    op.execute("DROP TABLE audit_events_flat")
+
+def downgrade():
+    # Events already moved to audit_archives files are not brought back.
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("CREATE TABLE audit_events_flat (LIKE audit_events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        op.execute("INSERT INTO audit_events_flat SELECT * FROM audit_events")
+        op.execute("ALTER SEQUENCE audit_events_id_seq OWNED BY audit_events_flat.id")
+        op.execute("DROP TABLE audit_events")  # and its partitions
+        op.execute("ALTER TABLE audit_events_flat RENAME TO audit_events")
+        op.execute("ALTER TABLE audit_events ADD PRIMARY KEY (id)")
+        _constraints("audit_events")
+    op.drop_index("ix_audit_archives_period_start", table_name="audit_archives")
+    op.drop_table("audit_archives")
@@ -0,0 +1,25 @@
+"""one-row value snapshot per instance
+
+Revision ID: 0013_instance_snapshots
+Revises: 0012_audit_partitions
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0013_instance_snapshots"
+down_revision = "0012_audit_partitions"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Existing instances get their snapshot on first read (app/instancesnap.py), not here.
+    op.create_table(
+        "instance_snapshots",
+        sa.Column("instance_id", sa.Integer(), sa.ForeignKey("instances.id"), primary_key=True),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("values_json", sa.Text(), nullable=False, server_default="[]"),
+    )
+
+def downgrade():
+    op.drop_table("instance_snapshots")
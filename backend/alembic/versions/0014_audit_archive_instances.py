@@ -0,0 +1,26 @@
+"""instances per audit archive
+
+Revision ID: 0014_audit_archive_instances
+Revises: 0013_instance_snapshots
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0014_audit_archive_instances"
+down_revision = "0013_instance_snapshots"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Archives already written have no instance list; they stay unindexed and every export reads them.
+    op.add_column("audit_archives", sa.Column("instances_indexed", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_table(
+        "audit_archive_instances",
+        sa.Column("instance_id", sa.Integer(), primary_key=True),
+        sa.Column("archive_id", sa.Integer(), sa.ForeignKey("audit_archives.id"), primary_key=True),
+    )
+
+def downgrade():
+    op.drop_table("audit_archive_instances")
+    op.drop_column("audit_archives", "instances_indexed")
@@ -0,0 +1,20 @@
+"""liveness heartbeat of running export jobs
+
+Revision ID: 0015_export_job_heartbeat
+Revises: 0014_audit_archive_instances
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0015_export_job_heartbeat"
+down_revision = "0014_audit_archive_instances"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Jobs running during the upgrade have none; they are judged by started_at until their next heartbeat.
+    op.add_column("export_jobs", sa.Column("heartbeat_at", sa.DateTime(), nullable=True))
+
+def downgrade():
+    op.drop_column("export_jobs", "heartbeat_at")
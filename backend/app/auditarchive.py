@@ -0,0 +1,163 @@
+"""Archival of old audit months to Parquet files, and reading them back for exports.
+
+A month older than AUDIT_ARCHIVE_AFTER_MONTHS is streamed out of ``audit_events``
+sorted by (instance_id, created_at, id) into a zstd-compressed Parquet file with
+row groups of AUDIT_ARCHIVE_ROW_GROUP rows, stored in the blob store and listed
+in ``audit_archives``. In the same transaction the month leaves the table: its
+partition is detached and dropped on Postgres, its rows deleted elsewhere.
+
+Each archive also lists the instances it holds events of
+(``audit_archive_instances``). Exports put an instance's archived events
+(``archived_rows``) ahead of its live ones, so the appendix of a historical
+instance stays complete: only the archives listing it are fetched, to a scratch
+file rather than into memory, and the row-group statistics on instance_id let
+the reader skip the groups of other instances. ``GET /instances/{id}/audit``
+lists live events only.
+
+Runs as an ``archive`` job (``POST /admin/audit/archive``) or from cron with
+``python -m app.auditarchive``; both also create the coming partitions. Needs
+pyarrow (``pip install excelflow-backend[archive]``).
+"""
+import json, os, tempfile
+from datetime import date, datetime
+from typing import Iterator
+from sqlalchemy import delete, insert, or_, select, text
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .models import AuditEvent, AuditArchive, AuditArchiveInstance
+from .blobstore import put_blob_file, blob_file
+from .auditlog import COLUMNS, month_start, next_month, is_partitioned, partitions, ensure_partitions
+
+ARCHIVE_COLUMNS = ["id"] + COLUMNS
+
+def _pyarrow():
+    try:
+        import pyarrow, pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Audit archives require pyarrow (pip install excelflow-backend[archive])") from e
+    return pyarrow, pyarrow.parquet
+
+def _schema(pa):
+    return pa.schema([
+        ("id", pa.int64()), ("instance_id", pa.int64()), ("user_id", pa.int64()), ("event_type", pa.string()),
+        ("sheet_name", pa.string()), ("cell_ref", pa.string()), ("old_value", pa.string()),
+        ("new_value", pa.string()), ("meta_json", pa.string()), ("created_at", pa.timestamp("us")),
+    ])
+
+def add_months(month: date, n: int) -> date:
+    i = month.year * 12 + month.month - 1 + n
+    return date(i // 12, i % 12 + 1, 1)
+
+def _bounds(month: date) -> tuple[datetime, datetime]:
+    end = next_month(month)
+    return datetime(month.year, month.month, 1), datetime(end.year, end.month, 1)
+
+def archivable_months(db: Session, now: datetime | None = None) -> list[date]:
+    """Months entirely older than AUDIT_ARCHIVE_AFTER_MONTHS still in ``audit_events``, oldest first."""
+    cutoff = add_months(month_start(now or datetime.utcnow()), -get_settings().AUDIT_ARCHIVE_AFTER_MONTHS)
+    if is_partitioned(db):
+        return sorted(m for m in partitions(db) if m < cutoff)
+    oldest = db.scalar(select(AuditEvent.created_at).order_by(AuditEvent.created_at.asc()).limit(1))
+    months = []
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def _write_parquet(db: Session, month: date, path: str) -> tuple[int, list[int]]:
+    """Write the month to ``path``; returns (rows, the instances they belong to)."""
+    pa, pq = _pyarrow()
+    s = get_settings()
+    schema = _schema(pa)
+    start, end = _bounds(month)
+    stmt = select(*(getattr(AuditEvent, c) for c in ARCHIVE_COLUMNS)) \
+        .where(AuditEvent.created_at >= start, AuditEvent.created_at < end) \
+        .order_by(AuditEvent.instance_id, AuditEvent.created_at, AuditEvent.id) \
+        .execution_options(yield_per=s.AUDIT_ARCHIVE_ROW_GROUP)
+    count, instances = 0, []
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for part in db.execute(stmt).partitions():
+            columns = list(zip(*part))
+            writer.write_table(pa.Table.from_arrays([pa.array(c, t) for c, t in zip(columns, schema.types)], schema=schema))
+            count += len(part)
+            for instance_id in columns[1]:  # sorted by instance
+                if not instances or instances[-1] != instance_id:
+                    instances.append(instance_id)
+    return count, instances
+
+def archive_month(db: Session, month: date) -> dict:
+    """Archive one month and remove it from ``audit_events``; commits. Months without rows leave no archive."""
+    month = month_start(month)
+    root = get_settings().EXPORT_SCRATCH_DIR
+    os.makedirs(root, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="audit-", suffix=".parquet", dir=root)
+    os.close(fd)
+    try:
+        count, instances = _write_parquet(db, month, path)
+        if count:
+            sha, size = put_blob_file(path)
+            start, end = _bounds(month)
+            archive = AuditArchive(period_start=start, period_end=end, file_sha256=sha, row_count=count,
+                                   size_bytes=size, instances_indexed=True)
+            db.add(archive)
+            db.flush()
+            db.execute(insert(AuditArchiveInstance), [{"archive_id": archive.id, "instance_id": i} for i in instances])
+    finally:
+        os.remove(path)
+    name = partitions(db).get(month) if is_partitioned(db) else None
+    if name:
+        db.execute(text(f"ALTER TABLE audit_events DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+    else:
+        start, end = _bounds(month)
+        db.execute(delete(AuditEvent).where(AuditEvent.created_at >= start, AuditEvent.created_at < end))
+    db.commit()
+    return {"month": month.isoformat()[:7], "rows": count}
+
+def run_archive(db: Session) -> dict:
+    """Create the coming partitions and archive every month past the retention; body of the ``archive`` job."""
+    created = ensure_partitions(db)
+    archived = [a for a in (archive_month(db, m) for m in archivable_months(db)) if a["rows"]]
+    return {"partitions_created": created, "archived": archived}
+
+def archives_for(db: Session, instance_id: int, created_at: datetime) -> list[AuditArchive]:
+    """Archives holding events of the instance (or that predate the per-instance index), oldest first."""
+    listed = select(AuditArchiveInstance.archive_id).where(AuditArchiveInstance.instance_id == instance_id)
+    return list(db.scalars(
+        select(AuditArchive)
+        .where(AuditArchive.period_end > created_at,
+               or_(AuditArchive.id.in_(listed), AuditArchive.instances_indexed.is_(False)))
+        .order_by(AuditArchive.period_start)
+    ))
+
+def _read_instance(pq, pc, path: str, instance_id: int) -> Iterator[dict]:
+    # Rows are sorted by instance, so its events sit in a few consecutive row groups; the others are
+    # skipped on their min/max statistics without being read.
+    pf = pq.ParquetFile(path, memory_map=True)
+    col = pf.schema_arrow.get_field_index("instance_id")
+    for i in range(pf.num_row_groups):
+        stats = pf.metadata.row_group(i).column(col).statistics
+        if stats is not None and stats.has_min_max and not stats.min <= instance_id <= stats.max:
+            continue
+        table = pf.read_row_group(i)
+        yield from table.filter(pc.equal(table["instance_id"], instance_id)).to_pylist()
+
+def archived_rows(db: Session, instance_id: int, created_at: datetime) -> Iterator[dict]:
+    """An instance's archived events in (created_at, id) order, one archive file and row group at a time."""
+    archives = archives_for(db, instance_id, created_at)
+    if not archives:
+        return
+    _, pq = _pyarrow()
+    import pyarrow.compute as pc
+    for a in archives:
+        with blob_file(a.file_sha256) as path:
+            yield from _read_instance(pq, pc, path, instance_id)
+
+def main():
+    from .db import SessionLocal
+    with SessionLocal() as db:
+        print(json.dumps(run_archive(db)))
+
+if __name__ == "__main__":
+    main()
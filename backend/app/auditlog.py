@@ -0,0 +1,127 @@
+"""Append-only audit writer and the monthly partitions of ``audit_events``.
+
+Handlers call ``record``/``record_many`` instead of adding ``AuditEvent``
+objects. Events are buffered on the session and written when it commits, as
+multi-row INSERTs, or COPY on Postgres from AUDIT_COPY_MIN_ROWS rows. So they
+land in the transaction of the change they describe: a committed save always
+has its audit rows, a rolled-back one never does, and no event waits in memory
+after the request. A buffer reaching AUDIT_BUFFER_ROWS is written early.
+
+On Postgres ``audit_events`` is range-partitioned by ``created_at``, one table
+per month (``audit_events_yYYYYmMM``) plus a default partition for anything
+outside them. ``ensure_partitions`` creates the coming months; rows that fell
+into the default partition meanwhile are moved into the new month. Reads that
+bound ``created_at`` (the instance's creation time, see ``since``) only touch
+the months involved, and old months are archived whole (auditarchive.py).
+"""
+import re
+from datetime import date, datetime
+from sqlalchemy import event, func, insert, select, text
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .models import AuditEvent
+from .bulk import copy_rows, CHUNK_SIZE
+
+COLUMNS = ["instance_id", "user_id", "event_type", "sheet_name", "cell_ref", "old_value", "new_value",
+           "meta_json", "created_at"]
+DEFAULTS = {"sheet_name": "", "cell_ref": "", "old_value": "", "new_value": "", "meta_json": "{}"}
+PARTITION = re.compile(r"audit_events_y(\d{4})m(\d{2})")
+
+def _buffer(db) -> list:
+    return getattr(db, "sync_session", db).info.setdefault("audit_buffer", [])
+
+def record(db, **event):
+    """Buffer one event (``instance_id``, ``user_id``, ``event_type`` and optional columns) for commit."""
+    record_many(db, [event])
+
+def record_many(db, events: list[dict]):
+    buf = _buffer(db)
+    now = datetime.utcnow()
+    buf.extend({**DEFAULTS, "created_at": now, **e} for e in events)
+    if len(buf) >= get_settings().AUDIT_BUFFER_ROWS and not hasattr(db, "sync_session"):
+        flush(db)  # async sessions write at commit, where the event hook runs on the sync side
+
+def flush(db: Session):
+    """Write the buffered events now, inside the current transaction."""
+    buf = db.info.pop("audit_buffer", None)
+    if buf:
+        write(db, buf)
+
+def write(db: Session, rows: list[dict]):
+    dialect = db.get_bind().dialect
+    if dialect.name == "postgresql" and not dialect.is_async and len(rows) >= get_settings().AUDIT_COPY_MIN_ROWS:
+        copy_rows(db, AuditEvent.__table__, COLUMNS, ([r[c] for c in COLUMNS] for r in rows))
+        return
+    for i in range(0, len(rows), CHUNK_SIZE // len(COLUMNS)):
+        db.execute(insert(AuditEvent).values(rows[i:i + CHUNK_SIZE // len(COLUMNS)]))
+
+@event.listens_for(Session, "before_commit")
+def _write_on_commit(session: Session):
+    flush(session)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session):
+    session.info.pop("audit_buffer", None)
+
+def since(created_at: datetime):
+    """Filter that lets Postgres skip the partitions older than an instance."""
+    return AuditEvent.created_at >= created_at
+
+def last_event(instance_id: int, created_at: datetime):
+    """Statement for the id of an instance's latest event; changes whenever its trail does (ETags)."""
+    return select(func.max(AuditEvent.id)).where(AuditEvent.instance_id == instance_id, since(created_at))
+
+# ------------------------------------------------------------ partitions (Postgres)
+
+def month_start(d: date | datetime) -> date:
+    return date(d.year, d.month, 1)
+
+def next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"audit_events_y{month.year:04d}m{month.month:02d}"
+
+def is_partitioned(db: Session) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    return bool(db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'audit_events'"
+    )).first())
+
+def partitions(db: Session) -> dict[date, str]:
+    """Monthly partitions currently attached, by first day of the month."""
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'audit_events'"
+    )).scalars()
+    out = {}
+    for name in names:
+        m = PARTITION.fullmatch(name)
+        if m:
+            out[date(int(m.group(1)), int(m.group(2)), 1)] = name
+    return out
+
+def create_partition(db: Session, month: date):
+    """Create ``month``'s partition, moving any of its rows out of the default partition first."""
+    name, start, end = partition_name(month), month.isoformat(), next_month(month).isoformat()
+    db.execute(text(f"CREATE TABLE {name} (LIKE audit_events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = f"created_at >= '{start}' AND created_at < '{end}'"
+    db.execute(text(f"INSERT INTO {name} SELECT * FROM audit_events_default WHERE {moved}"))
+    db.execute(text(f"DELETE FROM audit_events_default WHERE {moved}"))
+    db.execute(text(f"ALTER TABLE audit_events ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+def ensure_partitions(db: Session, ahead: int | None = None) -> list[str]:
+    """Create the partitions from this month to ``ahead`` months out (AUDIT_PARTITIONS_AHEAD); returns new names."""
+    if not is_partitioned(db):
+        return []
+    ahead = get_settings().AUDIT_PARTITIONS_AHEAD if ahead is None else ahead
+    existing = partitions(db)
+    month, created = month_start(datetime.utcnow()), []
+    for _ in range(ahead + 1):
+        if month not in existing:
+            create_partition(db, month)
+            created.append(partition_name(month))
+        month = next_month(month)
+    db.commit()
+    return created
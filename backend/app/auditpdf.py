@@ -0,0 +1,147 @@
+"""Streaming audit trail renderer: a wrapped, ruled table drawn row by row.
+
+Rows are consumed from any iterable (typically a server-side cursor) and never
+collected into a list; the PDF is written to a spooled temp file. reportlab
+still holds every finished page in its document until ``save()``, so memory
+grows with the page count; page compression only makes each held page smaller.
+"""
+import tempfile
+from typing import IO, Iterable, Iterator
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+COLUMNS = [  # (header, row key, width in points)
+    ("Data/Hora (UTC)", "created_at", 78),
+    ("Usuário", "user_email", 100),
+    ("Evento", "event_type", 42),
+    ("Planilha", "sheet_name", 62),
+    ("Célula", "cell_ref", 38),
+    ("De", "old_value", 87),
+    ("Para", "new_value", 88),
+]
+MARGIN = 50
+FONT, BOLD, SIZE = "Helvetica", "Helvetica-Bold", 7.5
+LEADING = SIZE + 1.5
+PAD = 2.5
+TABLE_WIDTH = sum(w for _, _, w in COLUMNS)
+MAX_LINES = 6  # longer cell values are cut with an ellipsis
+
+def summarize(rows: Iterable[dict]) -> Iterator[dict]:
+    """Collapse consecutive ``edit`` events by the same user on the same cell into one row."""
+    pending = None
+    for r in rows:
+        same = (
+            pending is not None and r.get("event_type") == "edit" and pending.get("event_type") == "edit"
+            and (r.get("user_email"), r.get("sheet_name"), r.get("cell_ref"))
+            == (pending.get("user_email"), pending.get("sheet_name"), pending.get("cell_ref"))
+        )
+        if same:
+            pending["new_value"] = r.get("new_value", "")
+            pending["_last_at"] = r.get("created_at", "")
+            pending["_count"] += 1
+            continue
+        if pending is not None:
+            yield _finish(pending)
+        pending = {**r, "_count": 1}
+    if pending is not None:
+        yield _finish(pending)
+
+def _finish(row: dict) -> dict:
+    count = row.pop("_count")
+    last = row.pop("_last_at", None)
+    if count > 1:
+        row["created_at"] = f'{row.get("created_at", "")} – {last}'
+        row["event_type"] = f"edit ×{count}"
+    return row
+
+def _wrap(text: str, width: float, font: str) -> list[str]:
+    if "\n" not in text and stringWidth(text, font, SIZE) <= width - 2 * PAD:
+        return [text]
+    lines = simpleSplit(text, font, SIZE, width - 2 * PAD) or [""]
+    if len(lines) > MAX_LINES:
+        lines = lines[:MAX_LINES]
+        lines[-1] = lines[-1][:-1] + "…"
+    return lines
+
+class _Table:
+    def __init__(self, out: IO[bytes], title: str):
+        self.c = canvas.Canvas(out, pagesize=A4, pageCompression=1)
+        self.w, self.h = A4
+        self.title = title
+        self.page = 0
+        self.rows = 0
+        self._new_page()
+
+    def _new_page(self):
+        if self.page:
+            self._close_page()
+        self.page += 1
+        self.y = self.h - MARGIN
+        self.c.setFont(BOLD, 14)
+        self.c.drawString(MARGIN, self.y, self.title if self.page == 1 else f"{self.title} (continuação)")
+        self.y -= 18
+        self.top = self.y
+        self._row([h for h, _, _ in COLUMNS], BOLD, fill=True)
+
+    def _close_page(self):
+        # Column rules are drawn once per page, spanning every row on it.
+        c = self.c
+        x = MARGIN
+        for _, _, width in COLUMNS:
+            c.line(x, self.top, x, self.y)
+            x += width
+        c.line(x, self.top, x, self.y)
+        c.setFont(FONT, 7)
+        c.drawRightString(self.w - MARGIN, MARGIN / 2, f"Página {self.page}")
+        c.showPage()
+
+    def _row(self, cells: list[str], font: str, fill: bool = False):
+        wrapped = [_wrap(text, width, font) for text, (_, _, width) in zip(cells, COLUMNS)]
+        height = max(len(lines) for lines in wrapped) * LEADING + 2 * PAD
+        if self.y - height < MARGIN and not fill:
+            self._new_page()
+        c = self.c
+        top, x = self.y, MARGIN
+        if fill:
+            c.setFillGray(0.9)
+            c.rect(MARGIN, top - height, TABLE_WIDTH, height, stroke=0, fill=1)
+            c.setFillGray(0)
+        text = c.beginText()
+        text.setFont(font, SIZE, LEADING)
+        for lines, (_, _, width) in zip(wrapped, COLUMNS):
+            text.setTextOrigin(x + PAD, top - PAD - SIZE)
+            text.textLines(lines)
+            x += width
+        c.drawText(text)
+        if fill:
+            c.line(MARGIN, top, x, top)
+        c.line(MARGIN, top - height, x, top - height)
+        self.y = top - height
+
+    def add(self, r: dict):
+        self._row([str(r.get(key, "") or "") for _, key, _ in COLUMNS], FONT)
+        self.rows += 1
+
+    def close(self):
+        if self.rows == 0:
+            self.c.setFont(FONT, SIZE)
+            self.c.drawString(MARGIN + PAD, self.y - SIZE - PAD, "Nenhum evento registrado.")
+        self._close_page()
+        self.c.save()
+
+def write_audit_pdf(rows: Iterable[dict], out: IO[bytes], summarize_edits: bool = False, title: str = "Trilha de Auditoria") -> int:
+    """Render ``rows`` into ``out``; returns the number of table rows drawn."""
+    table = _Table(out, title)
+    for r in (summarize(rows) if summarize_edits else rows):
+        table.add(r)
+    table.close()
+    return table.rows
+
+def spooled_audit_pdf(rows: Iterable[dict], summarize_edits: bool = False, max_memory: int = 8 * 1024 * 1024):
+    """Render into a SpooledTemporaryFile (rewound) that spills to disk past ``max_memory`` bytes."""
+    out = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    write_audit_pdf(rows, out, summarize_edits)
+    out.seek(0)
+    return out
@@ -0,0 +1,224 @@
+"""Batch export of many instances into a ZIP of PDFs or one bookmarked PDF.
+
+Runs inside an export-job worker process. Instances are processed in windows of
+EXPORT_BATCH_CONCURRENCY, narrowed to the bulk scheduler slots the dispatcher
+got for the job: workbooks are filled on a process pool (the template
+is read once per fill process), converted concurrently on a dedicated
+LibreOffice pool, and each finished PDF is added to the ZIP on disk, or merged
+into a part file once a group of them is ready (see ``_MergedOutput``), so only
+one window of documents is ever held in memory while rendering.
+"""
+import json, multiprocessing, os, shutil, zipfile
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .models import Template, Instance, ExportJob
+from .blobstore import load_blob
+from .cache import get_cache, make_key
+from .converter import ConverterPool
+from .spreadsheet import fill_values, build_audit_pdf_file, merge_pdf_files
+from .exports import make_scratch, ExportError, mapped_types, load_value_rows, fill_items, main_key, audit_key, iter_audit_rows
+from .db import SessionLocal
+from .jobstate import is_cancelled
+
+class BatchCancelled(Exception):
+    pass
+
+_template_bytes: dict[str, bytes] = {}  # per fill-process cache, keyed by template file path
+
+def _fill_to_file(template_path: str, items: list[dict], out_path: str) -> str:
+    data = _template_bytes.get(template_path)
+    if data is None:
+        with open(template_path, "rb") as f:
+            data = _template_bytes[template_path] = f.read()
+    with open(out_path, "wb") as f:
+        f.write(fill_values(data, items))
+    return out_path
+
+def resolve_instance_ids(db: Session, params: dict) -> list[int]:
+    q = db.query(Instance.id)
+    if params.get("instance_ids"):
+        q = q.filter(Instance.id.in_(params["instance_ids"]))
+    if params.get("template_id") is not None:
+        q = q.filter(Instance.template_id == params["template_id"])
+    if params.get("created_from"):
+        q = q.filter(Instance.created_at >= datetime.fromisoformat(params["created_from"]))
+    if params.get("created_to"):
+        q = q.filter(Instance.created_at < datetime.fromisoformat(params["created_to"]))
+    if params.get("title_contains"):
+        q = q.filter(Instance.title.ilike(f"%{params['title_contains']}%"))
+    s = get_settings()
+    limit = s.EXPORT_BATCH_MERGED_MAX_INSTANCES if params.get("format") == "pdf" else s.EXPORT_BATCH_MAX_INSTANCES
+    return [r[0] for r in q.order_by(Instance.id).limit(limit)]
+
+class _ZipOutput:
+    def __init__(self, path: str):
+        self.zf = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+
+    def add(self, inst: Instance, pdf_path: str):
+        self.zf.write(pdf_path, arcname=f"instance-{inst.id}.pdf")
+        os.remove(pdf_path)
+
+    def close(self):
+        self.zf.close()
+
+class _MergedOutput:
+    """One PDF with a bookmark per instance, merged on disk in groups of EXPORT_BATCH_MERGE_GROUP.
+
+    pypdf reads a whole file into memory when given its path, and a writer keeps every page it was
+    handed until ``write()``. So each group of instance PDFs is merged into a part file in ``scratch``
+    and its readers and pages are dropped; ``close()`` then concatenates the parts, read through open
+    file handles that pypdf parses on demand. That last pass still holds the page objects of the whole
+    document once, which is why merged batches stop at EXPORT_BATCH_MERGED_MAX_INSTANCES.
+    """
+    def __init__(self, path: str, scratch: str, group: int):
+        self.path = path
+        self.scratch = scratch
+        self.group = max(group, 1)
+        self.pending: list[tuple[str, str]] = []  # (bookmark title, instance PDF)
+        self.parts: list[str] = []
+
+    def add(self, inst: Instance, pdf_path: str):
+        self.pending.append((f"#{inst.id} {inst.title}".strip(), pdf_path))
+        if len(self.pending) >= self.group:
+            self._flush()
+
+    def _flush(self):
+        from pypdf import PdfWriter
+        if not self.pending:
+            return
+        writer = PdfWriter()
+        for title, pdf_path in self.pending:
+            start = len(writer.pages)
+            with open(pdf_path, "rb") as f:
+                writer.append(f, import_outline=False)  # pages are copied into the writer
+            writer.add_outline_item(title, start)
+            os.remove(pdf_path)
+        part = os.path.join(self.scratch, f"merged-part-{len(self.parts)}.pdf")
+        with open(part, "wb") as f:
+            writer.write(f)
+        self.parts.append(part)
+        self.pending = []
+
+    def close(self):
+        from pypdf import PdfWriter
+        self._flush()
+        if len(self.parts) == 1:
+            shutil.move(self.parts[0], self.path)
+            return
+        writer = PdfWriter()
+        with ExitStack() as stack:
+            for part in self.parts:
+                writer.append(stack.enter_context(open(part, "rb")))
+            with open(self.path, "wb") as f:
+                writer.write(f)
+
+def run_batch(db: Session, job: ExportJob, slots: int = 1) -> tuple[str, str, list[int]]:
+    """Build the batch output; returns (filename, path, exported instance ids).
+
+    ``slots`` is the number of bulk scheduler slots held for the job; no more fill processes and
+    LibreOffice workers than that are started.
+    """
+    s = get_settings()
+    params = json.loads(job.params_json or "{}")
+    fmt = params.get("format", "zip")
+    include_audit = params.get("include_audit", True)
+    summarize = params.get("summarize_audit", False)
+    ids = resolve_instance_ids(db, params)
+    if not ids:
+        raise ExportError("No instances match the batch filter")
+    db.execute(update(ExportJob).where(ExportJob.id == job.id).values(progress_done=0, progress_total=len(ids)))
+    db.commit()
+
+    os.makedirs(s.EXPORT_RESULTS_DIR, exist_ok=True)
+    filename = f"export-{job.id}.{fmt}"
+    result_path = os.path.join(s.EXPORT_RESULTS_DIR, filename)
+    scratch = make_scratch(f"batch-{job.id}-")
+    n = max(min(s.EXPORT_BATCH_CONCURRENCY, slots), 1)
+    cache = get_cache()
+    conv = ConverterPool(size=n, name=f"batch{job.id}")
+    fills = ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context("spawn"))
+    threads = ThreadPoolExecutor(max_workers=n)
+    templates: dict[int, tuple] = {}
+    out = _ZipOutput(result_path) if fmt == "zip" else _MergedOutput(result_path, scratch, s.EXPORT_BATCH_MERGE_GROUP)
+    done = []
+
+    def template_ctx(template_id: int):
+        if template_id not in templates:
+            tpl = db.query(Template).filter(Template.id == template_id).first()
+            if not tpl:
+                raise ExportError(f"Template {template_id} not found")
+            path = os.path.join(scratch, f"template-{template_id}.xlsx")
+            with open(path, "wb") as f:
+                f.write(load_blob(tpl.file_sha256))
+            templates[template_id] = (tpl, mapped_types(db, template_id), path)
+        return templates[template_id]
+
+    def render(ctx: dict) -> str:
+        # Runs on a thread: the job session is not shared, audit rows are streamed over a private one.
+        # Every artifact stays on disk; the per-instance files are named after the instance.
+        def build_main():
+            xlsx = fills.submit(_fill_to_file, ctx["template_path"], fill_items(ctx["rows"]),
+                                os.path.join(scratch, f"instance-{ctx['id']}.xlsx")).result()
+            pdf_path = conv.convert(xlsx, scratch, "pdf")
+            os.remove(xlsx)
+            main_path = os.path.join(scratch, f"instance-{ctx['id']}-main.pdf")
+            os.replace(pdf_path, main_path)
+            return main_path
+
+        def build_audit():
+            with SessionLocal() as adb:
+                return build_audit_pdf_file(iter_audit_rows(adb, ctx["id"]),
+                                            os.path.join(scratch, f"instance-{ctx['id']}-audit.pdf"), summarize)
+
+        # private copies of cached parts, so eviction cannot pull them mid-merge
+        target = os.path.join(scratch, f"instance-{ctx['id']}.pdf")
+        main_path = os.path.join(scratch, f"instance-{ctx['id']}-main.pdf")
+        audit_path = os.path.join(scratch, f"instance-{ctx['id']}-audit.pdf")
+        if include_audit:
+            def build_merged():
+                main = cache.get_or_build_copy("main", ctx["mkey"], build_main, main_path)
+                audit = cache.get_or_build_copy("audit", ctx["akey"], build_audit, audit_path)
+                return merge_pdf_files(main, audit, target)
+            path = cache.get_or_build_copy("merged", make_key(ctx["mkey"], ctx["akey"]), build_merged, target)
+        else:
+            path = cache.get_or_build_copy("main", ctx["mkey"], build_main, target)
+        for p in (main_path, audit_path):
+            if os.path.exists(p):
+                os.remove(p)  # merged into ``target``, and in the cache if it was built this time
+        return path
+
+    try:
+        for i in range(0, len(ids), n):
+            if is_cancelled(db, job.id):
+                raise BatchCancelled()
+            window = db.query(Instance).filter(Instance.id.in_(ids[i:i + n])).order_by(Instance.id).all()
+            ctxs = []
+            for inst in window:
+                tpl, types, template_path = template_ctx(inst.template_id)
+                rows = load_value_rows(db, inst.template_id, inst.id, types)
+                ctx = {"id": inst.id, "rows": rows, "template_path": template_path, "mkey": main_key(tpl, rows)}
+                if include_audit:
+                    ctx["akey"] = audit_key(db, inst.id, summarize)
+                ctxs.append(ctx)
+            for inst, path in zip(window, threads.map(render, ctxs)):
+                out.add(inst, path)
+                done.append(inst.id)
+            db.execute(update(ExportJob).where(ExportJob.id == job.id).values(progress_done=len(done)))
+            db.commit()
+        out.close()
+    except BaseException:
+        if isinstance(out, _ZipOutput):
+            out.zf.close()
+        if os.path.exists(result_path):
+            os.remove(result_path)
+        raise
+    finally:
+        threads.shutdown()
+        fills.shutdown()
+        conv.shutdown(wipe=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+    return filename, result_path, done
@@ -0,0 +1,253 @@
+"""Content-addressed blob storage for template workbooks.
+
+Blobs are keyed by the SHA-256 of their bytes, so identical uploads share one
+object. Backends: ``db`` (a ``blobs`` table, the default since it needs no extra
+infrastructure), ``local`` (a directory tree) and ``s3`` (any S3-compatible API,
+requires boto3). Reads go through a small in-process LRU of hot blobs; large
+blobs (audit archives) are written and read as files with ``put_blob_file`` and
+``blob_file`` instead.
+"""
+import hashlib, os, shutil, tempfile, threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional
+from sqlalchemy import select, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from .config import get_settings
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class DbBlobStore:
+    def __init__(self, bind):
+        from .models import Blob
+        self.table = Blob.__table__
+        self.bind = bind
+
+    def _conn(self):
+        return self.bind.begin() if isinstance(self.bind, Engine) else nullcontext(self.bind)
+
+    def exists(self, key: str) -> bool:
+        with self._conn() as conn:
+            return conn.execute(select(self.table.c.sha256).where(self.table.c.sha256 == key)).first() is not None
+
+    def put(self, key: str, data: bytes):
+        if self.exists(key):
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute(insert(self.table).values(sha256=key, size=len(data), data=data))
+        except IntegrityError:
+            pass  # concurrent upload of the same content
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._conn() as conn:
+            row = conn.execute(select(self.table.c.data).where(self.table.c.sha256 == key)).first()
+        return row[0] if row else None
+
+    # A bytea column is read and written whole, so the file variants go through memory here.
+    def put_file(self, key: str, path: str):
+        if not self.exists(key):
+            with open(path, "rb") as f:
+                self.put(key, f.read())
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def get_file(self, key: str, path: str) -> bool:
+        data = self.get(key)
+        if data is None:
+            return False
+        with open(path, "wb") as f:
+            f.write(data)
+        return True
+
+class LocalBlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, data: bytes):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_file(self, key: str, path: str):
+        dest = self._path(key)
+        if os.path.exists(dest):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=".tmp-")
+        os.close(fd)
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+    def get_file(self, key: str, path: str) -> bool:
+        src = self.local_path(key)
+        if src is None:
+            return False
+        shutil.copyfile(src, path)
+        return True
+
+class S3BlobStore:
+    def __init__(self, bucket: str, endpoint_url: str | None = None, prefix: str = ""):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("BLOB_BACKEND=s3 requires boto3 (pip install excelflow-backend[s3])") from e
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except self.client.exceptions.ClientError:
+            return False
+
+    def put(self, key: str, data: bytes):
+        if not self.exists(key):
+            self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put_file(self, key: str, path: str):
+        if not self.exists(key):
+            self.client.upload_file(path, self.bucket, self.prefix + key)  # multipart, streamed from disk
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    def get_file(self, key: str, path: str) -> bool:
+        try:
+            self.client.download_file(self.bucket, self.prefix + key, path)
+        except self.client.exceptions.ClientError:
+            return False
+        return True
+
+class LRUBlobCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._size -= len(old)
+
+def make_store(bind=None):
+    s = get_settings()
+    if s.BLOB_BACKEND == "db":
+        if bind is None:
+            from .db import engine as bind
+        return DbBlobStore(bind)
+    if s.BLOB_BACKEND == "local":
+        return LocalBlobStore(s.BLOB_DIR)
+    if s.BLOB_BACKEND == "s3":
+        return S3BlobStore(s.S3_BUCKET, s.S3_ENDPOINT_URL, s.S3_PREFIX)
+    raise ValueError(f"Unknown BLOB_BACKEND {s.BLOB_BACKEND!r}")
+
+_store = None
+_hot = None
+_lock = threading.Lock()
+
+def get_store():
+    global _store, _hot
+    with _lock:
+        if _store is None:
+            _store = make_store()
+            _hot = LRUBlobCache(get_settings().BLOB_CACHE_MB * 1024 * 1024)
+        return _store
+
+def put_blob(data: bytes) -> str:
+    key = sha256_hex(data)
+    get_store().put(key, data)
+    return key
+
+def put_blob_file(path: str) -> tuple[str, int]:
+    """``put_blob`` for a file on disk, hashed and (except for the db backend) stored without reading it
+    into memory; returns (key, size)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            h.update(block)
+    key = h.hexdigest()
+    get_store().put_file(key, path)
+    return key, os.path.getsize(path)
+
+@contextmanager
+def blob_file(key: str) -> Iterator[str]:
+    """A local path holding blob ``key``, for readers that seek instead of taking bytes (Parquet).
+
+    The local backend hands out its own file; otherwise the blob is downloaded to a temporary file
+    in EXPORT_SCRATCH_DIR, removed on exit. Bypasses the in-process LRU.
+    """
+    store = get_store()
+    path = store.local_path(key)
+    if path is not None:
+        yield path
+        return
+    root = get_settings().EXPORT_SCRATCH_DIR
+    os.makedirs(root, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix="blob-", dir=root)
+    os.close(fd)
+    try:
+        if not store.get_file(key, tmp):
+            raise KeyError(f"blob {key} not found")
+        yield tmp
+    finally:
+        os.remove(tmp)
+
+def load_blob(key: str) -> bytes:
+    store = get_store()
+    data = _hot.get(key)
+    if data is None:
+        data = store.get(key)
+        if data is None:
+            raise KeyError(f"blob {key} not found")
+        _hot.put(key, data)
+    return data
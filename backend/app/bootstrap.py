@@ -2,20 +2,21 @@
 from sqlalchemy.orm import Session
 from .db import SessionLocal, engine
 from .models import Base, User
-from .config import settings
+from .config import get_settings
 from .security import hash_password
 
 def main():
     # Ensure metadata exists (alembic will manage real schema; this helps first run)
     Base.metadata.create_all(bind=engine)
 
+    settings = get_settings()
     db: Session = SessionLocal()
     try:
-        user = db.query(User).filter(User.email == settings.admin_email).first()
+        user = db.query(User).filter(User.email == settings.ADMIN_EMAIL).first()
         if not user:
             db.add(User(
-                email=settings.admin_email,
-                password_hash=hash_password(settings.admin_password),
+                email=settings.ADMIN_EMAIL,
+                password_hash=hash_password(settings.ADMIN_PASSWORD),
                 role="admin",
             ))
             db.commit()
@@ -0,0 +1,101 @@
+"""Set-based writes for instance values, and bulk row loading (COPY on Postgres)."""
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from .models import InstanceValue, InstanceSnapshot
+
+CHUNK_SIZE = 5000  # rows per statement, well under Postgres' 65535 bind parameter limit
+
+def _dialect_insert(db: Session):
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"upsert not supported on {name}")
+
+def upsert_instance_values(db: Session, instance_id: int, items: list[dict]) -> int:
+    """Insert or update ``{sheet_name, cell_ref, value[, num_value, date_value]}`` rows in one statement per chunk.
+
+    Duplicate cells in ``items`` collapse to the last occurrence, since ON CONFLICT may not touch a row twice.
+    """
+    rows = {}
+    for item in items:
+        cell = item["cell_ref"].upper()
+        rows[(item["sheet_name"], cell)] = {
+            "instance_id": instance_id, "sheet_name": item["sheet_name"], "cell_ref": cell, "value": item["value"],
+            "version": 1, "num_value": item.get("num_value"), "date_value": item.get("date_value"),
+        }
+    rows = list(rows.values())
+    dialect_insert = _dialect_insert(db)
+    for i in range(0, len(rows), CHUNK_SIZE):
+        stmt = dialect_insert(InstanceValue).values(rows[i:i + CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["instance_id", "sheet_name", "cell_ref"],
+            set_={"value": stmt.excluded.value, "version": InstanceValue.version + 1,
+                  "num_value": stmt.excluded.num_value, "date_value": stmt.excluded.date_value},
+        )
+        db.execute(stmt)
+    return len(rows)
+
+def write_versioned_values(db: Session, instance_id: int, items: list[dict]) -> set[tuple[str, str]]:
+    """Upsert ``{sheet_name, cell_ref, value, version, base_version}`` rows with versions assigned by the caller.
+
+    A stored row is only overwritten while its version is still ``base_version``, the one the caller's
+    edits were made against, so a flush can never replace a write that reached the table some other
+    way. Returns the (sheet_name, cell_ref) of the rows written.
+    """
+    by_step: dict[int, list[dict]] = {}  # version - base_version: a constant per statement
+    for i in items:
+        by_step.setdefault(i["version"] - i["base_version"], []).append({
+            "instance_id": instance_id, "sheet_name": i["sheet_name"], "cell_ref": i["cell_ref"].upper(), "value": i["value"],
+            "version": i["version"], "num_value": i.get("num_value"), "date_value": i.get("date_value"),
+        })
+    dialect_insert = _dialect_insert(db)
+    written = set()
+    for step, rows in by_step.items():
+        for i in range(0, len(rows), CHUNK_SIZE):
+            stmt = dialect_insert(InstanceValue).values(rows[i:i + CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["instance_id", "sheet_name", "cell_ref"],
+                set_={"value": stmt.excluded.value, "version": stmt.excluded.version,
+                      "num_value": stmt.excluded.num_value, "date_value": stmt.excluded.date_value},
+                where=InstanceValue.version == stmt.excluded.version - step,
+            ).returning(InstanceValue.sheet_name, InstanceValue.cell_ref)
+            written.update(tuple(r) for r in db.execute(stmt))
+    return written
+
+def upsert_instance_snapshot(db: Session, instance_id: int, version: int, values_json: str):
+    """Store an instance's value snapshot unless one for a newer version is already there."""
+    stmt = _dialect_insert(db)(InstanceSnapshot).values(instance_id=instance_id, version=version, values_json=values_json)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["instance_id"],
+        set_={"version": stmt.excluded.version, "values_json": stmt.excluded.values_json},
+        # a rebuild on read racing a save must not replace the save's newer snapshot
+        where=InstanceSnapshot.version <= stmt.excluded.version,
+    ))
+
+def copy_rows(db: Session, table, columns: list[str], rows) -> int:
+    """Load tuples in ``columns`` order into ``table``: COPY on Postgres, chunked executemany elsewhere.
+
+    Rows bypass ORM/Core defaults, so callers pass every column the table needs.
+    """
+    n = 0
+    if db.get_bind().dialect.name == "postgresql":
+        cols = ", ".join(columns)
+        with db.connection().connection.driver_connection.cursor() as cur:
+            with cur.copy(f"COPY {table.name} ({cols}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    n += 1
+        return n
+    chunk = []
+    for row in rows:
+        chunk.append(dict(zip(columns, row)))
+        if len(chunk) == CHUNK_SIZE:
+            db.execute(insert(table), chunk)
+            n, chunk = n + len(chunk), []
+    if chunk:
+        db.execute(insert(table), chunk)
+        n += len(chunk)
+    return n
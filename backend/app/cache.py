@@ -0,0 +1,145 @@
+"""Content-addressed cache for rendered export artifacts (spreadsheet PDF, audit appendix, merged PDF)."""
+import hashlib, os, shutil, tempfile, threading
+from typing import Callable, Optional
+from .config import get_settings
+
+def make_key(*parts) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        if not isinstance(p, bytes):
+            p = repr(p).encode()
+        h.update(len(p).to_bytes(8, "big"))
+        h.update(p)
+    return h.hexdigest()
+
+def private_copy(path: str, target: str) -> str:
+    """``path`` as ``target``: a hard link when possible, else a copy, so eviction cannot pull a cached file mid-read."""
+    if path != target:
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copyfile(path, target)
+    return target
+
+class NullBackend:
+    def path(self, key: str) -> Optional[str]:
+        return None
+
+    def put_file(self, key: str, src: str):
+        pass
+
+class DiskBackend:
+    """Files named by key under ``root``; least recently used entries are evicted above ``max_bytes``.
+
+    Recency is the file mtime, bumped on every hit, so several processes can share one directory.
+    """
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in os.scandir(root) if e.is_file())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            return None
+
+    def put_file(self, key: str, src: str):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        os.close(fd)
+        shutil.copyfile(src, tmp)
+        self._commit(tmp, key, os.path.getsize(tmp))
+
+    def _commit(self, tmp: str, key: str, size: int):
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (e for e in os.scandir(self.root) if e.is_file() and not e.name.startswith(".tmp-")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        self._size = sum(e.stat().st_size for e in entries)
+        target = self.max_bytes * 0.9
+        for e in entries:
+            if self._size <= target:
+                break
+            try:
+                size = e.stat().st_size
+                os.remove(e.path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+class ArtifactCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def _count(self, kind: str, outcome: str):
+        with self._lock:
+            c = self._counts.setdefault(kind, {"hits": 0, "misses": 0})
+            c[outcome] += 1
+
+    def get_or_build_file(self, kind: str, key: str, build: Callable[[], str]) -> str:
+        """Path of the cached artifact, or of the file ``build`` writes (which is then copied into the cache).
+
+        Built files belong to the caller's scratch space; cached paths must be opened promptly, since
+        eviction may remove them later.
+        """
+        full_key = f"{kind}-{key}"
+        path = self.backend.path(full_key)
+        if path is not None:
+            self._count(kind, "hits")
+            return path
+        self._count(kind, "misses")
+        path = build()
+        self.backend.put_file(full_key, path)
+        return path
+
+    def get_or_build_copy(self, kind: str, key: str, build: Callable[[], str], target: str) -> str:
+        """``get_or_build_file``'s artifact as the caller's own file ``target`` (see ``private_copy``).
+
+        An entry evicted between the lookup and the copy is built again rather than failing the export.
+        """
+        path = self.get_or_build_file(kind, key, build)
+        try:
+            return private_copy(path, target)
+        except FileNotFoundError:
+            self._count(kind, "misses")
+            path = build()
+            self.backend.put_file(f"{kind}-{key}", path)
+            return private_copy(path, target)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._counts.items()}
+
+def _make_backend():
+    s = get_settings()
+    if s.EXPORT_CACHE_BACKEND == "disk":
+        return DiskBackend(s.EXPORT_CACHE_DIR, s.EXPORT_CACHE_MAX_MB * 1024 * 1024)
+    if s.EXPORT_CACHE_BACKEND == "none":
+        return NullBackend()
+    raise ValueError(f"Unknown EXPORT_CACHE_BACKEND {s.EXPORT_CACHE_BACKEND!r}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> ArtifactCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ArtifactCache(_make_backend())
+        return _cache
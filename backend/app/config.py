@@ -7,6 +7,113 @@ class Settings(BaseSettings):
     ADMIN_PASSWORD: str
     CORS_ORIGINS: str
 
+    # LibreOffice conversion pool
+    SOFFICE_BIN: str = "soffice"
+    SOFFICE_WORKERS: int = 2
+    SOFFICE_MAX_JOBS: int = 200  # restart a worker after this many conversions
+    SOFFICE_JOB_TIMEOUT: int = 120  # seconds
+    SOFFICE_START_TIMEOUT: int = 60  # seconds
+    SOFFICE_PROFILE_DIR: str = "/tmp/planilhex-soffice"
+
+    # Database pools. DB_ASYNC serves the hot routes from async handlers on an asyncio engine
+    # (psycopg 3 / aiosqlite); the sync threadpool path stays the default during rollout.
+    DB_ASYNC: bool = False
+    DB_POOL_SIZE: int = 10  # per engine; the async mode opens a second engine alongside the sync one
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 10  # seconds to wait for a free connection before failing the request
+    DB_POOL_RECYCLE: int = 1800  # seconds; stay below proxy/server idle timeouts
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # Postgres statement_timeout per connection, 0 disables
+    CPU_EXECUTOR_WORKERS: int = 4  # async mode: threads for parsing, recalculation and hashing
+    BLOCKING_EXECUTOR_WORKERS: int = 16  # threads for export renders (both modes), blob reads and other blocking calls
+
+    FILL_ENGINE: str = "xml"  # xml (zip-level patcher) | openpyxl
+
+    # Background export jobs
+    EXPORT_WORKERS: int = 2  # worker processes, i.e. max concurrent export jobs per API process
+    EXPORT_MAX_ATTEMPTS: int = 3
+    EXPORT_RETRY_DELAY: int = 10  # seconds, doubled on every attempt
+    EXPORT_HEARTBEAT_INTERVAL: float = 15  # seconds between liveness updates of a running job by its worker
+    EXPORT_HEARTBEAT_TIMEOUT: int = 120  # running jobs whose worker has not reported for this long are requeued
+    EXPORT_POLL_INTERVAL: float = 1.0
+    EXPORT_BATCH_CONCURRENCY: int = 4  # fill processes and LibreOffice workers per batch job
+    EXPORT_BATCH_MAX_INSTANCES: int = 2000
+    # Merged-PDF batches: instance PDFs are merged this many at a time into part files on disk, and the
+    # final concatenation of the parts holds the whole document's page objects, hence the lower cap.
+    EXPORT_BATCH_MERGE_GROUP: int = 50
+    EXPORT_BATCH_MERGED_MAX_INSTANCES: int = 500
+    # Admission control (scheduler.py): render slots per API process shared by inline exports and jobs.
+    EXPORT_CONCURRENCY: int = 0  # 0 sizes it as min(CPU count, container memory / EXPORT_SLOT_MEMORY_MB)
+    EXPORT_SLOT_MEMORY_MB: int = 512
+    EXPORT_INTERACTIVE_RESERVED: int = 1  # slots background jobs never take, kept for inline exports
+    EXPORT_QUEUE_MAX: int = 32  # inline exports waiting for a slot; more get 429 with Retry-After
+    EXPORT_QUEUE_TIMEOUT: float = 60  # seconds an inline export waits for a slot before 429
+    EXPORT_JOBS_QUEUED_MAX: int = 500  # queued background jobs; enqueueing more gets 429
+    EXPORT_RESULTS_DIR: str = "/tmp/planilhex-exports"
+    EXPORT_RESULTS_TTL: int = 24 * 3600  # seconds a job's result file is kept; later downloads get 410
+    EXPORT_SCRATCH_DIR: str = "/tmp/planilhex-scratch"  # per-export working files, removed once the response is sent
+    # Resident memory ceiling per process for exports: new inline exports get 503 above it and running ones
+    # stop between stages. 0 disables the check; peak RSS is measured either way (planilhex_export_rss_bytes).
+    EXPORT_RSS_LIMIT_MB: int = 0
+
+    # Template uploads that need LibreOffice (.ods, .xls) and exceed this size are converted by a background
+    # job; the template is "processing" until then. 0 converts every such upload in the background.
+    TEMPLATE_BACKGROUND_BYTES: int = 2 * 1024 * 1024
+
+    # Bulk instance import (runs on the export-job workers)
+    IMPORT_DIR: str = "/tmp/planilhex-imports"  # uploaded files wait here for their job
+    IMPORT_CHUNK_ROWS: int = 1000  # rows validated and loaded per transaction
+
+    # Rendered export artifact cache
+    EXPORT_CACHE_BACKEND: str = "disk"  # disk|none
+    EXPORT_CACHE_DIR: str = "/tmp/planilhex-cache"
+    EXPORT_CACHE_MAX_MB: int = 1024
+
+    # Template blob storage
+    BLOB_BACKEND: str = "db"  # db|local|s3
+    BLOB_DIR: str = "/data/blobs"
+    BLOB_CACHE_MB: int = 128  # in-process LRU of hot blobs
+    S3_BUCKET: str = ""
+    S3_ENDPOINT_URL: str = ""  # set for MinIO or other S3-compatible stand-ins
+    S3_PREFIX: str = "templates/"
+
+    # Server-side formula recalculation on save
+    RECALC_ENABLED: bool = True
+    RECALC_CACHE_TEMPLATES: int = 16  # parsed template models kept in memory per process
+
+    # Typed values: what to do with a save whose number/date cells do not parse
+    VALUE_VALIDATION: str = "reject"  # reject (422 listing the cells) | store (keep the text, leave it untyped)
+
+    # Authenticated-principal cache
+    AUTH_CACHE_TTL: float = 60  # seconds a resolved token is trusted without hitting the users table
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Accept signed uid/role claims without a DB lookup. Deactivation then only reaches other replicas
+    # when the token expires, so leave this off unless a single API process serves the app.
+    AUTH_TRUST_CLAIMS: bool = False
+
+    # Audit trail: events are written at commit as multi-row INSERTs, or COPY on Postgres from AUDIT_COPY_MIN_ROWS.
+    # audit_events is partitioned by month on Postgres; the archive job moves months older than
+    # AUDIT_ARCHIVE_AFTER_MONTHS to Parquet files in the blob store (needs the "archive" extra).
+    AUDIT_COPY_MIN_ROWS: int = 500
+    AUDIT_BUFFER_ROWS: int = 5000  # buffered events per session before they are written ahead of the commit
+    AUDIT_PARTITIONS_AHEAD: int = 3  # monthly partitions kept created beyond the current month
+    AUDIT_ARCHIVE_AFTER_MONTHS: int = 12
+    AUDIT_ARCHIVE_ROW_GROUP: int = 50000  # rows per Parquet row group; exports decode only the groups of one instance
+
+    # Live editing over WebSocket
+    LIVE_FLUSH_INTERVAL: float = 0.5  # seconds between batched writes of a room's accepted edits
+    LIVE_MAX_VIEWERS: int = 500  # connected editors per instance and process
+    LIVE_SEND_QUEUE: int = 1000  # outbound messages buffered per viewer before it is disconnected
+
+    # Cold start: warm the DB pool, the spreadsheet/PDF libraries and the LibreOffice workers in the background
+    # after startup. /readyz answers 503 until that finished; /healthz never waits for it.
+    PREWARM: bool = False
+    PREWARM_DB_CONNECTIONS: int = 2
+
+    # Prometheus metrics and per-request timing log
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""  # when set, GET /metrics requires "Authorization: Bearer <token>"
+    METRICS_REQUEST_LOG: bool = False  # one JSON log line per request with SQL and stage timings
+
     class Config:
         env_file = ".env"
         case_sensitive = True
@@ -0,0 +1,238 @@
+"""Pool of long-lived headless LibreOffice workers used for document conversion.
+
+Each worker owns a private user profile, so concurrent conversions never fight
+over the same ~/.config/libreoffice lock. When the UNO bridge (python3-uno) is
+importable, workers are started once with a socket listener and conversions are
+sent over UNO, skipping process startup entirely. Without UNO we fall back to
+one ``soffice --convert-to`` call per job, still using the worker's profile; that
+costs a LibreOffice start per conversion, so the first pool of a process logs a
+warning and /readyz reports the mode.
+"""
+import logging, os, shutil, signal, socket, subprocess, threading, time, queue, atexit
+from . import metrics
+from .config import get_settings
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:  # LibreOffice's python bindings are optional
+    uno = None
+
+log = logging.getLogger(__name__)
+MODE = "cli" if uno is None else "uno"
+_warned = False
+
+FILTERS = {
+    "pdf": "calc_pdf_Export",
+    "xlsx": "Calc MS Excel 2007 XML",
+}
+
+class ConversionError(RuntimeError):
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason  # metrics label: timeout, exit_status, no_output, uno_error, start
+
+def _props(**kw):
+    out = []
+    for k, v in kw.items():
+        p = PropertyValue()
+        p.Name = k
+        p.Value = v
+        out.append(p)
+    return tuple(out)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _kill(proc: subprocess.Popen):
+    if proc.poll() is None:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    proc.wait()
+
+class Worker:
+    def __init__(self, index: int, settings, name: str = "main"):
+        self.index = index
+        self.settings = settings
+        self.profile = os.path.join(settings.SOFFICE_PROFILE_DIR, f"{os.getpid()}-{name}-{index}")
+        self.proc = None
+        self.port = None
+        self.jobs = 0
+        self.started = False
+        self._desktop = None
+
+    def _cmd(self) -> list[str]:
+        return [
+            self.settings.SOFFICE_BIN, f"-env:UserInstallation=file://{os.path.abspath(self.profile)}",
+            "--headless", "--invisible", "--nologo", "--nolockcheck", "--nodefault", "--norestore", "--nofirststartwizard",
+        ]
+
+    def start(self):
+        os.makedirs(self.profile, exist_ok=True)
+        self.jobs = 0
+        self.started = True
+        if uno is None:
+            return
+        self.port = _free_port()
+        self.proc = subprocess.Popen(
+            self._cmd() + [f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        deadline = time.monotonic() + self.settings.SOFFICE_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                break
+            try:
+                self._connect()
+                return
+            except Exception:
+                time.sleep(0.25)
+        self.stop(wipe=True)
+        metrics.SOFFICE_FAILURES.inc(reason="start")
+        raise ConversionError(f"LibreOffice worker {self.index} failed to start", "start")
+
+    def _connect(self):
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver", local)
+        ctx = resolver.resolve(f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+        self._desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def stop(self, wipe: bool = False):
+        self.started = False
+        self._desktop = None
+        if self.proc is not None:
+            _kill(self.proc)
+            self.proc = None
+        if wipe:
+            shutil.rmtree(self.profile, ignore_errors=True)
+
+    def healthy(self) -> bool:
+        if not self.started:
+            return False
+        if uno is None:
+            return True
+        if self.proc is None or self.proc.poll() is not None or self._desktop is None:
+            return False
+        try:
+            self._desktop.getComponents()
+            return True
+        except Exception:
+            return False
+
+    def convert(self, src: str, out_dir: str, fmt: str) -> str:
+        self.jobs += 1
+        dst = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + "." + fmt)
+        t = time.perf_counter()
+        try:
+            if uno is None:
+                self._convert_cli(src, out_dir, fmt)
+            else:
+                self._convert_uno(src, dst, fmt)
+            if not os.path.exists(dst):
+                raise ConversionError(f"LibreOffice produced no {fmt} output", "no_output")
+        except ConversionError as e:
+            metrics.SOFFICE_FAILURES.inc(reason=e.reason)
+            raise
+        finally:
+            metrics.SOFFICE_SECONDS.observe(time.perf_counter() - t, format=fmt, mode=MODE)
+        return dst
+
+    def _convert_cli(self, src: str, out_dir: str, fmt: str):
+        proc = subprocess.Popen(
+            self._cmd() + ["--convert-to", fmt, "--outdir", out_dir, src],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        try:
+            rc = proc.wait(timeout=self.settings.SOFFICE_JOB_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            _kill(proc)
+            raise ConversionError("LibreOffice conversion timed out", "timeout")
+        if rc != 0:
+            raise ConversionError(f"LibreOffice exited with status {rc}", "exit_status")
+
+    def _convert_uno(self, src: str, dst: str, fmt: str):
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self.stop()
+
+        # Killing the process makes the blocked UNO call raise, which is our only way to abort it.
+        timer = threading.Timer(self.settings.SOFFICE_JOB_TIMEOUT, on_timeout)
+        timer.start()
+        try:
+            doc = self._desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(src)), "_blank", 0, _props(Hidden=True, ReadOnly=True)
+            )
+            try:
+                if hasattr(doc, "calculateAll"):
+                    doc.calculateAll()
+                doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(dst)), _props(FilterName=FILTERS[fmt], Overwrite=True))
+            finally:
+                doc.close(True)
+        except Exception as e:
+            if timed_out.is_set():
+                raise ConversionError("LibreOffice conversion timed out", "timeout") from e
+            raise ConversionError(f"LibreOffice conversion failed: {e}", "uno_error") from e
+        finally:
+            timer.cancel()
+
+class ConverterPool:
+    def __init__(self, size: int | None = None, settings=None, name: str = "main"):
+        self.settings = settings or get_settings()
+        self.size = size or self.settings.SOFFICE_WORKERS
+        global _warned
+        if uno is None and not _warned:
+            _warned = True
+            log.warning("LibreOffice UNO bindings are not importable; every conversion starts a new soffice process")
+        self.workers = [Worker(i, self.settings, name) for i in range(self.size)]
+        self._idle: queue.Queue[Worker] = queue.Queue()
+        for w in self.workers:
+            self._idle.put(w)
+
+    def convert(self, src: str, out_dir: str, fmt: str) -> str:
+        w = self._idle.get()
+        try:
+            if w.jobs >= self.settings.SOFFICE_MAX_JOBS or not w.healthy():
+                w.stop(wipe=w.started)
+                w.start()
+            try:
+                return w.convert(src, out_dir, fmt)
+            except Exception:
+                # crash or timeout: never hand a possibly wedged process to the next job
+                w.stop(wipe=True)
+                raise
+        finally:
+            self._idle.put(w)
+
+    def warm(self):
+        for _ in range(self.size):
+            w = self._idle.get()
+            try:
+                if not w.healthy():
+                    w.start()
+            finally:
+                self._idle.put(w)
+
+    def shutdown(self, wipe: bool = False):
+        for w in self.workers:
+            w.stop(wipe=wipe)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConverterPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConverterPool()
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def convert(src: str, out_dir: str, fmt: str) -> str:
+    """Convert the file at ``src`` to ``fmt`` inside ``out_dir`` and return the output path."""
+    return get_pool().convert(src, out_dir, fmt)
@@ -1,11 +1,29 @@
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url, URL
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from . import metrics
 from .config import get_settings
 
 settings = get_settings()
 
+def _engine_options(url: URL) -> dict:
+    options = {"pool_pre_ping": True}
+    if url.get_backend_name() == "sqlite":
+        return options  # SQLite gets SQLAlchemy's own per-thread/singleton pools
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    if url.get_backend_name() == "postgresql" and settings.DB_STATEMENT_TIMEOUT_MS:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.DB_STATEMENT_TIMEOUT_MS}"}
+    return options
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+_url = make_url(settings.DATABASE_URL)
+engine = create_engine(_url, **_engine_options(_url))
+metrics.instrument_engine(engine)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 class Base(DeclarativeBase):
@@ -17,3 +35,33 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# ------------------------------------------------------------ async mode (DB_ASYNC)
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+psycopg", "sqlite": "sqlite+aiosqlite"}
+
+def async_url(url: URL) -> URL:
+    """The same database through an asyncio driver: psycopg 3 for Postgres, aiosqlite for SQLite."""
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"no async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver)
+
+_async_sessions = None
+_async_lock = threading.Lock()
+
+def get_async_sessionmaker():
+    global _async_sessions
+    with _async_lock:
+        if _async_sessions is None:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            url = async_url(_url)
+            async_engine = create_async_engine(url, **_engine_options(url))
+            metrics.instrument_engine(async_engine.sync_engine)
+            # no expiry on commit: attribute access after commit would need an implicit (sync) refresh
+            _async_sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        return _async_sessions
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,29 +1,67 @@
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from .db import get_db
-from .config import settings
-from .security import decode_token
+from .db import get_db, get_async_db, SessionLocal
+from .config import get_settings
+from .security import decode_claims
 from .models import User
+from .principals import Principal, get_principal_cache
 
 auth_scheme = HTTPBearer()
 
-def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
-    db: Session = Depends(get_db),
-) -> User:
-    token = creds.credentials
+def _claims(token: str) -> tuple[dict, dict | None]:
+    """The token's claims, and the same claims again if their uid/role may stand in for a user lookup."""
     try:
-        sub = decode_token(token, settings.jwt_secret)
+        claims = decode_claims(token, get_settings().JWT_SECRET)
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    signed = claims if get_settings().AUTH_TRUST_CLAIMS and "uid" in claims and "role" in claims else None
+    return claims, signed
 
+def _load_principal(db: Session, sub: str) -> Principal | None:
     user = db.query(User).filter(User.email == sub, User.is_active == True).first()
+    return Principal.from_user(user) if user else None
+
+def get_current_user(
+    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    db: Session = Depends(get_db),
+) -> Principal:
+    claims, signed = _claims(creds.credentials)
+    user = get_principal_cache().get(claims["sub"], claims.get("iat", 0), signed, lambda: _load_principal(db, claims["sub"]))
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
-def require_admin(user: User = Depends(get_current_user)) -> User:
+async def get_current_user_async(
+    creds: HTTPAuthorizationCredentials = Depends(auth_scheme),
+    db=Depends(get_async_db),
+) -> Principal:
+    claims, signed = _claims(creds.credentials)
+    sub = claims["sub"]
+
+    async def load():
+        user = (await db.scalars(select(User).where(User.email == sub, User.is_active == True))).first()
+        return Principal.from_user(user) if user else None
+
+    user = await get_principal_cache().aget(sub, claims.get("iat", 0), signed, load)
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
+
+def principal_for_token(token: str) -> Principal | None:
+    """Resolve a bearer token outside of a request's dependencies (WebSocket query parameter)."""
+    try:
+        claims, signed = _claims(token)
+    except HTTPException:
+        return None
+
+    def load():
+        with SessionLocal() as db:
+            return _load_principal(db, claims["sub"])
+    return get_principal_cache().get(claims["sub"], claims.get("iat", 0), signed, load)
+
+def require_admin(user: Principal = Depends(get_current_user)) -> Principal:
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
     return user
@@ -0,0 +1,34 @@
+"""Dedicated thread pools for work the async request path must keep off the event loop.
+
+``cpu`` runs parsing, recalculation and password hashing; ``blocking`` waits on
+LibreOffice, blob storage and the sync export pipeline. Keeping them apart
+means a burst of slow exports cannot starve the short CPU tasks behind it, and
+neither shares Starlette's default threadpool with the sync routes.
+"""
+import asyncio, atexit, contextvars, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+from .config import get_settings
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+def get_executor(kind: str) -> ThreadPoolExecutor:
+    with _lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            s = get_settings()
+            size = s.CPU_EXECUTOR_WORKERS if kind == "cpu" else s.BLOCKING_EXECUTOR_WORKERS
+            pool = _pools[kind] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"planilhex-{kind}")
+            atexit.register(pool.shutdown, wait=False)
+        return pool
+
+async def _run(kind: str, fn, args, kwargs):
+    # carry context variables over, so per-request metrics still see the offloaded stages
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(kind), call)
+
+async def run_cpu(fn, *args, **kwargs):
+    return await _run("cpu", fn, args, kwargs)
+
+async def run_blocking(fn, *args, **kwargs):
+    return await _run("blocking", fn, args, kwargs)
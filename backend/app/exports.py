@@ -0,0 +1,155 @@
+"""Instance -> PDF export pipeline shared by the inline route and the job workers."""
+import os, shutil, tempfile
+from typing import Iterator
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from .models import User, Template, TemplateCell, Instance, AuditEvent
+from .spreadsheet import fill_values_file, xlsx_file_to_pdf, build_audit_pdf_file, merge_pdf_files
+from .cache import get_cache, make_key
+from .blobstore import load_blob
+from .config import get_settings
+from .memory import RssWatch
+from .auditarchive import archives_for, archived_rows
+from . import auditlog, instancesnap
+
+AUDIT_EXPORT_TYPES = ("edit", "save", "export", "create")
+RENDER_VERSION = 3  # bump when rendering changes so cached artifacts are not reused
+
+class ExportError(LookupError):
+    pass
+
+def export_filename(instance_id: int) -> str:
+    return f"instance-{instance_id}.pdf"
+
+def make_scratch(prefix: str = "export-") -> str:
+    """A private directory under EXPORT_SCRATCH_DIR for one export's intermediate files."""
+    root = get_settings().EXPORT_SCRATCH_DIR
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+def render_instance_pdf_file(db: Session, instance_id: int, user_id: int, scratch: str, summarize: bool = False,
+                             watch: RssWatch | None = None) -> str:
+    """Render the filled spreadsheet plus audit appendix into ``scratch`` and stage an ``export`` audit event.
+
+    Every stage reads and writes files in ``scratch`` (or the artifact cache), so no PDF or workbook is
+    held in memory whole; returns the path of the merged PDF, inside ``scratch``. With ``watch`` the
+    memory limit is checked between stages. With ``summarize`` consecutive edits of one cell by one user
+    appear as a single audit row. The caller owns the transaction: commit to record the export, roll
+    back to discard it.
+    """
+    inst = db.query(Instance).filter(Instance.id == instance_id).first()
+    if not inst:
+        raise ExportError("Instance not found")
+
+    tpl = db.query(Template).filter(Template.id == inst.template_id).first()
+    if not tpl:
+        raise ExportError("Template not found")
+
+    check = watch.check if watch is not None else (lambda: None)
+    cache = get_cache()
+    value_rows = load_value_rows(db, tpl.id, instance_id)
+    mkey = main_key(tpl, value_rows)
+    akey = audit_key(db, instance_id, summarize)
+
+    def build_main():
+        template_path = os.path.join(scratch, "template.xlsx")
+        with open(template_path, "wb") as f:
+            f.write(load_blob(tpl.file_sha256))
+        filled = fill_values_file(template_path, fill_items(value_rows), os.path.join(scratch, "filled.xlsx"))
+        os.remove(template_path)
+        check()
+        pdf = xlsx_file_to_pdf(filled, scratch)
+        os.remove(filled)
+        return pdf
+
+    def build_audit():
+        return build_audit_pdf_file(iter_audit_rows(db, instance_id), os.path.join(scratch, "audit.pdf"), summarize)
+
+    def build_merged():
+        # private copies: the merge must not race the eviction of the cached parts
+        main = cache.get_or_build_copy("main", mkey, build_main, os.path.join(scratch, "main.pdf"))
+        check()
+        audit = cache.get_or_build_copy("audit", akey, build_audit, os.path.join(scratch, "audit.pdf"))
+        check()
+        return merge_pdf_files(main, audit, os.path.join(scratch, "merged.pdf"))
+
+    path = cache.get_or_build_copy("merged", make_key(mkey, akey), build_merged, os.path.join(scratch, "merged.pdf"))
+    check()
+
+    auditlog.record(db, instance_id=instance_id, user_id=user_id, event_type="export")
+    return path
+
+def render_instance_pdf_to(db: Session, instance_id: int, user_id: int, dest: str, summarize: bool = False) -> str:
+    """``render_instance_pdf_file`` moved to ``dest`` once complete (single export jobs); returns ``dest``."""
+    scratch = make_scratch()
+    try:
+        with RssWatch() as watch:
+            path = render_instance_pdf_file(db, instance_id, user_id, scratch, summarize, watch)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(path, dest)
+        return dest
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def mapped_types(db: Session, template_id: int) -> dict:
+    return dict(((c.sheet_name, c.cell_ref), c.data_type) for c in
+                db.query(TemplateCell).filter(TemplateCell.template_id == template_id).all())
+
+def load_value_rows(db: Session, template_id: int, instance_id: int, types: dict | None = None) -> list[tuple]:
+    """Sorted (sheet_name, cell_ref, value, data_type) rows; stable input for cache keys."""
+    if types is None:
+        types = mapped_types(db, template_id)
+    return sorted((sheet, ref, value, types.get((sheet, ref), "text"))
+                  for sheet, ref, value in instancesnap.load_rows(db, instance_id))
+
+def fill_items(value_rows: list[tuple]) -> list[dict]:
+    return [{"sheet_name": sh, "cell_ref": ref, "value": val, "data_type": dt} for sh, ref, val, dt in value_rows]
+
+def main_key(tpl: Template, value_rows: list[tuple]) -> str:
+    return make_key(RENDER_VERSION, tpl.file_sha256, value_rows)
+
+def _created_at(db: Session, instance_id: int):
+    return db.query(Instance.created_at).filter(Instance.id == instance_id).scalar()
+
+def audit_key(db: Session, instance_id: int, summarize: bool = False) -> str:
+    # The audit trail is append-only, so (last id, count) identifies its live content, and the
+    # archives it can reach identify the rest (archiving a month also changes the live count).
+    created_at = _created_at(db, instance_id)
+    hwm = db.query(func.max(AuditEvent.id), func.count(AuditEvent.id)) \
+        .filter(AuditEvent.instance_id == instance_id, AuditEvent.event_type.in_(AUDIT_EXPORT_TYPES),
+                auditlog.since(created_at)).one()
+    archived = tuple(a.id for a in archives_for(db, instance_id, created_at))
+    return make_key(RENDER_VERSION, instance_id, tuple(hwm), archived, summarize)
+
+def _row(created_at, email, event_type, sheet_name, cell_ref, old_value, new_value) -> dict:
+    return {
+        "created_at": created_at.isoformat()+"Z",
+        "user_email": email,
+        "event_type": event_type,
+        "sheet_name": sheet_name,
+        "cell_ref": cell_ref,
+        "old_value": old_value,
+        "new_value": new_value,
+    }
+
+def iter_audit_rows(db: Session, instance_id: int, batch_size: int = 1000) -> Iterator[dict]:
+    """Audit rows for the PDF appendix: archived months first, then the live table in ``batch_size`` chunks."""
+    created_at = _created_at(db, instance_id)
+    emails = {}
+    for a in archived_rows(db, instance_id, created_at):
+        if a["event_type"] not in AUDIT_EXPORT_TYPES:
+            continue
+        if a["user_id"] not in emails:
+            emails[a["user_id"]] = db.query(User.email).filter(User.id == a["user_id"]).scalar()
+        yield _row(a["created_at"], emails[a["user_id"]], a["event_type"], a["sheet_name"], a["cell_ref"],
+                   a["old_value"], a["new_value"])
+    stmt = select(
+        AuditEvent.created_at, User.email, AuditEvent.event_type, AuditEvent.sheet_name,
+        AuditEvent.cell_ref, AuditEvent.old_value, AuditEvent.new_value,
+    ).join(User, User.id == AuditEvent.user_id) \
+        .where(AuditEvent.instance_id == instance_id, AuditEvent.event_type.in_(AUDIT_EXPORT_TYPES),
+               auditlog.since(created_at)) \
+        .order_by(AuditEvent.created_at.asc(), AuditEvent.id.asc()) \
+        .execution_options(yield_per=batch_size)
+    for row in db.execute(stmt):
+        yield _row(*row)
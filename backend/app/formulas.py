@@ -0,0 +1,620 @@
+"""A small Excel formula language: tokenizer, parser and evaluator.
+
+Covers arithmetic, comparison and concatenation operators, cell and range
+references (optionally sheet-qualified, ``$`` anchors ignored) and the
+functions in ``FUNCTIONS``. Anything else (defined names, array formulas,
+volatile or unknown functions, R1C1, structured references) raises
+``Unsupported`` at parse time so the caller can leave that cell to LibreOffice.
+
+Values are ``float``, ``str``, ``bool``, ``None`` (blank) or ``ExcelError``.
+Text read as a number follows ``typed.parse_number``, like a saved number cell.
+"""
+import math, re
+from datetime import date
+from .typed import parse_number
+
+class Unsupported(Exception):
+    pass
+
+class ExcelError(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, ExcelError) and other.code == self.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return self.code
+
+DIV0, VALUE, REF, NAME, NA, NUM = (ExcelError(c) for c in ("#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#N/A", "#NUM!"))
+ERRORS = {e.code: e for e in (DIV0, VALUE, REF, NAME, NA, NUM, ExcelError("#NULL!"))}
+
+# ---------------------------------------------------------------- tokenizer
+
+_SHEET = r"(?:'(?:[^']|'')+'|[A-Za-z_][\w.]*)!"
+_CELL = r"\$?[A-Za-z]{1,3}\$?\d+"
+_TOKEN = re.compile(
+    r"(?P<ws>\s+)"
+    r'|(?P<str>"(?:[^"]|"")*")'
+    r"|(?P<err>#(?:DIV/0!|VALUE!|REF!|NAME\?|N/A|NUM!|NULL!))"
+    rf"|(?P<ref>(?:{_SHEET})?(?:{_CELL}(?::{_CELL})?|\$?[A-Za-z]{{1,3}}:\$?[A-Za-z]{{1,3}}))(?![\w(!])"
+    r"|(?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)"
+    r"|(?P<func>[A-Za-z_][\w.]*)\s*\("
+    r"|(?P<name>[A-Za-z_\\][\w.]*|\[|'[^']*'!)"
+    r"|(?P<op><>|<=|>=|[-+*/^&=<>%,()])"
+)
+_REF_PART = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d*)")
+
+def _tokens(text: str):
+    pos = 0
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if not m:
+            raise Unsupported(f"unexpected {text[pos:pos + 10]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "ws":
+            continue
+        if kind == "name":
+            word = m.group(kind).upper()
+            if word in ("TRUE", "FALSE"):
+                yield "bool", word == "TRUE"
+                continue
+            raise Unsupported(f"name {m.group(kind)!r}")
+        yield kind, m.group(kind)
+    yield "end", None
+
+def _parse_ref(text: str, sheet: str):
+    from openpyxl.utils import column_index_from_string
+    if "!" in text:
+        prefix, text = text.rsplit("!", 1)
+        sheet = prefix[1:-1].replace("''", "'") if prefix.startswith("'") else prefix
+    parts = [_REF_PART.fullmatch(p).groups() for p in text.split(":")]
+    cols = [column_index_from_string(c.upper()) for c, _ in parts]
+    if len(parts) == 1:
+        return ("ref", sheet, cols[0], int(parts[0][1]))
+    if not parts[0][1]:  # whole columns: the last row is resolved against the sheet's used range
+        return ("range", sheet, min(cols), 1, max(cols), None)
+    rows = [int(r) for _, r in parts]
+    return ("range", sheet, min(cols), min(rows), max(cols), max(rows))
+
+# ------------------------------------------------------------------- parser
+
+_INFIX = {"=": 10, "<>": 10, "<": 10, ">": 10, "<=": 10, ">=": 10, "&": 20, "+": 30, "-": 30, "*": 40, "/": 40, "^": 50}
+_PERCENT, _PREFIX = 60, 70
+
+class _Parser:
+    def __init__(self, text: str, sheet: str):
+        self.toks = list(_tokens(text))
+        self.i = 0
+        self.sheet = sheet
+
+    def peek(self):
+        return self.toks[self.i]
+
+    def take(self):
+        t = self.toks[self.i]
+        self.i += 1
+        return t
+
+    def expect(self, op: str):
+        kind, value = self.take()
+        if kind != "op" or value != op:
+            raise Unsupported(f"expected {op!r}")
+
+    def parse(self):
+        node = self.expr(0)
+        if self.peek()[0] != "end":
+            raise Unsupported("trailing input")
+        return node
+
+    def expr(self, min_bp: int):
+        left = self.atom()
+        while True:
+            kind, op = self.peek()
+            if kind != "op":
+                break
+            if op == "%":
+                if _PERCENT < min_bp:
+                    break
+                self.take()
+                left = ("pct", left)
+                continue
+            bp = _INFIX.get(op)
+            if bp is None or bp <= min_bp:
+                break
+            self.take()
+            left = ("bin", op, left, self.expr(bp))
+        return left
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == "num":
+            return ("const", float(value))
+        if kind == "str":
+            return ("const", value[1:-1].replace('""', '"'))
+        if kind == "bool":
+            return ("const", value)
+        if kind == "err":
+            return ("const", ERRORS[value])
+        if kind == "ref":
+            return _parse_ref(value, self.sheet)
+        if kind == "func":
+            name = value.upper()
+            if name.startswith("_XLFN."):
+                name = name[6:]
+            if name not in FUNCTIONS:
+                raise Unsupported(f"function {name}")
+            args = []
+            if self.peek() == ("op", ")"):
+                self.take()
+                return ("call", name, args)
+            while True:
+                if self.peek() in (("op", ","), ("op", ")")):
+                    args.append(("const", None))  # omitted argument
+                else:
+                    args.append(self.expr(0))
+                kind, value = self.take()
+                if (kind, value) == ("op", ")"):
+                    return ("call", name, args)
+                if (kind, value) != ("op", ","):
+                    raise Unsupported("bad argument list")
+        if kind == "op" and value == "(":
+            node = self.expr(0)
+            self.expect(")")
+            return node
+        if kind == "op" and value in "+-":
+            return ("neg", self.expr(_PREFIX)) if value == "-" else self.expr(_PREFIX)
+        raise Unsupported(f"unexpected {value!r}")
+
+def parse(formula: str, sheet: str):
+    """Parse ``=...`` into a tuple tree; raises ``Unsupported``."""
+    return _Parser(formula[1:] if formula.startswith("=") else formula, sheet).parse()
+
+def references(node):
+    """Yield every ("ref", ...) and ("range", ...) node in the tree."""
+    if node[0] in ("ref", "range"):
+        yield node
+    elif node[0] in ("neg", "pct"):
+        yield from references(node[1])
+    elif node[0] == "bin":
+        yield from references(node[2])
+        yield from references(node[3])
+    elif node[0] == "call":
+        for a in node[2]:
+            yield from references(a)
+
+# ---------------------------------------------------------------- coercion
+
+class Range:
+    def __init__(self, sheet: str, c1: int, r1: int, c2: int, r2: int, lookup):
+        self.sheet, self.c1, self.r1, self.c2, self.r2 = sheet, c1, r1, c2, r2
+        self.lookup = lookup
+
+    def rows(self):
+        return [[self.lookup(self.sheet, c, r) for c in range(self.c1, self.c2 + 1)] for r in range(self.r1, self.r2 + 1)]
+
+    def values(self):
+        for r in range(self.r1, self.r2 + 1):
+            for c in range(self.c1, self.c2 + 1):
+                yield self.lookup(self.sheet, c, r)
+
+def _raise_if_error(v):
+    if isinstance(v, ExcelError):
+        raise v
+    return v
+
+def _scalar(v):
+    if isinstance(v, Range):
+        if v.r1 == v.r2 and v.c1 == v.c2:
+            return v.lookup(v.sheet, v.c1, v.r1)
+        raise VALUE
+    return v
+
+def to_number(v) -> float:
+    v = _raise_if_error(_scalar(v))
+    if v is None:
+        return 0.0
+    if isinstance(v, bool):
+        return 1.0 if v else 0.0
+    if isinstance(v, (int, float)):
+        return float(v)
+    n = parse_number(v)  # the same rules as a saved number cell
+    if n is None:
+        raise VALUE
+    return n
+
+def to_text(v) -> str:
+    v = _raise_if_error(_scalar(v))
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float):
+        return str(int(v)) if v.is_integer() and abs(v) < 1e15 else format(v, ".15g")
+    return str(v)
+
+def to_bool(v) -> bool:
+    v = _raise_if_error(_scalar(v))
+    if v is None:
+        return False
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)):
+        return v != 0
+    if v.upper() in ("TRUE", "FALSE"):
+        return v.upper() == "TRUE"
+    raise VALUE
+
+def _rank(v) -> int:
+    return 2 if isinstance(v, bool) else 1 if isinstance(v, str) else 0
+
+def compare(a, b) -> int:
+    a, b = _raise_if_error(_scalar(a)), _raise_if_error(_scalar(b))
+    if a is None:
+        a = "" if isinstance(b, str) else False if isinstance(b, bool) else 0.0
+    if b is None:
+        b = "" if isinstance(a, str) else False if isinstance(a, bool) else 0.0
+    ra, rb = _rank(a), _rank(b)
+    if ra != rb:
+        return -1 if ra < rb else 1
+    if ra == 1:
+        a, b = a.casefold(), b.casefold()
+    return (a > b) - (a < b)
+
+def _numbers(args):
+    """Numbers for SUM-like functions: ranges skip text/bool/blank, direct arguments are coerced."""
+    for a in args:
+        if isinstance(a, Range):
+            for v in a.values():
+                _raise_if_error(v)
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    yield float(v)
+        elif a is not None:
+            yield to_number(a)
+
+def _excel_round(x: float, digits: int, mode: str = "half") -> float:
+    f = 10.0 ** digits
+    y = abs(x) * f
+    y = round(y, 9)  # tame float noise such as 2.675 * 100 = 267.49999999999997
+    if mode == "half":
+        y = math.floor(y + 0.5)
+    elif mode == "up":
+        y = math.ceil(y)
+    else:
+        y = math.floor(y)
+    return math.copysign(y / f, x) if y else 0.0
+
+_CRITERION = re.compile(r"^(<>|<=|>=|=|<|>)?(.*)$", re.S)
+
+def _criterion(crit):
+    crit = _raise_if_error(_scalar(crit))
+    if not isinstance(crit, str):
+        return lambda v: v is not None and not isinstance(v, ExcelError) and compare(v, crit) == 0
+    op, operand = _CRITERION.match(crit).groups()
+    op = op or "="
+    target = parse_number(operand)
+    if target is None:
+        if op in ("=", "<>") and any(ch in operand for ch in "*?"):
+            pattern = re.compile("".join(".*" if ch == "*" else "." if ch == "?" else re.escape(ch) for ch in operand), re.I | re.S)
+            hit = lambda v: isinstance(v, str) and bool(pattern.fullmatch(v))
+            return hit if op == "=" else (lambda v: not hit(v))
+        if operand == "" and op in ("=", "<>"):
+            return (lambda v: v is None or v == "") if op == "=" else (lambda v: not (v is None or v == ""))
+        target = operand
+
+    def test(v):
+        if isinstance(v, ExcelError) or v is None:
+            return op == "<>"
+        if isinstance(target, float) and not isinstance(v, (int, float)) or isinstance(v, bool):
+            return op == "<>"
+        if isinstance(target, str) and not isinstance(v, str):
+            return op == "<>"
+        c = compare(v, target)
+        return {"=": c == 0, "<>": c != 0, "<": c < 0, ">": c > 0, "<=": c <= 0, ">=": c >= 0}[op]
+    return test
+
+# ---------------------------------------------------------------- functions
+
+def _sum(*a):
+    return sum(_numbers(a))
+
+def _average(*a):
+    nums = list(_numbers(a))
+    if not nums:
+        raise DIV0
+    return sum(nums) / len(nums)
+
+def _min(*a):
+    return min(_numbers(a), default=0.0)
+
+def _max(*a):
+    return max(_numbers(a), default=0.0)
+
+def _product(*a):
+    return math.prod(_numbers(a))
+
+def _count(*a):
+    n = 0
+    for x in a:
+        if isinstance(x, Range):
+            n += sum(1 for v in x.values() if isinstance(v, (int, float)) and not isinstance(v, bool))
+        else:
+            try:
+                to_number(x)
+                n += 1
+            except ExcelError:
+                pass
+    return float(n)
+
+def _counta(*a):
+    n = 0
+    for x in a:
+        vals = x.values() if isinstance(x, Range) else [x]
+        n += sum(1 for v in vals if v is not None)
+    return float(n)
+
+def _countblank(rng):
+    if not isinstance(rng, Range):
+        raise VALUE
+    return float(sum(1 for v in rng.values() if v is None or v == ""))
+
+def _logical(args) -> list[bool]:
+    # references contribute only their numbers and booleans; direct arguments must coerce
+    out = []
+    for x in args:
+        if isinstance(x, Range):
+            out += [to_bool(v) for v in x.values() if v is not None and not isinstance(v, str)]
+        else:
+            out.append(to_bool(x))
+    if not out:
+        raise VALUE
+    return out
+
+def _and(*a):
+    return all(_logical(a))
+
+def _or(*a):
+    return any(_logical(a))
+
+def _round(x, digits=0.0, mode="half"):
+    return _excel_round(to_number(x), int(to_number(digits)), mode)
+
+def _int(x):
+    return float(math.floor(to_number(x)))
+
+def _mod(a, b):
+    a, b = to_number(a), to_number(b)
+    if b == 0:
+        raise DIV0
+    return a - b * math.floor(a / b)
+
+def _power(a, b):
+    try:
+        r = to_number(a) ** to_number(b)
+    except ZeroDivisionError:
+        raise DIV0
+    except OverflowError:
+        raise NUM
+    if isinstance(r, complex):
+        raise NUM
+    return r
+
+def _sqrt(x):
+    x = to_number(x)
+    if x < 0:
+        raise NUM
+    return math.sqrt(x)
+
+def _concat(*a):
+    return "".join(to_text(v) for x in a for v in (x.values() if isinstance(x, Range) else [x]))
+
+def _left(text, n=1.0):
+    n = int(to_number(n))
+    if n < 0:
+        raise VALUE
+    return to_text(text)[:n]
+
+def _right(text, n=1.0):
+    n = int(to_number(n))
+    if n < 0:
+        raise VALUE
+    t = to_text(text)
+    return t[len(t) - n:] if n else ""
+
+def _mid(text, start, n):
+    start, n = int(to_number(start)), int(to_number(n))
+    if start < 1 or n < 0:
+        raise VALUE
+    return to_text(text)[start - 1:start - 1 + n]
+
+def _sumif(rng, crit, sum_rng=None):
+    if not isinstance(rng, Range):
+        raise VALUE
+    test = _criterion(crit)
+    target = rng
+    if isinstance(sum_rng, Range):
+        # Excel sizes the sum range like the criteria range, anchored at its top-left cell
+        target = Range(sum_rng.sheet, sum_rng.c1, sum_rng.r1, sum_rng.c1 + rng.c2 - rng.c1, sum_rng.r1 + rng.r2 - rng.r1, sum_rng.lookup)
+    total = 0.0
+    for v, s in zip(rng.values(), target.values()):
+        if test(v) and isinstance(s, (int, float)) and not isinstance(s, bool):
+            total += s
+    return total
+
+def _countif(rng, crit):
+    if not isinstance(rng, Range):
+        raise VALUE
+    test = _criterion(crit)
+    return float(sum(1 for v in rng.values() if test(v)))
+
+def _sumproduct(*ranges):
+    arrays = [r.rows() if isinstance(r, Range) else [[r]] for r in ranges]
+    shape = (len(arrays[0]), len(arrays[0][0]))
+    if any((len(a), len(a[0])) != shape for a in arrays):
+        raise VALUE
+    total = 0.0
+    for i in range(shape[0]):
+        for j in range(shape[1]):
+            p = 1.0
+            for a in arrays:
+                v = _raise_if_error(a[i][j])
+                p *= float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else 0.0
+            total += p
+    return total
+
+def _vlookup(value, table, col, approximate=True):
+    if not isinstance(table, Range):
+        raise VALUE
+    value = _raise_if_error(_scalar(value))
+    col = int(to_number(col))
+    rows = table.rows()
+    if col < 1:
+        raise VALUE
+    if col > table.c2 - table.c1 + 1:
+        raise REF
+    if to_bool(approximate):
+        found = None
+        for row in rows:
+            if row[0] is None or _rank(row[0]) != _rank(value):
+                continue
+            if compare(row[0], value) > 0:
+                break
+            found = row
+        if found is None:
+            raise NA
+        return found[col - 1]
+    for row in rows:
+        if row[0] is not None and not isinstance(row[0], ExcelError) and compare(row[0], value) == 0:
+            return row[col - 1]
+    raise NA
+
+def _date(y, m, d):
+    y, m, d = int(to_number(y)), int(to_number(m)), int(to_number(d))
+    if y < 1900:
+        y += 1900
+    y += (m - 1) // 12
+    m = (m - 1) % 12 + 1
+    serial = (date(y, m, 1) - date(1899, 12, 30)).days + d - 1
+    if serial < 1:
+        raise NUM
+    return float(serial)
+
+def _is(kind):
+    def check(v):
+        v = _scalar(v)
+        return {"blank": v is None, "number": isinstance(v, (int, float)) and not isinstance(v, bool),
+                "text": isinstance(v, str), "error": isinstance(v, ExcelError)}[kind]
+    return check
+
+FUNCTIONS = {
+    "SUM": _sum, "AVERAGE": _average, "MIN": _min, "MAX": _max, "PRODUCT": _product,
+    "COUNT": _count, "COUNTA": _counta, "COUNTBLANK": _countblank,
+    "IF": None, "AND": _and, "OR": _or, "NOT": lambda v: not to_bool(v),
+    "ABS": lambda x: abs(to_number(x)), "ROUND": _round,
+    "ROUNDUP": lambda x, d=0.0: _round(x, d, "up"), "ROUNDDOWN": lambda x, d=0.0: _round(x, d, "down"),
+    "INT": _int, "MOD": _mod, "POWER": _power, "SQRT": _sqrt,
+    "CONCATENATE": _concat, "CONCAT": _concat, "LEN": lambda t: float(len(to_text(t))),
+    "UPPER": lambda t: to_text(t).upper(), "LOWER": lambda t: to_text(t).lower(),
+    "TRIM": lambda t: re.sub(" +", " ", to_text(t).strip(" ")),
+    "LEFT": _left, "RIGHT": _right, "MID": _mid,
+    "SUMIF": _sumif, "COUNTIF": _countif, "SUMPRODUCT": _sumproduct, "VLOOKUP": _vlookup, "DATE": _date,
+    "ISBLANK": _is("blank"), "ISNUMBER": _is("number"), "ISTEXT": _is("text"), "ISERROR": _is("error"),
+    "IFERROR": None, "TRUE": lambda: True, "FALSE": lambda: False,
+}
+_LAZY = {"IF", "IFERROR"}  # only the taken branch is evaluated, so errors in the other do not leak
+_INSPECT = {"ISBLANK", "ISNUMBER", "ISTEXT", "ISERROR"}  # an error argument is a value to look at, not a failure
+
+# ---------------------------------------------------------------- evaluator
+
+def _arith(op, a, b):
+    x, y = to_number(a), to_number(b)
+    if op == "+":
+        return x + y
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    if op == "/":
+        if y == 0:
+            raise DIV0
+        return x / y
+    return _power(x, y)
+
+_COMPARE = {"=": lambda c: c == 0, "<>": lambda c: c != 0, "<": lambda c: c < 0, ">": lambda c: c > 0,
+            "<=": lambda c: c <= 0, ">=": lambda c: c >= 0}
+
+def _argument(node, lookup, bounds):
+    # Functions see a single-cell reference as a 1x1 range, e.g. SUM(A1) ignores text in A1
+    if node[0] == "ref":
+        _, sheet, col, row = node
+        return Range(sheet, col, row, col, row, lookup)
+    return evaluate(node, lookup, bounds)
+
+def evaluate(node, lookup, bounds):
+    """Evaluate a parsed tree. ``lookup(sheet, col, row)`` returns a cell value;
+    ``bounds(sheet)`` gives the last used row, for whole-column ranges."""
+    kind = node[0]
+    if kind == "const":
+        return node[1]
+    if kind == "ref":
+        return lookup(node[1], node[2], node[3])
+    if kind == "range":
+        _, sheet, c1, r1, c2, r2 = node
+        return Range(sheet, c1, r1, c2, r2 if r2 is not None else max(bounds(sheet), r1), lookup)
+    if kind == "neg":
+        return -to_number(evaluate(node[1], lookup, bounds))
+    if kind == "pct":
+        return to_number(evaluate(node[1], lookup, bounds)) / 100
+    if kind == "bin":
+        op = node[1]
+        a, b = evaluate(node[2], lookup, bounds), evaluate(node[3], lookup, bounds)
+        if op == "&":
+            return to_text(a) + to_text(b)
+        if op in _COMPARE:
+            return _COMPARE[op](compare(a, b))
+        return _arith(op, a, b)
+    name, args = node[1], node[2]
+    if name in _LAZY:
+        if name == "IFERROR":
+            if len(args) != 2:
+                raise VALUE
+            try:
+                return _raise_if_error(_scalar(evaluate(args[0], lookup, bounds)))
+            except ExcelError:
+                return evaluate(args[1], lookup, bounds)
+        if not 1 <= len(args) <= 3:
+            raise VALUE
+        taken = to_bool(evaluate(args[0], lookup, bounds))
+        if taken:
+            return evaluate(args[1], lookup, bounds) if len(args) > 1 else True
+        return evaluate(args[2], lookup, bounds) if len(args) > 2 else False
+    if name in _INSPECT:
+        values = []
+        for a in args:
+            try:
+                values.append(_argument(a, lookup, bounds))
+            except ExcelError as e:
+                values.append(e)
+    else:
+        values = [_argument(a, lookup, bounds) for a in args]
+    try:
+        return FUNCTIONS[name](*values)
+    except TypeError:
+        raise VALUE  # wrong number of arguments
+
+def compute(node, lookup, bounds):
+    """Value of a formula cell: errors become values, a range collapses to its single cell."""
+    try:
+        v = _scalar(evaluate(node, lookup, bounds))
+    except ExcelError as e:
+        return e
+    if v is None:
+        return 0.0  # =A1 on a blank cell shows 0
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return NUM
+    return v
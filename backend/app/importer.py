@@ -0,0 +1,217 @@
+"""Bulk creation of instances from a CSV or flat XLSX file.
+
+The upload is spooled to IMPORT_DIR and imported by an ``import`` job on the
+export-job workers. The first row is a header: each column names a mapped cell
+by its label or by its reference (``B2`` or ``Sheet1!B2``); a ``title`` column,
+if present, becomes the instance title. Rows are read one at a time and
+validated against the cells' data types; every IMPORT_CHUNK_ROWS rows the
+valid ones are loaded in one transaction (instances with INSERT ... RETURNING,
+values, value snapshots and audit rows with COPY on Postgres) together with the
+job's progress, so memory stays flat whatever the file size and a retried job
+resumes after the last committed chunk. Rejected rows go to a CSV error report served with the job.
+"""
+import csv, json, os
+from datetime import datetime, date
+from itertools import islice
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from .config import get_settings
+from .models import Template, TemplateCell, Instance, InstanceValue, InstanceSnapshot, AuditEvent, ExportJob
+from .bulk import copy_rows
+from .instancesnap import snapshot_json
+from .typed import coerce_batch
+
+class BulkImportError(Exception):
+    """The file cannot be imported at all (unreadable, no usable header)."""
+
+TITLE_COLUMNS = ("title", "título", "titulo")
+VALUE_COLUMNS = ["instance_id", "sheet_name", "cell_ref", "value", "version", "num_value", "date_value"]
+AUDIT_COLUMNS = ["instance_id", "user_id", "event_type", "sheet_name", "cell_ref", "old_value", "new_value",
+                 "meta_json", "created_at"]
+
+def spool_upload(fileobj, job_id: int, filename: str) -> str:
+    """Copy the upload to disk in blocks; returns the path the job reads from."""
+    d = get_settings().IMPORT_DIR
+    os.makedirs(d, exist_ok=True)
+    ext = ".xlsx" if filename.lower().endswith((".xlsx", ".xlsm")) else ".csv"
+    path = os.path.join(d, f"import-{job_id}{ext}")
+    with open(path, "wb") as out:
+        while block := fileobj.read(1 << 20):
+            out.write(block)
+    return path
+
+def _text(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.date().isoformat() if v == datetime(v.year, v.month, v.day) else v.isoformat(sep=" ")
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+def iter_rows(path: str):
+    """Header and data rows of the file as lists of strings, read lazily."""
+    if path.endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in wb.worksheets[0].iter_rows(values_only=True):
+                yield [_text(v) for v in row]
+        finally:
+            wb.close()
+        return
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.reader(f, dialect):
+            yield [v.strip() for v in row]
+
+def count_rows(path: str) -> int:
+    """Data rows in the file (header excluded), for the progress total; one streaming pass."""
+    if path.endswith(".xlsx"):
+        from openpyxl import load_workbook
+        wb = load_workbook(path, read_only=True)
+        try:
+            return max((wb.worksheets[0].max_row or 1) - 1, 0)
+        finally:
+            wb.close()
+    return max(sum(1 for _ in iter_rows(path)) - 1, 0)
+
+def resolve_columns(header: list[str], cells: list[TemplateCell]) -> tuple[dict, int | None, list[str]]:
+    """Map header positions to mapped cells: ({position: (sheet, ref)}, title position, unknown headers)."""
+    by_label = {c.label.strip().lower(): c for c in cells if c.label.strip()}
+    by_ref = {f"{c.sheet_name}!{c.cell_ref}".lower(): c for c in cells}
+    refs: dict[str, list] = {}
+    for c in cells:
+        refs.setdefault(c.cell_ref.lower(), []).append(c)
+    columns, title, unknown = {}, None, []
+    for pos, name in enumerate(header):
+        key = name.strip().lower()
+        if not key:
+            continue
+        if key in TITLE_COLUMNS and title is None:
+            title = pos
+            continue
+        cell = by_label.get(key) or by_ref.get(key) or (refs[key][0] if len(refs.get(key, ())) == 1 else None)
+        if cell is None:
+            unknown.append(name)
+        else:
+            columns[pos] = (cell.sheet_name, cell.cell_ref)
+    return columns, title, unknown
+
+class _Report:
+    """Rejected rows as CSV, appended to across retries of the job."""
+    def __init__(self, path: str):
+        fresh = not os.path.exists(path)
+        self.path = path
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.f)
+        if fresh:
+            self.writer.writerow(["row", "column", "value", "error"])
+
+    def write(self, rows: list[tuple]):
+        self.writer.writerows(rows)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def _load_chunk(db: Session, job: ExportJob, template_id: int, rows: list[tuple]):
+    """Insert one chunk of validated rows: [(row number, title, typed values)]."""
+    now = datetime.utcnow()
+    ids = db.scalars(insert(Instance).returning(Instance.id, sort_by_parameter_order=True), [
+        {"template_id": template_id, "created_by": job.user_id, "created_at": now, "title": title, "version": 1}
+        for _, title, _ in rows
+    ]).all()
+    copy_rows(db, InstanceValue.__table__, VALUE_COLUMNS, (
+        (iid, v["sheet_name"], v["cell_ref"], v["value"], 1, v["num_value"], v["date_value"])
+        for iid, (_, _, values) in zip(ids, rows) for v in values
+    ))
+    copy_rows(db, InstanceSnapshot.__table__, ["instance_id", "version", "values_json"], (
+        (iid, 1, snapshot_json(sorted((v["sheet_name"], v["cell_ref"], v["value"]) for v in values)))
+        for iid, (_, _, values) in zip(ids, rows)
+    ))
+    def audit():
+        for iid, (row_no, _, values) in zip(ids, rows):
+            yield (iid, job.user_id, "create", "", "", "", "",
+                   json.dumps({"template_id": template_id, "import_job_id": job.id, "row": row_no}), now)
+            yield (iid, job.user_id, "save", "", "", "", "",
+                   json.dumps({"values_count": len(values), "mode": "import", "version": 1}), now)
+    copy_rows(db, AuditEvent.__table__, AUDIT_COLUMNS, audit())
+
+def run_import(db: Session, job: ExportJob, cancelled) -> tuple[str, str, dict]:
+    """Import the job's file; returns (report filename, report path, summary)."""
+    s = get_settings()
+    params = json.loads(job.params_json or "{}")
+    template_id, path = params["template_id"], params["path"]
+    if db.get(Template, template_id) is None:
+        raise BulkImportError(f"Template {template_id} not found")
+    if not os.path.exists(path):
+        raise BulkImportError("Uploaded file is no longer available")
+    cells = db.query(TemplateCell).filter(TemplateCell.template_id == template_id).all()
+    types = {(c.sheet_name, c.cell_ref): c.data_type for c in cells}
+
+    summary = json.loads(job.summary_json or "{}") or {"imported": 0, "rejected": 0, "unknown_columns": []}
+    done = job.progress_done  # rows committed by earlier attempts
+    if not job.progress_total:
+        db.execute(update(ExportJob).where(ExportJob.id == job.id).values(progress_total=count_rows(path)))
+        db.commit()
+
+    rows = iter_rows(path)
+    header = next(rows, None)
+    if not header:
+        raise BulkImportError("The file is empty")
+    columns, title_pos, unknown = resolve_columns(header, cells)
+    if not columns:
+        raise BulkImportError("No column matches a mapped cell label or reference")
+    summary["unknown_columns"] = unknown
+    positions = {cell: pos for pos, cell in columns.items()}
+
+    os.makedirs(s.EXPORT_RESULTS_DIR, exist_ok=True)
+    filename = f"import-{job.id}-errors.csv"
+    report = _Report(os.path.join(s.EXPORT_RESULTS_DIR, filename))
+    strict = s.VALUE_VALIDATION == "reject"
+    row_no = 1 + done
+    try:
+        rows = islice(rows, done, None)
+        while True:
+            if cancelled():
+                break
+            batch = list(islice(rows, s.IMPORT_CHUNK_ROWS))
+            if not batch:
+                break
+            valid, rejected = [], []
+            for raw in batch:
+                row_no += 1
+                values = [{"sheet_name": cell[0], "cell_ref": cell[1], "value": raw[pos]}
+                          for pos, cell in columns.items() if pos < len(raw) and raw[pos] != ""]
+                if not values:
+                    rejected.append((row_no, "", "", "empty row"))
+                    continue
+                values, errors = coerce_batch(values, types)
+                if errors and strict:
+                    rejected += [(row_no, header[positions[(e["sheet_name"], e["cell_ref"])]], e["value"],
+                                  f"not a valid {e['data_type']}") for e in errors]
+                    continue
+                title = raw[title_pos] if title_pos is not None and title_pos < len(raw) else ""
+                valid.append((row_no, title[:255], values))
+            if valid:
+                _load_chunk(db, job, template_id, valid)
+            done += len(batch)
+            summary["imported"] += len(valid)
+            summary["rejected"] += len({r[0] for r in rejected})
+            db.execute(update(ExportJob).where(ExportJob.id == job.id)
+                       .values(progress_done=done, summary_json=json.dumps(summary)))
+            db.commit()
+            report.write(rejected)
+    finally:
+        report.close()
+    if not cancelled():
+        os.remove(path)
+    return filename, report.path, summary
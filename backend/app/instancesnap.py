@@ -0,0 +1,61 @@
+"""One-row snapshot of an instance's values, kept next to the per-cell table.
+
+``instance_values`` stays the source of truth (reports, keyset pages, live
+conflict checks read it). Every write path also stores the instance's cells as
+one compact JSON array of ``[sheet_name, cell_ref, value]`` in
+``instance_snapshots``, tagged with the instance version it reflects, inside
+the same transaction: saves and live flushes with ``store``, imports with
+``snapshot_json`` for the rows they load. Instance reads and exports then get
+every value in one primary-key fetch instead of hydrating an ORM object per
+cell. A snapshot whose version is not the instance's (an instance saved before
+this table existed) is rebuilt from ``instance_values`` on first read.
+
+The instance version is also a cheap validator (``etag``): reads of an
+unchanged instance answer 304 without loading anything.
+"""
+import json
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .models import Instance, InstanceValue, InstanceSnapshot
+from .bulk import upsert_instance_snapshot
+
+def snapshot_json(rows) -> str:
+    return json.dumps([list(r) for r in rows], separators=(",", ":"), ensure_ascii=False)
+
+def store(db: Session, instance_id: int, version: int) -> list[tuple]:
+    """Rebuild the snapshot from ``instance_values`` as of ``version``; returns its (sheet_name, cell_ref, value) rows."""
+    rows = [tuple(r) for r in db.execute(
+        select(InstanceValue.sheet_name, InstanceValue.cell_ref, InstanceValue.value)
+        .where(InstanceValue.instance_id == instance_id)
+        .order_by(InstanceValue.sheet_name, InstanceValue.cell_ref)
+    )]
+    upsert_instance_snapshot(db, instance_id, version, snapshot_json(rows))
+    return rows
+
+def load(db: Session, inst: Instance) -> list[tuple]:
+    """(sheet_name, cell_ref, value) rows of ``inst`` at its current version, sorted by sheet and cell.
+
+    Rebuilds a missing or stale snapshot, which the caller commits.
+    """
+    snap = db.execute(select(InstanceSnapshot.version, InstanceSnapshot.values_json)
+                      .where(InstanceSnapshot.instance_id == inst.id)).first()
+    if snap is not None and snap.version == inst.version:
+        return [tuple(r) for r in json.loads(snap.values_json)]
+    return store(db, inst.id, inst.version)
+
+def load_rows(db: Session, instance_id: int) -> list[tuple]:
+    inst = db.get(Instance, instance_id)
+    return load(db, inst) if inst is not None else []
+
+def etag(inst: Instance, *parts) -> str:
+    """Quoted validator of ``inst`` at its version; ``parts`` add whatever else the representation depends on."""
+    return '"' + "-".join(str(p) for p in (inst.id, inst.version, *parts)) + '"'
+
+def not_modified(request, tag: str) -> bool:
+    return tag in request.headers.get("if-none-match", "")
+
+def headers(tag: str) -> dict:
+    return {"ETag": tag, "Cache-Control": "private, no-cache"}
+
+def items(rows) -> list[dict]:
+    return [{"sheet_name": sheet, "cell_ref": ref, "value": value} for sheet, ref, value in rows]
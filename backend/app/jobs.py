@@ -0,0 +1,396 @@
+"""DB-backed export job queue.
+
+Jobs live in the ``export_jobs`` table. A dispatcher thread in each API process
+claims queued rows (``FOR UPDATE SKIP LOCKED``, so several replicas can share
+the table) and runs them on a local process pool bounded by EXPORT_WORKERS and
+by the bulk slots of the export scheduler (see scheduler.py). A batch job holds
+one slot per document it renders at once, so it also takes up to
+EXPORT_BATCH_CONCURRENCY - 1 extra slots and runs only as wide as it got. Claims are fair:
+each user's oldest job of each kind is considered first, single exports before
+template conversions before batches and imports, and among equals the user with
+the fewest jobs running here goes first. While a job runs, its worker process
+stamps ``heartbeat_at`` every EXPORT_HEARTBEAT_INTERVAL; any replica requeues a
+running job whose heartbeat is older than EXPORT_HEARTBEAT_TIMEOUT, so long jobs
+on a live replica are left alone. New jobs are refused (``Overloaded``)
+once EXPORT_JOBS_QUEUED_MAX are waiting. The dispatcher also deletes result files
+older than EXPORT_RESULTS_TTL; downloads of those jobs then get 410.
+"""
+import json, logging, math, multiprocessing, os, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, func
+from . import auditlog, metrics
+from .config import get_settings
+from .db import SessionLocal
+from .models import ExportJob
+from .exports import render_instance_pdf_to, export_filename
+from .scheduler import get_scheduler, Overloaded
+from .jobstate import is_cancelled
+
+log = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+RESULTS_SWEEP_INTERVAL = 600  # seconds between sweeps of EXPORT_RESULTS_DIR per API process
+KIND_PRIORITY = {"single": 0, "convert": 1, "batch": 2, "import": 2, "archive": 3}
+
+def check_backlog(db):
+    """Raise ``Overloaded`` when EXPORT_JOBS_QUEUED_MAX jobs are already waiting."""
+    s = get_settings()
+    queued = db.scalar(select(func.count()).select_from(ExportJob).where(ExportJob.status == "queued"))
+    metrics.EXPORT_QUEUE_DEPTH.set(queued, queue="jobs")
+    if queued < s.EXPORT_JOBS_QUEUED_MAX:
+        return
+    recent = db.execute(
+        select(ExportJob.started_at, ExportJob.finished_at)
+        .where(ExportJob.status == "done", ExportJob.started_at.is_not(None))
+        .order_by(ExportJob.id.desc()).limit(50)
+    ).all()
+    avg = sum((f - st).total_seconds() for st, f in recent) / len(recent) if recent else 30
+    metrics.EXPORT_REJECTED.inc(reason="jobs_queue_full")
+    raise Overloaded("jobs_queue_full", min(max(math.ceil(avg * (queued - s.EXPORT_JOBS_QUEUED_MAX + 1) / s.EXPORT_WORKERS), 1), 3600))
+
+def enqueue(db, instance_id: int, user_id: int, params: dict | None = None) -> ExportJob:
+    check_backlog(db)
+    job = ExportJob(instance_id=instance_id, user_id=user_id, params_json=json.dumps(params or {}),
+                    max_attempts=get_settings().EXPORT_MAX_ATTEMPTS)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def enqueue_batch(db, user_id: int, params: dict) -> ExportJob:
+    check_backlog(db)
+    job = ExportJob(kind="batch", user_id=user_id, params_json=json.dumps(params),
+                    max_attempts=get_settings().EXPORT_MAX_ATTEMPTS)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def enqueue_import(db, user_id: int, template_id: int, fileobj, filename: str) -> ExportJob:
+    from .importer import spool_upload
+    check_backlog(db)
+    job = ExportJob(kind="import", user_id=user_id, max_attempts=get_settings().EXPORT_MAX_ATTEMPTS)
+    db.add(job)
+    db.flush()
+    job.params_json = json.dumps({"template_id": template_id, "filename": filename,
+                                  "path": spool_upload(fileobj, job.id, filename)})
+    db.commit()
+    db.refresh(job)
+    return job
+
+def enqueue_archive(db, user_id: int) -> ExportJob:
+    """Queue the audit archive job, or return the one already queued or running."""
+    job = db.scalars(select(ExportJob).where(ExportJob.kind == "archive", ExportJob.status.in_(ACTIVE_STATUSES))).first()
+    if job is not None:
+        return job
+    job = ExportJob(kind="archive", user_id=user_id, max_attempts=get_settings().EXPORT_MAX_ATTEMPTS)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def cancel(db, job: ExportJob) -> bool:
+    res = db.execute(
+        update(ExportJob)
+        .where(ExportJob.id == job.id, ExportJob.status.in_(ACTIVE_STATUSES))
+        .values(status="cancelled", finished_at=datetime.utcnow())
+    )
+    db.commit()
+    return res.rowcount > 0
+
+def _fail(db, job_id: int, error: str, stale_before: datetime | None = None):
+    """Retry or fail a running job; with ``stale_before``, only if its worker went quiet before then."""
+    job = db.get(ExportJob, job_id, with_for_update=True)
+    if job is None or job.status != "running":
+        return
+    if stale_before is not None and (job.heartbeat_at or job.started_at) >= stale_before:
+        db.commit()  # it reported since the caller looked
+        return
+    job.error = error[:2000]
+    if job.attempts < job.max_attempts:
+        delay = get_settings().EXPORT_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.status = "queued"
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+    else:
+        job.status = "failed"
+        job.finished_at = datetime.utcnow()
+        if job.kind == "convert":
+            from .uploads import set_failed
+            set_failed(db, json.loads(job.params_json)["template_id"], job.error)
+    db.commit()
+
+def _unclaim(db, job_ids: list[int]):
+    """Put claimed jobs that never reached a worker back in the queue, attempt not counted."""
+    for job in db.scalars(select(ExportJob).where(ExportJob.id.in_(job_ids), ExportJob.status == "running")):
+        job.status = "queued"
+        job.started_at = job.heartbeat_at = None
+        job.attempts -= 1
+    db.commit()
+
+def sweep_results(now: float | None = None) -> int:
+    """Delete result files older than EXPORT_RESULTS_TTL from EXPORT_RESULTS_DIR; returns how many."""
+    s = get_settings()
+    cutoff = (now or time.time()) - s.EXPORT_RESULTS_TTL
+    removed = 0
+    try:
+        entries = os.scandir(s.EXPORT_RESULTS_DIR)
+    except FileNotFoundError:
+        return 0
+    with entries:
+        for entry in entries:
+            try:
+                # running jobs keep writing to their file, so its mtime stays fresh until they finish
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # swept by another replica
+    return removed
+
+@contextmanager
+def heartbeat(job_id: int):
+    """Stamp the job's ``heartbeat_at`` every EXPORT_HEARTBEAT_INTERVAL from a thread while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(get_settings().EXPORT_HEARTBEAT_INTERVAL):
+            try:
+                with SessionLocal() as db:
+                    db.execute(update(ExportJob).where(ExportJob.id == job_id, ExportJob.status == "running")
+                               .values(heartbeat_at=datetime.utcnow()))
+                    db.commit()
+            except Exception:
+                log.exception("heartbeat of export job %s failed", job_id)
+
+    thread = threading.Thread(target=beat, name=f"export-heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def run_job(job_id: int, slots: int = 1) -> dict:
+    """Executed in a worker process; returns the metrics it recorded for the dispatcher to merge.
+
+    ``slots`` is how many bulk scheduler slots the dispatcher holds for the job: the most documents
+    it may render at once.
+    """
+    try:
+        with heartbeat(job_id):
+            _run_job(job_id, slots)
+    finally:
+        snap = metrics.REGISTRY.drain()
+    return snap
+
+def _run_job(job_id: int, slots: int):
+    with SessionLocal() as db:
+        job = db.get(ExportJob, job_id)
+        if job is None or job.status != "running":
+            return
+        try:
+            if job.kind == "batch":
+                from .batch import run_batch
+                filename, path, exported = run_batch(db, job, slots)
+                auditlog.record_many(db, [
+                    {"instance_id": i, "user_id": job.user_id, "event_type": "export", "meta_json": json.dumps({"batch_job_id": job_id})}
+                    for i in exported
+                ])
+                result = {"result_filename": filename, "result_path": path}
+            elif job.kind == "import":
+                from .importer import run_import
+                filename, path, summary = run_import(db, job, lambda: is_cancelled(db, job_id))
+                result = {"result_filename": filename, "result_path": path, "summary_json": json.dumps(summary)}
+            elif job.kind == "archive":
+                from .auditarchive import run_archive
+                result = {"summary_json": json.dumps(run_archive(db))}
+            elif job.kind == "convert":
+                from .uploads import run_conversion
+                run_conversion(db, job)
+                result = {}
+            else:
+                params = json.loads(job.params_json or "{}")
+                path = render_instance_pdf_to(db, job.instance_id, job.user_id,
+                                              os.path.join(get_settings().EXPORT_RESULTS_DIR, f"export-{job_id}.pdf"),
+                                              params.get("summarize_audit", False))
+                result = {"result_filename": export_filename(job.instance_id), "result_path": path}
+            # Conditional update: a cancel that landed while we were rendering wins.
+            res = db.execute(
+                update(ExportJob)
+                .where(ExportJob.id == job_id, ExportJob.status == "running")
+                .values(status="done", error="", finished_at=datetime.utcnow(), **result)
+            )
+            if res.rowcount:
+                db.commit()
+            else:
+                db.rollback()
+        except Exception as e:
+            db.rollback()
+            _fail(db, job_id, f"{type(e).__name__}: {e}")
+
+def _init_worker():
+    # Each worker process renders one job at a time, so a single LibreOffice worker is enough.
+    get_settings().SOFFICE_WORKERS = 1
+
+class Dispatcher:
+    def __init__(self):
+        self.settings = get_settings()
+        self.size = self.settings.EXPORT_WORKERS
+        self._executor = None
+        self._running: dict[int, object] = {}
+        self._owners: dict[int, int] = {}  # running job -> user, for fair claiming
+        self._slots: dict[int, int] = {}  # running job -> bulk scheduler slots it holds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._swept_at = 0.0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+                )
+            return self._executor
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="export-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._requeue_stale()
+                self._claim_and_submit()
+                if time.monotonic() - self._swept_at >= RESULTS_SWEEP_INTERVAL:
+                    self._swept_at = time.monotonic()
+                    sweep_results()
+            except Exception:
+                log.exception("export dispatcher tick failed; retrying")
+            self._stop.wait(self.settings.EXPORT_POLL_INTERVAL)
+
+    def _requeue_stale(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.settings.EXPORT_HEARTBEAT_TIMEOUT)
+        with SessionLocal() as db:
+            stale = db.scalars(select(ExportJob.id).where(
+                ExportJob.status == "running", func.coalesce(ExportJob.heartbeat_at, ExportJob.started_at) < cutoff)).all()
+            for job_id in stale:
+                if job_id not in self._running:
+                    _fail(db, job_id, "its worker stopped reporting", stale_before=cutoff)
+            metrics.EXPORT_QUEUE_DEPTH.set(
+                db.scalar(select(func.count()).select_from(ExportJob).where(ExportJob.status == "queued")), queue="jobs")
+
+    def _claim_and_submit(self):
+        with self._lock:
+            free = self.size - len(self._running)
+        if free <= 0:
+            return
+        scheduler = get_scheduler()
+        free = scheduler.reserve_bulk(free)
+        claimed = []
+        try:
+            if free:
+                claimed = self._claim(free)
+        finally:
+            for _ in range(free - len(claimed)):
+                scheduler.release("bulk")
+        for i, (job_id, user_id, kind) in enumerate(claimed):
+            slots = 1
+            if kind == "batch":
+                slots += scheduler.reserve_bulk(self.settings.EXPORT_BATCH_CONCURRENCY - 1)
+            pool = self._pool()
+            try:
+                fut = pool.submit(run_job, job_id, slots)
+            except Exception:
+                # BrokenProcessPool after a worker died: hand this job and the rest back to the queue
+                # with their slots, and let _pool() build a new pool on the next tick.
+                rest = [j for j, _, _ in claimed[i:]]
+                log.exception("could not submit export jobs %s; requeued", rest)
+                for _ in range(slots - 1 + len(rest)):
+                    scheduler.release("bulk")
+                with self._lock:
+                    if self._executor is pool:
+                        self._executor = None
+                pool.shutdown(wait=False, cancel_futures=True)
+                with SessionLocal() as db:
+                    _unclaim(db, rest)
+                return
+            with self._lock:
+                self._running[job_id] = fut
+                self._owners[job_id] = user_id
+                self._slots[job_id] = slots
+            fut.add_done_callback(lambda f, job_id=job_id, pool=pool: self._done(job_id, f, pool))
+
+    def _claim(self, free: int) -> list[tuple[int, int, str]]:
+        now = datetime.utcnow()
+        ready = (ExportJob.status == "queued", ExportJob.run_after <= now)
+        with self._lock:
+            running = {}
+            for user_id in self._owners.values():
+                running[user_id] = running.get(user_id, 0) + 1
+        with SessionLocal() as db:
+            heads = select(func.min(ExportJob.id)).where(*ready).group_by(ExportJob.user_id, ExportJob.kind)
+            candidates = db.scalars(
+                # *ready again: a head claimed by another replica since the subquery's snapshot is rechecked
+                # against these conditions when its lock is taken, and skipped
+                select(ExportJob).where(ExportJob.id.in_(heads), *ready).with_for_update(skip_locked=True)
+            ).all()
+            picked = []
+            while candidates and len(picked) < free:
+                job = min(candidates, key=lambda j: (KIND_PRIORITY.get(j.kind, 2), running.get(j.user_id, 0), j.id))
+                candidates.remove(job)
+                running[job.user_id] = running.get(job.user_id, 0) + 1
+                picked.append(job)
+            if len(picked) < free:  # a single user's backlog: keep the workers busy in arrival order
+                picked += db.scalars(
+                    select(ExportJob).where(*ready, ExportJob.id.not_in([j.id for j in picked] or [0]))
+                    .order_by(ExportJob.id).limit(free - len(picked)).with_for_update(skip_locked=True)
+                ).all()
+            for job in picked:
+                if job.attempts == 0:
+                    metrics.EXPORT_QUEUE_WAIT.observe((now - job.created_at).total_seconds(),
+                                                      priority="single" if job.kind == "single" else "bulk")
+                job.status = "running"
+                job.started_at = job.heartbeat_at = now
+                job.attempts += 1
+            claimed = [(j.id, j.user_id, j.kind) for j in picked]
+            db.commit()
+        return claimed
+
+    def _done(self, job_id: int, fut, pool: ProcessPoolExecutor):
+        with self._lock:
+            self._running.pop(job_id, None)
+            self._owners.pop(job_id, None)
+            slots = self._slots.pop(job_id, 1)
+        for _ in range(slots):
+            get_scheduler().release("bulk")
+        if fut.cancelled():
+            # dropped from a pool that was shut down before a worker picked it up: back to the queue now,
+            # rather than after EXPORT_HEARTBEAT_TIMEOUT
+            with SessionLocal() as db:
+                _unclaim(db, [job_id])
+            return
+        err = fut.exception()
+        if err is None:
+            metrics.REGISTRY.merge(fut.result())
+            return
+        # The worker process itself died (BrokenProcessPool etc.): shut the broken pool down and let
+        # _pool() build a new one. Every job of that pool lands here; only the first replaces it.
+        log.error("export job %s lost its worker: %s", job_id, err)
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        with SessionLocal() as db:
+            _fail(db, job_id, f"{type(err).__name__}: {err}")
+
+dispatcher = Dispatcher()
@@ -0,0 +1,7 @@
+"""Job row checks shared by the export job runner (jobs.py) and the job kinds it runs."""
+from sqlalchemy.orm import Session
+from .models import ExportJob
+
+def is_cancelled(db: Session, job_id: int) -> bool:
+    """True once the job is no longer ``running``: cancelled by its user, or retried elsewhere as lost."""
+    return db.query(ExportJob.status).filter(ExportJob.id == job_id).scalar() != "running"
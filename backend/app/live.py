@@ -0,0 +1,302 @@
+"""Live editing rooms: cell deltas over a WebSocket, coalesced into batched writes.
+
+Every instance with connected editors gets a ``Room`` in the API process. The
+room holds the instance's cells with a per-cell version; an edit names the
+version it was made against and is rejected with the current value when that
+is stale, otherwise it is applied in memory, acknowledged and fanned out to the
+other viewers at once. Every LIVE_FLUSH_INTERVAL seconds the edits accepted
+since the last flush are written in one transaction: one upsert per chunk of
+cells (last value wins), one audit row per user and cell (first old value,
+last new value) and one instance version bump, so a burst of keystrokes costs
+one write no matter how many editors are typing.
+
+Outbound messages are serialized once and queued per viewer; a viewer whose
+queue fills up is disconnected instead of slowing the room down. Rooms are
+per process: editors of one instance must reach the same API process (sticky
+routing) to see each other, while writes from elsewhere (REST saves, other
+processes) are picked up at the next flush, since they move the instance
+version past the one the room expects. A cell is only written over the version
+the room's edits were based on; an acked edit that such a write superseded is
+not stored: its audit row is dropped and its author gets a
+``conflict`` with the stored value, like an edit rejected up front.
+"""
+import asyncio, json, logging, threading
+from sqlalchemy import select, update
+from .config import get_settings
+from .db import SessionLocal
+from .models import Template, TemplateCell, Instance, InstanceValue
+from .principals import Principal
+from .bulk import write_versioned_values
+from . import auditlog, instancesnap
+from .recalc import recalculate_values
+from .typed import coerce_value
+from .executors import run_blocking, run_cpu
+
+log = logging.getLogger(__name__)
+
+class RoomClosed(Exception):
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code, self.reason = code, reason
+
+# ------------------------------------------------------------ database side (blocking executor)
+
+def _load_cells(db, instance_id: int) -> dict:
+    rows = db.execute(select(InstanceValue.sheet_name, InstanceValue.cell_ref, InstanceValue.value, InstanceValue.version)
+                      .where(InstanceValue.instance_id == instance_id))
+    return {(sheet, ref): [value, version] for sheet, ref, value, version in rows}
+
+def _load_state(instance_id: int) -> dict | None:
+    with SessionLocal() as db:
+        row = db.execute(select(Instance.version, Template.id, Template.file_sha256)
+                         .join(Template, Template.id == Instance.template_id).where(Instance.id == instance_id)).first()
+        if row is None:
+            return None
+        types = dict(((c.sheet_name, c.cell_ref), c.data_type) for c in
+                     db.scalars(select(TemplateCell).where(TemplateCell.template_id == row[1])))
+        return {"version": row[0], "template_sha": row[2], "types": types, "cells": _load_cells(db, instance_id)}
+
+def _write_batch(instance_id: int, expected_version: int, values: list[dict],
+                 audit: list[dict]) -> tuple[int, dict | None, set[tuple]]:
+    """Write one flush; returns the new instance version, the cells as stored if someone else wrote
+    meanwhile (else None), and the cells not written because a newer version was already stored."""
+    with SessionLocal() as db:
+        version = db.execute(update(Instance).where(Instance.id == instance_id)
+                             .values(version=Instance.version + 1).returning(Instance.version)).scalar()
+        if version is None:
+            db.rollback()
+            raise RoomClosed(4404, "Instance not found")
+        written = write_versioned_values(db, instance_id, values)
+        lost = {(v["sheet_name"], v["cell_ref"]) for v in values} - written
+        instancesnap.store(db, instance_id, version)
+        audit = [e for e in audit if e["event_type"] != "edit" or (e["sheet_name"], e["cell_ref"]) not in lost]
+        for event in audit:
+            if event["event_type"] == "save":
+                event["meta_json"] = json.dumps({"values_count": len(written), "mode": "live", "version": version})
+        auditlog.record_many(db, audit)
+        db.commit()
+        stale = lost or version != expected_version + 1
+        return version, (_load_cells(db, instance_id) if stale else None), lost
+
+# ------------------------------------------------------------ rooms
+
+class Viewer:
+    def __init__(self, principal: Principal, queue_size: int):
+        self.principal = principal
+        self.queue: asyncio.Queue[str] = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def send(self, message: str):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped = True  # the connection handler closes the socket
+
+class Room:
+    def __init__(self, hub: "LiveHub", instance_id: int):
+        self.hub = hub
+        self.instance_id = instance_id
+        self.viewers: set[Viewer] = set()
+        self.cells: dict[tuple, list] = {}  # (sheet_name, cell_ref) -> [value, version]
+        self.pending: dict[tuple, dict] = {}  # cells changed since the last flush
+        self.edits: dict[tuple, list] = {}  # (user_id, sheet_name, cell_ref) -> [first old value, last new value]
+        self.version = 0
+        self.ready = asyncio.ensure_future(self._load())
+        self._flusher = None
+
+    async def _load(self):
+        state = await run_blocking(_load_state, self.instance_id)
+        if state is None:
+            raise RoomClosed(4404, "Instance not found")
+        self.version, self.cells = state["version"], state["cells"]
+        self.template_sha, self.types = state["template_sha"], state["types"]
+        self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    def broadcast(self, message: dict, exclude: Viewer | None = None):
+        data = json.dumps(message, ensure_ascii=False)  # serialized once for every viewer
+        for v in self.viewers:
+            if v is not exclude:
+                v.send(data)
+
+    def presence(self) -> dict:
+        return {"type": "presence", "viewers": sorted({v.principal.email for v in self.viewers})}
+
+    def state(self) -> dict:
+        return {
+            "type": "state", "version": self.version,
+            "cells": [{"sheet_name": s, "cell_ref": r, "value": v, "version": n} for (s, r), (v, n) in sorted(self.cells.items())],
+            "viewers": self.presence()["viewers"],
+        }
+
+    def edit(self, viewer: Viewer, msg: dict) -> dict:
+        """Apply one edit from ``viewer``; returns the reply for the sender."""
+        sheet, ref = str(msg.get("sheet_name") or ""), str(msg.get("cell_ref") or "").upper()
+        value = "" if msg.get("value") is None else str(msg["value"])
+        if (sheet, ref) not in self.types:
+            return {"type": "error", "detail": "Cell is not mapped", "sheet_name": sheet, "cell_ref": ref}
+        num, date, valid = coerce_value(value, self.types[(sheet, ref)])
+        if not valid and get_settings().VALUE_VALIDATION == "reject":
+            return {"type": "error", "detail": f"Not a valid {self.types[(sheet, ref)]}", "sheet_name": sheet, "cell_ref": ref}
+        current, version = self.cells.get((sheet, ref), ["", 0])
+        if msg.get("base_version") != version:
+            self.hub.counts["conflicts"] += 1
+            return {"type": "conflict", "sheet_name": sheet, "cell_ref": ref, "value": current, "version": version}
+        # the flush only writes over the version the first of these edits was made against
+        base = self.pending[(sheet, ref)]["base_version"] if (sheet, ref) in self.pending else version
+        version += 1
+        self.cells[(sheet, ref)] = [value, version]
+        self.pending[(sheet, ref)] = {"sheet_name": sheet, "cell_ref": ref, "value": value, "version": version,
+                                      "base_version": base, "num_value": num, "date_value": date}
+        key = (viewer.principal.id, sheet, ref)
+        if key in self.edits:
+            self.edits[key][1] = value
+        else:
+            self.edits[key] = [current, value]
+        self.hub.counts["edits"] += 1
+        self.broadcast({"type": "cell", "sheet_name": sheet, "cell_ref": ref, "value": value, "version": version,
+                        "user": viewer.principal.email}, exclude=viewer)
+        return {"type": "ack", "sheet_name": sheet, "cell_ref": ref, "version": version}
+
+    async def _flush_loop(self):
+        interval = get_settings().LIVE_FLUSH_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except RoomClosed as e:
+                self.broadcast({"type": "error", "detail": e.reason})
+                self.pending.clear()
+                self.edits.clear()
+            except Exception:
+                log.exception("live flush failed for instance %s; retrying", self.instance_id)
+            if not self.viewers and not self.pending:
+                self.hub._drop(self)
+                return
+
+    async def flush(self):
+        if not self.pending:
+            return
+        values, self.pending = list(self.pending.values()), {}
+        edits, self.edits = self.edits, {}
+        audit = [{"instance_id": self.instance_id, "user_id": user_id, "event_type": "edit", "sheet_name": sheet,
+                  "cell_ref": ref, "old_value": old, "new_value": new} for (user_id, sheet, ref), (old, new) in edits.items()]
+        audit.append({"instance_id": self.instance_id, "user_id": next(iter(edits))[0], "event_type": "save"})
+        try:
+            version, stored, lost = await run_blocking(_write_batch, self.instance_id, self.version, values, audit)
+        except Exception:
+            # keep the batch for the next tick; edits accepted meanwhile are newer and win, but were
+            # made on top of this unwritten batch, so they keep its base version
+            for v in values:
+                key = (v["sheet_name"], v["cell_ref"])
+                if key in self.pending:
+                    self.pending[key]["base_version"] = v["base_version"]
+                else:
+                    self.pending[key] = v
+            for key, (old, new) in edits.items():
+                self.edits[key] = [old, self.edits[key][1]] if key in self.edits else [old, new]
+            raise
+        self.version = version
+        self.hub.counts["flushes"] += 1
+        self.hub.counts["cells_written"] += len(values) - len(lost)
+        if lost:
+            authors: dict[tuple, set[int]] = {}
+            for user_id, sheet, ref in edits:
+                if (sheet, ref) in lost:
+                    authors.setdefault((sheet, ref), set()).add(user_id)
+            self._reject_lost(authors, stored)
+        if stored is not None:
+            self._resync(stored)
+        self.broadcast({"type": "saved", "version": version})
+        changed = [(v["sheet_name"], v["cell_ref"]) for v in values if (v["sheet_name"], v["cell_ref"]) not in lost]
+        if changed and get_settings().RECALC_ENABLED:
+            await self._recalc(changed)
+
+    def _reject_lost(self, authors: dict[tuple, set[int]], stored: dict):
+        """Tell the authors of acked edits that a newer stored value superseded them, and show it to the rest."""
+        for key, users in authors.items():
+            if key in self.pending:
+                continue  # a newer edit of the cell is waiting; its own flush reports the outcome
+            value, version = stored.get(key, ["", 0])
+            self.cells[key] = [value, version]
+            self.hub.counts["conflicts"] += 1
+            message = {"sheet_name": key[0], "cell_ref": key[1], "value": value, "version": version}
+            conflict = json.dumps({"type": "conflict", **message}, ensure_ascii=False)
+            cell = json.dumps({"type": "cell", **message, "user": None}, ensure_ascii=False)
+            for v in self.viewers:
+                v.send(conflict if v.principal.id in users else cell)
+
+    def _resync(self, stored: dict):
+        """Adopt cells written outside this room, except those with edits still waiting to be flushed."""
+        for key, (value, version) in stored.items():
+            if key in self.pending or self.cells.get(key) == [value, version]:
+                continue
+            self.cells[key] = [value, version]
+            self.broadcast({"type": "cell", "sheet_name": key[0], "cell_ref": key[1], "value": value, "version": version, "user": None})
+
+    async def _recalc(self, changed: list[tuple]):
+        rows = [(s, r, v) for (s, r), (v, _) in self.cells.items()]
+        try:
+            computed = await run_cpu(recalculate_values, self.template_sha, rows, changed, self.types)
+        except Exception:
+            log.exception("recalculation failed for instance %s", self.instance_id)
+            return
+        if computed:
+            self.broadcast({"type": "computed", "cells": computed})
+
+class LiveHub:
+    def __init__(self):
+        self.rooms: dict[int, Room] = {}
+        self.counts = {"edits": 0, "conflicts": 0, "flushes": 0, "cells_written": 0, "dropped_viewers": 0}
+
+    async def join(self, instance_id: int, principal: Principal) -> tuple[Room, Viewer]:
+        s = get_settings()
+        room = self.rooms.get(instance_id)
+        if room is None:
+            room = self.rooms[instance_id] = Room(self, instance_id)
+        try:
+            await room.ready
+        except BaseException:
+            # a room that failed to load (or whose load was cancelled) is never reused
+            if self.rooms.get(instance_id) is room:
+                del self.rooms[instance_id]
+            raise
+        if len(room.viewers) >= s.LIVE_MAX_VIEWERS:
+            raise RoomClosed(1013, "Too many editors on this instance")
+        viewer = Viewer(principal, s.LIVE_SEND_QUEUE)
+        room.viewers.add(viewer)
+        viewer.send(json.dumps(room.state(), ensure_ascii=False))
+        room.broadcast(room.presence(), exclude=viewer)
+        return room, viewer
+
+    def leave(self, room: Room, viewer: Viewer):
+        room.viewers.discard(viewer)
+        if viewer.dropped:
+            self.counts["dropped_viewers"] += 1
+        room.broadcast(room.presence())
+        # the room's flush loop writes what is left and then drops it
+
+    def _drop(self, room: Room):
+        if self.rooms.get(room.instance_id) is room:
+            del self.rooms[room.instance_id]
+
+    async def flush_all(self):
+        for room in list(self.rooms.values()):
+            try:
+                await room.flush()
+            except Exception:
+                log.exception("live flush on shutdown failed for instance %s", room.instance_id)
+
+    def stats(self) -> dict:
+        return {**self.counts, "rooms": len(self.rooms), "viewers": sum(len(r.viewers) for r in self.rooms.values())}
+
+_hub = None
+_hub_lock = threading.Lock()
+
+def get_hub() -> LiveHub:
+    global _hub
+    with _hub_lock:
+        if _hub is None:
+            _hub = LiveHub()
+        return _hub
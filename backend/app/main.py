@@ -1,17 +1,95 @@
-from fastapi import FastAPI
+import time
+_import_started, _import_t0 = time.time(), time.perf_counter()
+
+import json, logging, secrets
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from .config import settings
+from fastapi.responses import PlainTextResponse, JSONResponse
+from . import metrics, startup
+from .config import get_settings
 from .routes import router
+from .jobs import dispatcher
+from .live import get_hub
 
 app = FastAPI(title="ExcelFlow MVP API")
+request_log = logging.getLogger("planilhex.requests")
 
-origins = [o.strip() for o in settings.cors_origins.split(",") if o.strip()]
+origins = [o.strip() for o in get_settings().CORS_ORIGINS.split(",") if o.strip()]
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Content-Disposition", "Content-Range", "ETag", "X-Next-Cursor"],
 )
 
+if get_settings().DB_ASYNC:
+    from .routes_async import router as async_router
+    app.include_router(async_router)  # registered first, so it wins for the paths it implements
 app.include_router(router)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    if not get_settings().METRICS_ENABLED:
+        return await call_next(request)
+    with metrics.request_scope() as acc:
+        t = time.perf_counter()
+        status, response = 500, None
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - t
+            route = request.scope.get("route")
+            # the route template keeps label cardinality bounded; unmatched paths share one label
+            path = getattr(route, "path", None) or "unmatched"
+            metrics.HTTP_SECONDS.observe(elapsed, method=request.method, route=path, status=status)
+            if (n := request.headers.get("content-length", "")).isdigit():
+                metrics.HTTP_BYTES.observe(int(n), route=path, direction="request")
+            if response is not None and (n := response.headers.get("content-length", "")).isdigit():
+                metrics.HTTP_BYTES.observe(int(n), route=path, direction="response")
+            if get_settings().METRICS_REQUEST_LOG:
+                request_log.info(json.dumps({
+                    "method": request.method, "path": request.url.path, "route": path, "status": status,
+                    "duration_ms": round(elapsed * 1000, 2), "sql_count": acc["sql_count"],
+                    "sql_ms": round(acc["sql_seconds"] * 1000, 2),
+                    "stages": {k: round(v * 1000, 2) for k, v in acc["stages"].items()},
+                }))
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    s = get_settings()
+    if not s.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not found")
+    if s.METRICS_TOKEN and not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {s.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    # liveness: the process serves requests; nothing external is checked
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    ready, body = startup.readiness()
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+startup.record_launch(_import_started)
+startup.record("import", time.perf_counter() - _import_t0)
+
+@app.on_event("startup")
+def start_export_dispatcher():
+    with startup.phase("startup"):
+        dispatcher.start()
+    startup.finish()
+
+@app.on_event("shutdown")
+def stop_export_dispatcher():
+    dispatcher.stop()
+
+@app.on_event("shutdown")
+async def flush_live_rooms():
+    await get_hub().flush_all()
@@ -0,0 +1,62 @@
+"""Resident memory of the process, watched while exports run.
+
+``RssWatch`` samples RSS on a background thread for the duration of one export
+and records its peak (and the growth over the export) in the metrics. With a
+limit set, the pipeline calls ``check()`` between stages and the export is
+abandoned with ``MemoryLimitExceeded`` once the process went over it, instead
+of pushing the container into the OOM killer; ``over_limit()`` lets the routes
+refuse to start new exports in that state.
+"""
+import os, resource, threading
+from . import metrics
+from .config import get_settings
+
+_PAGE = os.sysconf("SC_PAGE_SIZE")
+
+class MemoryLimitExceeded(RuntimeError):
+    pass
+
+def current_rss() -> int:
+    """Bytes currently resident; falls back to the lifetime peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def limit_bytes() -> int:
+    return get_settings().EXPORT_RSS_LIMIT_MB * 1024 * 1024
+
+def over_limit() -> bool:
+    limit = limit_bytes()
+    return bool(limit) and current_rss() >= limit
+
+class RssWatch:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.limit = limit_bytes()
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-watch", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def check(self):
+        self.peak = max(self.peak, current_rss())
+        if self.limit and self.peak >= self.limit:
+            metrics.EXPORT_REJECTED.inc(reason="memory_aborted")
+            raise MemoryLimitExceeded(f"export stopped at {self.peak >> 20} MiB resident (limit {self.limit >> 20} MiB)")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+        metrics.EXPORT_RSS_BYTES.observe(self.peak, measure="peak")
+        metrics.EXPORT_RSS_BYTES.observe(max(self.peak - self.start, 0), measure="growth")
+        return False
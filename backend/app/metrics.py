@@ -0,0 +1,245 @@
+"""In-process metrics with Prometheus text exposition, no client library or collector needed.
+
+Counters, gauges and histograms live in a module-level registry. Export jobs run in
+worker processes, so ``run_job`` hands its deltas back with ``drain()`` and the
+dispatcher folds them into the API process with ``merge()``; ``/metrics`` then
+covers both. Stage timings and SQL activity are also accumulated per request
+(through a context variable) for the optional structured request log.
+"""
+import bisect, functools, math, os, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES = tuple(float(4 ** i * 1024) for i in range(10))  # 1 KiB .. 256 MiB
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(l, "")) for l in self.labels)
+
+    def _fmt_labels(self, key: tuple, extra: str = "") -> str:
+        parts = [f'{l}="{_escape(v)}"' for l, v in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _merge(self, key, value):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def _lines(self, values):
+        for key, v in sorted(values.items()):
+            yield f"{self.name}{self._fmt_labels(key)} {_num(v)}"
+
+class Gauge(_Metric):
+    """A current value set by the API process (queue depths); worker processes do not report gauges."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _merge(self, key, value):
+        with self._lock:
+            self._values[key] = value
+
+    _lines = Counter._lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = SECONDS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _merge(self, key, value):
+        counts, total, n = value
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                self._values[key] = [list(counts), total, n]
+                return
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += n
+
+    def _lines(self, values):
+        for key, (counts, total, n) in sorted(values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), counts):
+                cumulative += c
+                le = 'le="+Inf"' if bound == math.inf else f'le="{_num(bound)}"'
+                yield f"{self.name}_bucket{self._fmt_labels(key, le)} {cumulative}"
+            yield f"{self.name}_sum{self._fmt_labels(key)} {_num(total)}"
+            yield f"{self.name}_count{self._fmt_labels(key)} {n}"
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    return repr(int(v)) if float(v).is_integer() else repr(float(v))
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        out = []
+        for m in self._metrics.values():
+            with m._lock:
+                values = {k: (v if m.kind != "histogram" else [list(v[0]), v[1], v[2]]) for k, v in m._values.items()}
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m._lines(values))
+        return "\n".join(out) + "\n"
+
+    def drain(self) -> dict:
+        """Take and reset every value; used by worker processes to report to the API process."""
+        snap = {}
+        for m in self._metrics.values():
+            with m._lock:
+                if m._values:
+                    snap[m.name] = m._values
+                    m._values = {}
+        return snap
+
+    def merge(self, snap: dict):
+        for name, values in snap.items():
+            m = self._metrics.get(name)
+            if m is not None:
+                for key, value in values.items():
+                    m._merge(key, value)
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labels: tuple = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: tuple = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labels))
+
+def histogram(name: str, help: str, labels: tuple = (), buckets: tuple = SECONDS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+HTTP_SECONDS = histogram("planilhex_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"))
+HTTP_BYTES = histogram("planilhex_http_body_bytes", "HTTP request and response body sizes.", ("route", "direction"), BYTES)
+STAGE_SECONDS = histogram("planilhex_stage_duration_seconds", "Export pipeline stage duration.", ("stage",))
+STAGE_FAILURES = counter("planilhex_stage_failures_total", "Export pipeline stages that raised.", ("stage",))
+PAYLOAD_BYTES = histogram("planilhex_payload_bytes", "Sizes of workbooks and PDFs moving through the pipeline.", ("kind",), BYTES)
+EXPORT_RSS_BYTES = histogram("planilhex_export_rss_bytes", "Process resident memory during exports: peak and growth over the export.",
+                             ("measure",), BYTES)
+EXPORT_REJECTED = counter("planilhex_export_rejected_total", "Exports refused or aborted to stay under the memory limit.", ("reason",))
+STARTUP_SECONDS = histogram("planilhex_startup_seconds", "Process startup time by phase (see app/startup.py).", ("phase",))
+EXPORT_QUEUE_DEPTH = gauge("planilhex_export_queue_depth", "Exports waiting for a render slot: inline waiters and queued jobs.", ("queue",))
+EXPORT_SLOTS = gauge("planilhex_export_slots_in_use", "Render slots held, by priority class.", ("priority",))
+EXPORT_QUEUE_WAIT = histogram("planilhex_export_queue_wait_seconds", "Time from arrival to a render slot.", ("priority",))
+SQL_SECONDS = histogram("planilhex_sql_query_duration_seconds", "SQL statement execution time.", ("statement",))
+SOFFICE_SECONDS = histogram("planilhex_soffice_duration_seconds", "LibreOffice conversion wall time.", ("format", "mode"))
+SOFFICE_FAILURES = counter("planilhex_soffice_failures_total", "Failed LibreOffice conversions and worker starts.", ("reason",))
+
+# ------------------------------------------------------------ per request
+
+_request: ContextVar[dict | None] = ContextVar("planilhex_request_metrics", default=None)
+
+@contextmanager
+def request_scope():
+    """Collect stage and SQL timings for the current request; yields the accumulator dict."""
+    acc = {"sql_count": 0, "sql_seconds": 0.0, "stages": {}}
+    token = _request.set(acc)
+    try:
+        yield acc
+    finally:
+        _request.reset(token)
+
+@contextmanager
+def stage(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_FAILURES.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - t
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        acc = _request.get()
+        if acc is not None:
+            acc["stages"][name] = acc["stages"].get(name, 0.0) + elapsed
+
+def timed(name: str):
+    """Decorator form of ``stage``."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def payload(kind: str, data: bytes) -> bytes:
+    """Record the size of a pipeline artifact and pass it through."""
+    PAYLOAD_BYTES.observe(len(data), kind=kind)
+    return data
+
+def payload_file(kind: str, path: str) -> str:
+    """``payload`` for an artifact on disk."""
+    PAYLOAD_BYTES.observe(os.path.getsize(path), kind=kind)
+    return path
+
+def observe_sql(statement: str, seconds: float):
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    SQL_SECONDS.observe(seconds, statement=verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER")
+    acc = _request.get()
+    if acc is not None:
+        acc["sql_count"] += 1
+        acc["sql_seconds"] += seconds
+
+def instrument_engine(engine):
+    """Time every statement executed through ``engine`` (sync Engine)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_metrics_t0")
+        if starts:
+            observe_sql(statement, time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        starts = ctx.connection.info.get("_metrics_t0") if ctx.connection is not None else None
+        if starts:
+            observe_sql(ctx.statement or "", time.perf_counter() - starts.pop())
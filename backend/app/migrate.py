@@ -0,0 +1,49 @@
+"""Schema migration step of the container start (``python -m app.migrate`` in scripts/start.sh).
+
+``alembic upgrade head`` loads the migration environment and takes its locks even
+when there is nothing to apply, which a scale-from-zero start pays every time.
+This compares the database's revision with the script heads first and only runs
+the upgrade when they differ. It then creates the coming monthly partitions of
+``audit_events`` (a catalog lookup when they exist).
+"""
+import os, time
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import Session
+from .config import get_settings
+
+def is_current(cfg: Config) -> bool:
+    heads = set(ScriptDirectory.from_config(cfg).get_heads())
+    engine = create_engine(get_settings().DATABASE_URL, poolclass=pool.NullPool)
+    try:
+        with engine.connect() as conn:
+            return set(MigrationContext.configure(conn).get_current_heads()) == heads
+    finally:
+        engine.dispose()
+
+def ensure_audit_partitions() -> list[str]:
+    from .auditlog import ensure_partitions
+    engine = create_engine(get_settings().DATABASE_URL, poolclass=pool.NullPool)
+    try:
+        with Session(engine) as db:
+            return ensure_partitions(db)
+    finally:
+        engine.dispose()
+
+def main():
+    t = time.perf_counter()
+    cfg = Config(os.environ.get("ALEMBIC_CONFIG", "alembic.ini"))
+    if is_current(cfg):
+        print(f"Schema is at head, migrations skipped ({time.perf_counter() - t:.2f}s)")
+    else:
+        command.upgrade(cfg, "head")
+        print(f"Migrations applied ({time.perf_counter() - t:.2f}s)")
+    created = ensure_audit_partitions()
+    if created:
+        print(f"Audit partitions created: {', '.join(created)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
-from sqlalchemy import String, Integer, DateTime, ForeignKey, LargeBinary, Text, Boolean, UniqueConstraint
+from sqlalchemy import String, Integer, Float, DateTime, ForeignKey, LargeBinary, Text, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
+from typing import Optional
 from .db import Base
 
 class User(Base):
@@ -18,12 +19,26 @@ class Template(Base):
     name: Mapped[str] = mapped_column(String(255))
     original_filename: Mapped[str] = mapped_column(String(255))
     mime_type: Mapped[str] = mapped_column(String(120))
-    file_bytes: Mapped[bytes] = mapped_column(LargeBinary)
+    file_sha256: Mapped[str] = mapped_column(String(64), index=True)  # key into the blob store
+    file_size: Mapped[int] = mapped_column(Integer, default=0)
+    source_sha256: Mapped[str] = mapped_column(String(64), default="", index=True)  # the file as uploaded, see uploads.py
+    status: Mapped[str] = mapped_column(String(20), default="ready", server_default="ready")  # processing|ready|failed
+    error: Mapped[str] = mapped_column(Text, default="")
+    snapshot_json: Mapped[str] = mapped_column(Text, default="", deferred=True)  # sheet snapshot index, see snapshot.py
     created_by: Mapped[int] = mapped_column(ForeignKey("users.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     mapped_cells: Mapped[list["TemplateCell"]] = relationship(back_populates="template", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_templates_created_at_id", "created_at", "id"),)
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer)
+    data: Mapped[bytes] = mapped_column(LargeBinary, deferred=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class TemplateCell(Base):
     __tablename__ = "template_cells"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -39,10 +54,13 @@ class TemplateCell(Base):
 class Instance(Base):
     __tablename__ = "instances"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    template_id: Mapped[int] = mapped_column(ForeignKey("templates.id"), index=True)
+    template_id: Mapped[int] = mapped_column(ForeignKey("templates.id"))  # indexed by ix_instances_template_created
     created_by: Mapped[int] = mapped_column(ForeignKey("users.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     title: Mapped[str] = mapped_column(String(255), default="")
+    version: Mapped[int] = mapped_column(Integer, default=0)  # bumped on every save
+
+    __table_args__ = (Index("ix_instances_template_created", "template_id", "created_at"),)
 
 class InstanceValue(Base):
     __tablename__ = "instance_values"
@@ -51,13 +69,29 @@ class InstanceValue(Base):
     sheet_name: Mapped[str] = mapped_column(String(255))
     cell_ref: Mapped[str] = mapped_column(String(20))
     value: Mapped[str] = mapped_column(Text)
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")  # bumped on every write of the cell
+    # parsed copies for cells mapped as number/date (see typed.py); NULL for text and empty cells
+    num_value: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    date_value: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("instance_id", "sheet_name", "cell_ref", name="uq_instance_value"),
+        # reports read one cell across many instances: index-only on Postgres thanks to INCLUDE
+        Index("ix_instance_values_cell", "sheet_name", "cell_ref", "instance_id",
+              postgresql_include=["num_value", "date_value"]),
+    )
 
-    __table_args__ = (UniqueConstraint("instance_id", "sheet_name", "cell_ref", name="uq_instance_value"),)
+class InstanceSnapshot(Base):
+    """All of an instance's values in one row, as of ``version`` (app/instancesnap.py)."""
+    __tablename__ = "instance_snapshots"
+    instance_id: Mapped[int] = mapped_column(ForeignKey("instances.id"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+    values_json: Mapped[str] = mapped_column(Text, default="[]")  # [[sheet_name, cell_ref, value], ...] sorted
 
 class AuditEvent(Base):
     __tablename__ = "audit_events"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    instance_id: Mapped[int] = mapped_column(ForeignKey("instances.id"), index=True)
+    instance_id: Mapped[int] = mapped_column(ForeignKey("instances.id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     event_type: Mapped[str] = mapped_column(String(50))  # edit|save|export|login
     sheet_name: Mapped[str] = mapped_column(String(255), default="")
@@ -66,3 +100,50 @@ class AuditEvent(Base):
     new_value: Mapped[str] = mapped_column(Text, default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     meta_json: Mapped[str] = mapped_column(Text, default="{}")
+
+    # Serves both "WHERE instance_id = ?" and the keyset ORDER BY (created_at, id) without a sort.
+    # On Postgres the table is partitioned by month of created_at (migration 0012, app/auditlog.py),
+    # so its primary key there is (id, created_at); ids still come from one sequence.
+    __table_args__ = (Index("ix_audit_events_instance_created_id", "instance_id", "created_at", "id"),)
+
+class AuditArchive(Base):
+    """One archived month of audit events: a Parquet file in the blob store (app/auditarchive.py)."""
+    __tablename__ = "audit_archives"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(DateTime, index=True)
+    period_end: Mapped[datetime] = mapped_column(DateTime)
+    file_sha256: Mapped[str] = mapped_column(String(64))
+    row_count: Mapped[int] = mapped_column(Integer, default=0)
+    size_bytes: Mapped[int] = mapped_column(Integer, default=0)
+    # False for archives written before audit_archive_instances existed: every export still opens them
+    instances_indexed: Mapped[bool] = mapped_column(Boolean, default=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class AuditArchiveInstance(Base):
+    """An instance with events in an archived month, so exports open only the archives that hold theirs."""
+    __tablename__ = "audit_archive_instances"
+    instance_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    archive_id: Mapped[int] = mapped_column(ForeignKey("audit_archives.id"), primary_key=True)
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(20), default="single")  # single|batch|import|convert|archive
+    instance_id: Mapped[Optional[int]] = mapped_column(ForeignKey("instances.id"), index=True, nullable=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    params_json: Mapped[str] = mapped_column(Text, default="{}")
+    progress_done: Mapped[int] = mapped_column(Integer, default=0)
+    progress_total: Mapped[int] = mapped_column(Integer, default=0)
+    status: Mapped[str] = mapped_column(String(20), default="queued", index=True)  # queued|running|done|failed|cancelled
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, default=3)
+    error: Mapped[str] = mapped_column(Text, default="")
+    result_filename: Mapped[str] = mapped_column(String(255), default="")
+    result_bytes: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    result_path: Mapped[str] = mapped_column(String(500), default="")  # job results are written to disk
+    summary_json: Mapped[str] = mapped_column(Text, default="{}")  # import jobs: imported/rejected counts
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # last liveness report of its worker
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,61 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is the sort key of the last row of the previous page, encoded as
+url-safe base64 JSON; the next page is ``WHERE (k1, k2, ...) > cursor``, so
+every page is an index range scan regardless of how deep the client is.
+"""
+import base64, json
+from datetime import datetime
+from typing import Sequence
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+class CursorError(ValueError):
+    pass
+
+def _plain(v):
+    return {"$dt": v.isoformat()} if isinstance(v, datetime) else v
+
+def _typed(v):
+    return datetime.fromisoformat(v["$dt"]) if isinstance(v, dict) else v
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([_plain(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        values = [_typed(v) for v in values]
+    except (ValueError, TypeError, KeyError) as e:
+        raise CursorError("Invalid cursor") from e
+    if len(values) != size:
+        raise CursorError("Invalid cursor")
+    return values
+
+def keyset_statement(query, columns: Sequence, cursor: str | None, limit: int, descending: bool = False):
+    """Ordering, cursor predicate and limit (one extra row) for a ``Query`` or a 2.0 ``select()``."""
+    if cursor:
+        key = tuple_(*columns)
+        after = tuple_(*decode_cursor(cursor, len(columns)))
+        query = query.filter(key < after if descending else key > after)
+    order = [c.desc() if descending else c.asc() for c in columns]
+    return query.order_by(*order).limit(limit + 1)
+
+def keyset_result(rows: list, columns: Sequence, limit: int):
+    """(rows, next_cursor or None) from the rows fetched by ``keyset_statement``."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
+
+def keyset_page(query: Query, columns: Sequence, cursor: str | None, limit: int, descending: bool = False):
+    """Apply ordering, the cursor predicate and the limit; returns (rows, next_cursor or None).
+
+    ``columns`` must make a unique sort key (end with the primary key) and rows must expose them as attributes.
+    """
+    return keyset_result(keyset_statement(query, columns, cursor, limit, descending).all(), columns, limit)
@@ -0,0 +1,128 @@
+"""In-process cache of authenticated principals.
+
+Resolving a bearer token used to cost a ``users`` query on every request. The
+resolved principal is now cached per (subject, issued-at) for AUTH_CACHE_TTL
+seconds. Changes to a ``User`` row made through the ORM invalidate that user's
+entries once they commit and, when tokens carry signed id/role claims
+(AUTH_TRUST_CLAIMS), also stop those claims from being trusted for tokens
+issued before the change. Other replicas catch up when their entries expire.
+"""
+import threading, time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from .config import get_settings
+from .models import User
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    role: str
+    is_active: bool = True
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, email=user.email, role=user.role, is_active=user.is_active)
+
+class PrincipalCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: OrderedDict[tuple, tuple[float, Principal]] = OrderedDict()
+        self._changed_at: dict[str, float] = {}  # email -> time of the last invalidation
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0, "claims": 0, "invalidations": 0}
+
+    def _lookup(self, sub: str, iat: int, claims: Optional[dict]):
+        """(cached principal or None, whether the signed claims may be trusted)."""
+        key = (sub, iat)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[0] > now:
+                self._items.move_to_end(key)
+                self._counts["hits"] += 1
+                return entry[1], False
+            trusted = claims is not None and iat >= self._changed_at.get(sub, 0)
+            self._counts["claims" if trusted else "misses"] += 1
+        return None, trusted
+
+    def _store(self, sub: str, iat: int, principal: Optional[Principal]) -> Optional[Principal]:
+        if principal is None or not principal.is_active:
+            return None  # never cache rejections: the user may be created or reactivated any moment
+        with self._lock:
+            self._items[(sub, iat)] = (time.monotonic() + self.ttl, principal)
+            self._items.move_to_end((sub, iat))
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return principal
+
+    def get(self, sub: str, iat: int, claims: Optional[dict], load: Callable[[], Optional[Principal]]) -> Optional[Principal]:
+        principal, trusted = self._lookup(sub, iat, claims)
+        if principal is not None:
+            return principal
+        return self._store(sub, iat, Principal(id=claims["uid"], email=sub, role=claims["role"]) if trusted else load())
+
+    async def aget(self, sub: str, iat: int, claims: Optional[dict], load: Callable[[], Awaitable[Optional[Principal]]]) -> Optional[Principal]:
+        """``get`` for the async request path; ``load`` is a coroutine function."""
+        principal, trusted = self._lookup(sub, iat, claims)
+        if principal is not None:
+            return principal
+        return self._store(sub, iat, Principal(id=claims["uid"], email=sub, role=claims["role"]) if trusted else await load())
+
+    def invalidate(self, email: str):
+        with self._lock:
+            # iat has one-second resolution; rounding up keeps claims of tokens issued in this second untrusted
+            self._changed_at[email] = int(time.time()) + 1
+            for key in [k for k in self._items if k[0] == email]:
+                del self._items[key]
+            self._counts["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"] + self._counts["claims"]
+            return {**self._counts, "entries": len(self._items),
+                    "hit_rate": round((self._counts["hits"] + self._counts["claims"]) / lookups, 4) if lookups else 0.0}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_principal_cache() -> PrincipalCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            s = get_settings()
+            _cache = PrincipalCache(s.AUTH_CACHE_TTL, s.AUTH_CACHE_MAX_ENTRIES)
+        return _cache
+
+def invalidate_user(email: str):
+    get_principal_cache().invalidate(email)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target: User):
+    # Flush time is too early: a request reading the still-committed row would cache it again.
+    # Remember the subjects and drop them once the change is visible to everyone.
+    emails = {target.email, *(inspect(target).attrs.email.history.deleted or ())}  # renamed: the old subject too
+    session = object_session(target)
+    if session is None:
+        for email in emails:
+            invalidate_user(email)
+        return
+    session.info.setdefault("changed_principals", set()).update(emails)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session: Session):
+    for email in session.info.pop("changed_principals", ()):
+        invalidate_user(email)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session):
+    session.info.pop("changed_principals", None)
@@ -0,0 +1,251 @@
+"""Server-side recalculation of template formulas for an instance's values.
+
+Each template is parsed once into a ``TemplateModel`` (kept in an LRU keyed by
+the template's content hash): constants, parsed formulas, a formula -> formula
+dependency graph in topological order, and the value of every formula for the
+unfilled template. A save then only evaluates the formulas downstream of the
+instance's values, in topological order, and reports those downstream of the
+cells it changed.
+
+Formulas the engine cannot parse (see ``formulas.Unsupported``), cycles and
+everything that depends on them are reported as unknown rather than guessed;
+LibreOffice stays the authority for the exported PDF.
+"""
+import bisect, io, threading
+from collections import OrderedDict, defaultdict, deque
+from datetime import date, datetime, time
+from .config import get_settings
+from .blobstore import load_blob
+from .formulas import parse, references, compute, Unsupported, ExcelError
+from .xlsxpatch import _date_serial
+from .typed import parse_number, parse_date
+
+UNKNOWN = object()
+
+class _Unknown(Exception):
+    pass
+
+def _constant(v):
+    from openpyxl.utils.datetime import to_excel
+    if isinstance(v, bool) or isinstance(v, str):
+        return v
+    if isinstance(v, (int, float)):
+        return float(v)
+    if isinstance(v, (datetime, date, time)):
+        return float(to_excel(v))
+    return UNKNOWN
+
+class TemplateModel:
+    def __init__(self, xlsx_bytes: bytes):
+        from openpyxl import load_workbook
+        from openpyxl.utils.datetime import CALENDAR_MAC_1904
+        wb = load_workbook(io.BytesIO(xlsx_bytes), read_only=True)
+        self.date1904 = wb.epoch == CALENDAR_MAC_1904
+        self.sheets = wb.sheetnames
+        self.active = wb.active.title if wb.active is not None else self.sheets[0]
+        self.constants: dict[tuple, object] = {}
+        self.formulas: dict[tuple, tuple] = {}
+        self.unsupported: set[tuple] = set()
+        self.max_row: dict[str, int] = defaultdict(int)
+        for ws in wb.worksheets:
+            for row in ws.iter_rows():
+                for cell in row:
+                    v = cell.value
+                    if v is None:
+                        continue
+                    key = (ws.title, cell.column, cell.row)
+                    self.max_row[ws.title] = max(self.max_row[ws.title], cell.row)
+                    if isinstance(v, str) and v.startswith("=") and len(v) > 1:
+                        try:
+                            self.formulas[key] = parse(v, ws.title)
+                        except Unsupported:
+                            self.unsupported.add(key)
+                    elif (c := _constant(v)) is not UNKNOWN:
+                        self.constants[key] = c
+                    else:
+                        self.unsupported.add(key)  # array / data-table formulas
+        wb.close()
+        self._build_graph()
+        self._build_base(xlsx_bytes)
+
+    def _bounds(self, sheet: str) -> int:
+        return self.max_row.get(sheet, 0)
+
+    def _build_graph(self):
+        self.cell_dependents: dict[tuple, set] = defaultdict(set)  # any cell -> formulas naming it directly
+        self.range_dependents: dict[str, list] = defaultdict(list)  # sheet -> [(c1, r1, c2, r2, formula)]
+        by_column: dict[tuple, list] = defaultdict(list)  # (sheet, col) -> sorted rows holding formulas
+        for sheet, col, row in sorted(set(self.formulas) | self.unsupported):
+            by_column[(sheet, col)].append(row)
+        self.dependents: dict[tuple, set] = defaultdict(set)  # formula -> formulas reading it
+        for f, node in self.formulas.items():
+            for ref in references(node):
+                if ref[0] == "ref":
+                    key = ref[1:]
+                    self.cell_dependents[key].add(f)
+                    if key in self.formulas or key in self.unsupported:
+                        self.dependents[key].add(f)
+                    continue
+                _, sheet, c1, r1, c2, r2 = ref
+                r2 = r2 if r2 is not None else max(self._bounds(sheet), r1)
+                self.range_dependents[sheet].append((c1, r1, c2, r2, f))
+                for col in range(c1, c2 + 1):
+                    rows = by_column.get((sheet, col), ())
+                    for row in rows[bisect.bisect_left(rows, r1):bisect.bisect_right(rows, r2)]:
+                        self.dependents[(sheet, col, row)].add(f)
+
+        indegree = {f: 0 for f in self.formulas}
+        for src, deps in self.dependents.items():
+            for f in deps:
+                indegree[f] += src in self.formulas
+        queue = deque(f for f, n in indegree.items() if n == 0)
+        self.order: list[tuple] = []
+        while queue:
+            f = queue.popleft()
+            self.order.append(f)
+            for g in self.dependents.get(f, ()):
+                indegree[g] -= 1
+                if indegree[g] == 0:
+                    queue.append(g)
+        self.position = {f: i for i, f in enumerate(self.order)}
+        cyclic = set(self.formulas) - set(self.position)
+        # values that cannot be trusted once any input differs from the template
+        self.volatile = self._downstream(self.unsupported | cyclic) | self.unsupported | cyclic
+
+    def _build_base(self, xlsx_bytes: bytes):
+        from openpyxl import load_workbook
+        cached = {}
+        if self.unsupported:
+            # the template's cached results stand in for them until an input changes
+            wb = load_workbook(io.BytesIO(xlsx_bytes), read_only=True, data_only=True)
+            for ws in wb.worksheets:
+                for row in ws.iter_rows():
+                    for cell in row:
+                        if cell.value is not None and (key := (ws.title, cell.column, cell.row)) in self.unsupported:
+                            cached[key] = _constant(cell.value)
+            wb.close()
+        self.base: dict[tuple, object] = dict(cached)
+        for f in self.order:
+            self.base[f] = self._evaluate(f, self._lookup({}, self.base))
+
+    def _lookup(self, overrides: dict, computed: dict, volatile: frozenset | set = frozenset()):
+        constants, formulas, unsupported, base = self.constants, self.formulas, self.unsupported, self.base
+
+        def lookup(sheet, col, row):
+            key = (sheet, col, row)
+            if key in overrides:
+                return overrides[key]
+            if key in computed:
+                v = computed[key]
+            elif key in formulas or key in unsupported:
+                v = UNKNOWN if key in volatile else base.get(key, UNKNOWN)
+            else:
+                return constants.get(key)
+            if v is UNKNOWN:
+                raise _Unknown()
+            return v
+        return lookup
+
+    def _evaluate(self, f, lookup):
+        try:
+            return compute(self.formulas[f], lookup, self._bounds)
+        except (_Unknown, RecursionError):
+            return UNKNOWN
+
+    def _downstream(self, cells) -> set:
+        """Formula cells whose value may depend on any of ``cells``."""
+        seen, queue = set(), deque()
+        for key in cells:
+            hits = set(self.cell_dependents.get(key, ()))
+            hits |= self.dependents.get(key, set())
+            sheet, col, row = key
+            for c1, r1, c2, r2, f in self.range_dependents.get(sheet, ()):
+                if c1 <= col <= c2 and r1 <= row <= r2:
+                    hits.add(f)
+            for f in hits - seen:
+                seen.add(f)
+                queue.append(f)
+        while queue:
+            for g in self.dependents.get(queue.popleft(), ()):
+                if g not in seen:
+                    seen.add(g)
+                    queue.append(g)
+        return seen
+
+    def recalc(self, overrides: dict, changed) -> dict:
+        """Values (or ``UNKNOWN``) of the formulas downstream of ``changed``, given all instance ``overrides``."""
+        affected = self._downstream(changed) - set(overrides)
+        if not affected:
+            return {}
+        dirty = self._downstream(overrides) - set(overrides)
+        volatile = self.volatile if overrides else frozenset()
+        computed: dict[tuple, object] = {}
+        lookup = self._lookup(overrides, computed, volatile)
+        for f in sorted((f for f in dirty if f in self.position and f not in volatile), key=self.position.__getitem__):
+            computed[f] = self._evaluate(f, lookup)
+        return {f: computed.get(f, UNKNOWN) for f in affected}
+
+    def coerce(self, value: str, data_type: str):
+        """An instance's stored string as the cell value LibreOffice would see after filling."""
+        if value == "":
+            return None
+        if data_type == "number":
+            n = parse_number(value)
+            return n if n is not None else value
+        if data_type == "date":
+            d = parse_date(value)
+            return float(_date_serial(d, self.date1904)) if d is not None else value
+        return value
+
+    def key(self, sheet_name: str, cell_ref: str):
+        from openpyxl.utils.cell import coordinate_to_tuple
+        sheet = sheet_name if sheet_name in self.sheets else self.active  # same fallback as the fill engines
+        try:
+            row, col = coordinate_to_tuple(cell_ref.replace("$", "").upper())
+        except (ValueError, TypeError):
+            return None
+        return (sheet, col, row)
+
+_models: OrderedDict[str, TemplateModel] = OrderedDict()
+_models_lock = threading.Lock()
+
+def get_model(file_sha256: str) -> TemplateModel:
+    with _models_lock:
+        model = _models.get(file_sha256)
+        if model is not None:
+            _models.move_to_end(file_sha256)
+            return model
+    model = TemplateModel(load_blob(file_sha256))  # built outside the lock; a racing duplicate is harmless
+    with _models_lock:
+        _models[file_sha256] = model
+        while len(_models) > get_settings().RECALC_CACHE_TEMPLATES:
+            _models.popitem(last=False)
+    return model
+
+def _json_value(v):
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return int(v)
+    return v
+
+def recalculate_values(file_sha256: str, value_rows, changed: list[tuple[str, str]], types: dict) -> list[dict]:
+    """Computed formula cells affected by ``changed`` (sheet_name, cell_ref) pairs, given the instance's
+    (sheet_name, cell_ref, value) rows; for the save response and live rooms."""
+    from openpyxl.utils.cell import get_column_letter
+    model = get_model(file_sha256)
+    overrides = {}
+    for sheet_name, cell_ref, value in value_rows:
+        key = model.key(sheet_name, cell_ref)
+        if key is not None:
+            overrides[key] = model.coerce(value or "", types.get((sheet_name, cell_ref), "text"))
+    changed_keys = {k for k in (model.key(s, r) for s, r in changed) if k is not None}
+    out = []
+    for (sheet, col, row), v in sorted(model.recalc(overrides, changed_keys).items()):
+        item = {"sheet_name": sheet, "cell_ref": f"{get_column_letter(col)}{row}", "value": None, "error": None}
+        if v is UNKNOWN:
+            item["error"] = "unsupported"
+        elif isinstance(v, ExcelError):
+            item["error"] = v.code
+        else:
+            item["value"] = _json_value(v)
+        out.append(item)
+    return out
@@ -1,66 +1,109 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, FileResponse
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from .db import get_db
-from .config import settings
-from .models import User, Template, TemplateCell, Instance, InstanceValue, AuditEvent
+from .db import get_db, SessionLocal
+from .config import get_settings
+from .models import User, Template, TemplateCell, Instance, InstanceValue, AuditEvent, AuditArchive, ExportJob
 from .security import verify_password, create_access_token
-from .deps import get_current_user, require_admin
+from .deps import get_current_user, require_admin, principal_for_token
+from .principals import Principal, get_principal_cache
 from .schemas import (
     LoginReq, TokenResp, MeResp,
     TemplateResp, TemplateMapReq,
     InstanceCreateReq, InstanceResp,
-    InstanceSaveReq, ExportResp
+    InstanceSaveReq, InstanceSaveResp, ExportResp, ExportJobResp, BatchExportReq,
+    AggregateReq, AggregateResp, ImportJobResp
 )
-from datetime import datetime
-import json
-from .spreadsheet import convert_to_xlsx, fill_values, xlsx_to_pdf, build_audit_pdf, merge_pdf_with_audit
+from typing import Literal, Optional
+import asyncio, json, logging, os, re, shutil
+from .snapshot import build_snapshot
+from .uploads import create_template, WorkbookError
+from .exports import render_instance_pdf_file, make_scratch, export_filename, ExportError, mapped_types
+from .memory import RssWatch, MemoryLimitExceeded, over_limit
+from .scheduler import get_scheduler, Overloaded
+from .recalc import recalculate_values
+from .cache import get_cache
+from .streaming import send_bytes, send_scratch_file, send_hex_json
+from .blobstore import load_blob
+from .bulk import upsert_instance_values
+from .typed import coerce_batch
+from .reports import aggregate
+from .pagination import keyset_page, CursorError, DEFAULT_LIMIT, MAX_LIMIT
+from . import auditlog, instancesnap, jobs, metrics
+from .live import get_hub, RoomClosed
+from .executors import run_blocking
 
 router = APIRouter()
+log = logging.getLogger(__name__)
+
+CELL_REF = re.compile(r"[A-Z]{1,3}[1-9][0-9]{0,6}")
 
 @router.post("/auth/login", response_model=TokenResp)
 def login(payload: LoginReq, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == payload.email, User.is_active == True).first()
     if not user or not verify_password(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = create_access_token(user.email, settings.jwt_secret)
+    token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
     return TokenResp(access_token=token)
 
 @router.get("/me", response_model=MeResp)
-def me(user: User = Depends(get_current_user)):
+def me(user: Principal = Depends(get_current_user)):
     return MeResp(id=user.id, email=user.email, role=user.role)
 
 @router.post("/templates", response_model=TemplateResp)
 def upload_template(
     name: str,
+    response: Response,
     file: UploadFile = File(...),
-    admin: User = Depends(require_admin),
+    admin: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
     raw = file.file.read()
-    # Convert ods->xlsx for consistent downstream handling
-    xlsx_bytes, mime = convert_to_xlsx(raw, file.filename or "template.xlsx")
-    tpl = Template(
-        name=name,
-        original_filename=(file.filename or "template.xlsx"),
-        mime_type=mime,
-        file_bytes=xlsx_bytes,
-        created_by=admin.id,
-    )
-    db.add(tpl)
-    db.commit()
-    db.refresh(tpl)
-    return TemplateResp(id=tpl.id, name=tpl.name, original_filename=tpl.original_filename)
+    # ods and other formats become xlsx for consistent downstream handling; see uploads.py
+    try:
+        tpl = create_template(db, name, file.filename or "template.xlsx", raw, admin.id)
+    except WorkbookError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if tpl.status == "processing":
+        response.status_code = 202
+    return _template_resp(tpl)
+
+def _template_resp(tpl: Template) -> TemplateResp:
+    return TemplateResp(id=tpl.id, name=tpl.name, original_filename=tpl.original_filename, status=tpl.status,
+                        error=tpl.error)
+
+def check_ready(tpl: Template):
+    if tpl.status != "ready":
+        detail = "Template is still being processed" if tpl.status == "processing" else f"Template failed to process: {tpl.error}"
+        raise HTTPException(status_code=409, detail=detail)
+
+def _get_template(db: Session, template_id: int, ready: bool = True) -> Template:
+    tpl = db.query(Template).filter(Template.id == template_id).first()
+    if not tpl:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if ready:
+        check_ready(tpl)
+    return tpl
+
+@router.get("/templates/{template_id}", response_model=TemplateResp)
+def get_template(template_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    return _template_resp(_get_template(db, template_id, ready=False))
 
 @router.post("/templates/{template_id}/map")
 def map_cells(
     template_id: int,
     payload: TemplateMapReq,
-    admin: User = Depends(require_admin),
+    admin: Principal = Depends(require_admin),
     db: Session = Depends(get_db),
 ):
-    tpl = db.query(Template).filter(Template.id == template_id).first()
-    if not tpl:
-        raise HTTPException(status_code=404, detail="Template not found")
+    tpl = _get_template(db, template_id)
+    sheets = {s["name"] for s in _snapshot_index(db, tpl)["sheets"]}
+    invalid = [{"sheet_name": c.sheet_name, "cell_ref": c.cell_ref,
+                "error": "unknown sheet" if c.sheet_name not in sheets else "invalid cell reference"}
+               for c in payload.cells if c.sheet_name not in sheets or not CELL_REF.fullmatch(c.cell_ref.upper())]
+    if invalid:
+        raise HTTPException(status_code=422, detail={"message": "Invalid mapping", "cells": invalid})
 
     # Replace mapping for simplicity
     db.query(TemplateCell).filter(TemplateCell.template_id == template_id).delete()
@@ -75,143 +118,496 @@ def map_cells(
     db.commit()
     return {"ok": True, "count": len(payload.cells)}
 
+def _page(query, columns, cursor: Optional[str], limit: int, descending: bool = False):
+    try:
+        return keyset_page(query, columns, cursor, limit, descending)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _template_item(t: Template) -> dict:
+    return {"id": t.id, "name": t.name, "original_filename": t.original_filename, "status": t.status}
+
 @router.get("/templates")
-def list_templates(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    rows = db.query(Template).order_by(Template.created_at.desc()).all()
-    return [{"id": t.id, "name": t.name, "original_filename": t.original_filename} for t in rows]
+def list_templates(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    # Stays a plain list for older clients; the next page's cursor travels in a header.
+    rows, next_cursor = _page(db.query(Template), [Template.created_at, Template.id], cursor, limit, descending=True)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_template_item(t) for t in rows]
+
+@router.get("/admin/stats")
+def admin_stats(admin: Principal = Depends(require_admin)):
+    return {"export_cache": get_cache().stats(), "auth_cache": get_principal_cache().stats(), "live": get_hub().stats(),
+            "export_scheduler": get_scheduler().stats()}
+
+@router.post("/admin/audit/archive", status_code=202)
+def archive_audit(admin: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    job = jobs.enqueue_archive(db, admin.id)
+    return {"job_id": job.id, "status": job.status}
+
+@router.get("/admin/audit/archives")
+def list_audit_archives(admin: Principal = Depends(require_admin), db: Session = Depends(get_db)):
+    rows = db.query(AuditArchive).order_by(AuditArchive.period_start.desc()).all()
+    return [{"id": a.id, "period_start": a.period_start, "period_end": a.period_end, "row_count": a.row_count,
+             "size_bytes": a.size_bytes, "created_at": a.created_at} for a in rows]
+
+def too_busy(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many exports in progress, retry shortly",
+                         headers={"Retry-After": str(e.retry_after)})
 
 @router.get("/templates/{template_id}/mapped-cells")
-def get_mapped_cells(template_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_mapped_cells(template_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     cells = db.query(TemplateCell).filter(TemplateCell.template_id == template_id).all()
     return [{"sheet_name": c.sheet_name, "cell_ref": c.cell_ref, "label": c.label, "data_type": c.data_type} for c in cells]
 
-@router.get("/templates/{template_id}/workbook")
-def download_template(template_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    tpl = db.query(Template).filter(Template.id == template_id).first()
-    if not tpl:
+@router.post("/templates/{template_id}/aggregate", response_model=AggregateResp)
+def aggregate_cells(template_id: int, payload: AggregateReq, user: Principal = Depends(get_current_user),
+                    db: Session = Depends(get_db)):
+    if db.query(Template.id).filter(Template.id == template_id).scalar() is None:
         raise HTTPException(status_code=404, detail="Template not found")
+    cells = [(c.sheet_name, c.cell_ref.upper()) for c in payload.cells]
+    group = (payload.group_by.sheet_name, payload.group_by.cell_ref.upper()) if payload.group_by else None
+    rows = aggregate(db, template_id, cells, payload.period, group, payload.created_from, payload.created_to)
+    return {"rows": rows}
+
+@router.get("/templates/{template_id}/workbook")
+def download_template(template_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    tpl = _get_template(db, template_id)
     return {
         "filename": f"template-{template_id}.xlsx",
         "mime": tpl.mime_type,
-        "base64": tpl.file_bytes.hex()  # frontend will fetch as hex and convert to bytes
+        "base64": load_blob(tpl.file_sha256).hex()  # legacy hex transport; prefer /workbook.xlsx
     }
 
+@router.get("/templates/{template_id}/workbook.xlsx")
+def download_template_binary(template_id: int, request: Request, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    tpl = _get_template(db, template_id)
+    return send_bytes(
+        request, lambda: load_blob(tpl.file_sha256), tpl.mime_type, f"template-{template_id}.xlsx",
+        etag=tpl.file_sha256[:32],
+    )
+
+def _snapshot_index(db: Session, tpl: Template) -> dict:
+    if not tpl.snapshot_json:  # uploaded before snapshots existed
+        tpl.snapshot_json = build_snapshot(load_blob(tpl.file_sha256))
+        db.commit()
+    return json.loads(tpl.snapshot_json)
+
+@router.get("/templates/{template_id}/snapshot")
+def get_template_snapshot(template_id: int, request: Request, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    tpl = _get_template(db, template_id)
+    index = _snapshot_index(db, tpl)
+    cells = db.query(TemplateCell).filter(TemplateCell.template_id == template_id) \
+        .order_by(TemplateCell.sheet_name, TemplateCell.cell_ref).all()
+    index["template_id"] = template_id
+    index["mapped_cells"] = [{"sheet_name": c.sheet_name, "cell_ref": c.cell_ref, "label": c.label, "data_type": c.data_type} for c in cells]
+    for sheet in index["sheets"]:
+        sheet["url"] = f"/templates/{template_id}/snapshot/sheets/{sheet['index']}"
+    body = json.dumps(index, ensure_ascii=False).encode()
+    return send_bytes(request, body, "application/json", f"template-{template_id}-snapshot.json", compress=True)
+
+@router.get("/templates/{template_id}/snapshot/sheets/{sheet_index}")
+def get_template_snapshot_sheet(
+    template_id: int,
+    sheet_index: int,
+    request: Request,
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    tpl = _get_template(db, template_id)
+    sheets = _snapshot_index(db, tpl)["sheets"]
+    if not 0 <= sheet_index < len(sheets):
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    sha = sheets[sheet_index]["sha256"]
+    return send_bytes(
+        request, lambda: load_blob(sha), "application/json", f"template-{template_id}-sheet-{sheet_index}.json",
+        etag=sha[:32], gzipped=True,
+    )
+
 @router.post("/instances", response_model=InstanceResp)
 def create_instance(
     payload: InstanceCreateReq,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    tpl = db.query(Template).filter(Template.id == payload.template_id).first()
-    if not tpl:
-        raise HTTPException(status_code=404, detail="Template not found")
+    _get_template(db, payload.template_id)
     inst = Instance(template_id=payload.template_id, created_by=user.id, title=payload.title)
     db.add(inst)
-    db.commit()
-    db.refresh(inst)
-    db.add(AuditEvent(instance_id=inst.id, user_id=user.id, event_type="create", meta_json=json.dumps({"template_id": payload.template_id})))
+    db.flush()
+    auditlog.record(db, instance_id=inst.id, user_id=user.id, event_type="create",
+                    meta_json=json.dumps({"template_id": payload.template_id}))
     db.commit()
     return InstanceResp(id=inst.id, template_id=inst.template_id, title=inst.title)
 
-@router.get("/instances/{instance_id}")
-def get_instance(instance_id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def _get_instance(db: Session, instance_id: int) -> Instance:
     inst = db.query(Instance).filter(Instance.id == instance_id).first()
     if not inst:
         raise HTTPException(status_code=404, detail="Instance not found")
-    values = db.query(InstanceValue).filter(InstanceValue.instance_id == instance_id).all()
-    audit = db.query(AuditEvent).filter(AuditEvent.instance_id == instance_id).order_by(AuditEvent.created_at.asc()).all()
+    return inst
+
+def _value_item(v: InstanceValue) -> dict:
+    return {"sheet_name": v.sheet_name, "cell_ref": v.cell_ref, "value": v.value}
+
+def _audit_item(a: AuditEvent) -> dict:
     return {
+        "id": a.id, "event_type": a.event_type, "sheet_name": a.sheet_name, "cell_ref": a.cell_ref,
+        "old_value": a.old_value, "new_value": a.new_value, "created_at": a.created_at.isoformat()+"Z",
+        "meta_json": a.meta_json
+    }
+
+@router.get("/instances/{instance_id}")
+def get_instance(
+    instance_id: int,
+    request: Request,
+    response: Response,
+    view: Literal["full", "values"] = "full",
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    inst = _get_instance(db, instance_id)
+    # the version covers the values; the full view also changes when events are added without a save (exports)
+    tag = instancesnap.etag(inst, view, db.scalar(auditlog.last_event(inst.id, inst.created_at)) if view == "full" else 0)
+    if instancesnap.not_modified(request, tag):
+        return Response(status_code=304, headers=instancesnap.headers(tag))
+    out = {
         "id": inst.id,
         "template_id": inst.template_id,
         "title": inst.title,
-        "values": [{"sheet_name": v.sheet_name, "cell_ref": v.cell_ref, "value": v.value} for v in values],
-        "audit": [{
-            "event_type": a.event_type, "sheet_name": a.sheet_name, "cell_ref": a.cell_ref,
-            "old_value": a.old_value, "new_value": a.new_value, "created_at": a.created_at.isoformat()+"Z",
-            "meta_json": a.meta_json
-        } for a in audit]
+        "version": inst.version,
+        "values": instancesnap.items(instancesnap.load(db, inst)),
     }
+    if view == "full":
+        audit = db.query(AuditEvent).filter(AuditEvent.instance_id == instance_id, auditlog.since(inst.created_at)) \
+            .order_by(AuditEvent.created_at.asc(), AuditEvent.id.asc()).all()
+        out["audit"] = [_audit_item(a) for a in audit]
+    db.commit()  # a snapshot rebuilt on read
+    response.headers.update(instancesnap.headers(tag))
+    return out
 
-@router.post("/instances/{instance_id}/save")
+@router.get("/instances/{instance_id}/values")
+def list_instance_values(
+    instance_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    _get_instance(db, instance_id)
+    q = db.query(InstanceValue).filter(InstanceValue.instance_id == instance_id)
+    rows, next_cursor = _page(q, [InstanceValue.sheet_name, InstanceValue.cell_ref], cursor, limit)
+    return {"items": [_value_item(v) for v in rows], "next_cursor": next_cursor}
+
+@router.get("/instances/{instance_id}/audit")
+def list_instance_audit(
+    instance_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    order: Literal["asc", "desc"] = "asc",
+    user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    inst = _get_instance(db, instance_id)
+    q = db.query(AuditEvent).filter(AuditEvent.instance_id == instance_id, auditlog.since(inst.created_at))
+    rows, next_cursor = _page(q, [AuditEvent.created_at, AuditEvent.id], cursor, limit, descending=order == "desc")
+    return {"items": [_audit_item(a) for a in rows], "next_cursor": next_cursor}
+
+def checked_values(values: list[dict], types: dict) -> list[dict]:
+    """Values with their typed shadows; 422 listing every unparsable cell unless VALUE_VALIDATION=store."""
+    values, errors = coerce_batch(values, types)
+    if errors and get_settings().VALUE_VALIDATION == "reject":
+        raise HTTPException(status_code=422, detail={"message": "Invalid values", "cells": errors})
+    return values
+
+@router.post("/instances/{instance_id}/save", response_model=InstanceSaveResp)
 def save_instance(
     instance_id: int,
     payload: InstanceSaveReq,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    inst = db.query(Instance).filter(Instance.id == instance_id).first()
-    if not inst:
-        raise HTTPException(status_code=404, detail="Instance not found")
+    if payload.mode == "delta" and payload.base_version is None:
+        raise HTTPException(status_code=422, detail="delta saves require base_version")
 
-    # upsert values
-    for item in payload.values:
-        sheet = item.sheet_name
-        cell = item.cell_ref.upper()
-        existing = db.query(InstanceValue).filter(
-            InstanceValue.instance_id == instance_id,
-            InstanceValue.sheet_name == sheet,
-            InstanceValue.cell_ref == cell
-        ).first()
-        if existing:
-            existing.value = item.value
-        else:
-            db.add(InstanceValue(instance_id=instance_id, sheet_name=sheet, cell_ref=cell, value=item.value))
-
-    # audit
-    for a in payload.audit:
-        db.add(AuditEvent(
-            instance_id=instance_id,
-            user_id=user.id,
-            event_type=a.event_type,
-            sheet_name=a.sheet_name,
-            cell_ref=a.cell_ref,
-            old_value=a.old_value,
-            new_value=a.new_value,
-            meta_json=a.meta_json or "{}",
-        ))
-    db.add(AuditEvent(instance_id=instance_id, user_id=user.id, event_type="save", meta_json=json.dumps({"values_count": len(payload.values)})))
+    # Bump the version first: the row lock serializes concurrent saves and the
+    # version predicate rejects writers that started from a stale copy.
+    bump = update(Instance).where(Instance.id == instance_id)
+    if payload.base_version is not None:
+        bump = bump.where(Instance.version == payload.base_version)
+    version = db.execute(bump.values(version=Instance.version + 1).returning(Instance.version)).scalar()
+    if version is None:
+        current = db.query(Instance.version).filter(Instance.id == instance_id).scalar()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Instance not found")
+        raise HTTPException(status_code=409, detail={"message": "Instance was modified by someone else", "version": current})
+
+    template_id = db.query(Instance.template_id).filter(Instance.id == instance_id).scalar()
+    types = mapped_types(db, template_id)
+    values = checked_values([v.model_dump() for v in payload.values], types)
+    upsert_instance_values(db, instance_id, values)
+    rows = instancesnap.store(db, instance_id, version)
+
+    audit = [{
+        "instance_id": instance_id,
+        "user_id": user.id,
+        "event_type": a.event_type,
+        "sheet_name": a.sheet_name,
+        "cell_ref": a.cell_ref,
+        "old_value": a.old_value,
+        "new_value": a.new_value,
+        "meta_json": a.meta_json or "{}",
+    } for a in payload.audit]
+    audit.append({"instance_id": instance_id, "user_id": user.id, "event_type": "save",
+                  "meta_json": json.dumps({"values_count": len(payload.values), "mode": payload.mode, "version": version})})
+    auditlog.record_many(db, audit)
     db.commit()
-    return {"ok": True}
+
+    computed = []
+    if get_settings().RECALC_ENABLED and payload.values:
+        tpl = db.get(Template, template_id)
+        try:
+            computed = recalculate_values(tpl.file_sha256, rows, [(v.sheet_name, v.cell_ref) for v in payload.values], types)
+        except Exception:
+            # the save is already committed; a template the engine cannot read only costs the preview
+            log.exception("recalculation failed for instance %s", instance_id)
+    return InstanceSaveResp(version=version, computed=computed)
+
+async def _pump(websocket: WebSocket, viewer):
+    while not viewer.dropped:
+        await websocket.send_text(await viewer.queue.get())
+    await websocket.close(code=1013, reason="Too slow to keep up with the room")
+
+@router.websocket("/instances/{instance_id}/live")
+async def live_edit(websocket: WebSocket, instance_id: int, token: str = ""):
+    # Browsers cannot set headers on WebSocket requests, so the bearer token comes as ?token=
+    principal = await run_blocking(principal_for_token, token) if token else None
+    if principal is None:
+        await websocket.close(code=4401, reason="Invalid token")
+        return
+    await websocket.accept()
+    hub = get_hub()
+    try:
+        room, viewer = await hub.join(instance_id, principal)
+    except RoomClosed as e:
+        await websocket.close(code=e.code, reason=e.reason)
+        return
+    except Exception:
+        log.exception("live room for instance %s failed to load", instance_id)
+        await websocket.close(code=1011, reason="Could not open the instance")
+        return
+    sender = asyncio.ensure_future(_pump(websocket, viewer))
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+            except ValueError:
+                viewer.send(json.dumps({"type": "error", "detail": "Invalid JSON"}))
+                continue
+            kind = msg.get("type") if isinstance(msg, dict) else None
+            if kind == "edit":
+                reply = room.edit(viewer, msg)
+            elif kind == "ping":
+                reply = {"type": "pong"}
+            else:
+                reply = {"type": "error", "detail": f"Unknown message type {kind!r}"}
+            viewer.send(json.dumps(reply, ensure_ascii=False))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        hub.leave(room, viewer)
+
+@router.post("/templates/{template_id}/import", status_code=202)
+def import_instances(
+    template_id: int,
+    file: UploadFile = File(...),
+    admin: Principal = Depends(require_admin),
+    db: Session = Depends(get_db),
+):
+    if db.query(Template.id).filter(Template.id == template_id).scalar() is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    name = file.filename or "import.csv"
+    if not name.lower().endswith((".csv", ".txt", ".xlsx", ".xlsm")):
+        raise HTTPException(status_code=415, detail="Upload a .csv or .xlsx file")
+    try:
+        job = jobs.enqueue_import(db, admin.id, template_id, file.file, name)
+    except Overloaded as e:
+        raise too_busy(e)
+    return {"job_id": job.id, "status": job.status}
+
+def _import_job(db: Session, job_id: int, user: Principal) -> ExportJob:
+    job = _get_job(db, job_id, user)
+    if job.kind != "import":
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@router.get("/import-jobs/{job_id}", response_model=ImportJobResp)
+def import_job_status(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = _import_job(db, job_id, user)
+    return {"id": job.id, "status": job.status, "attempts": job.attempts, "progress_done": job.progress_done,
+            "progress_total": job.progress_total, "error": job.error, "created_at": job.created_at,
+            "finished_at": job.finished_at, **json.loads(job.summary_json or "{}")}
+
+@router.get("/import-jobs/{job_id}/errors.csv")
+def import_job_errors(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = _import_job(db, job_id, user)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Import job is {job.status}")
+    if not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Error report is no longer available")
+    return FileResponse(job.result_path, media_type="text/csv", filename=job.result_filename)
+
+@router.post("/import-jobs/{job_id}/cancel", response_model=ImportJobResp)
+def cancel_import_job(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = _import_job(db, job_id, user)
+    if not jobs.cancel(db, job):
+        raise HTTPException(status_code=409, detail=f"Import job is {job.status}")
+    return import_job_status(job_id, user, db)
 
 @router.post("/instances/{instance_id}/export", response_model=ExportResp)
-def export_pdf(
+async def export_pdf(
     instance_id: int,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    run_async: bool = Query(False, alias="async"),
+    summarize_audit: bool = False,
+    user: Principal = Depends(get_current_user),
 ):
-    inst = db.query(Instance).filter(Instance.id == instance_id).first()
-    if not inst:
+    if run_async:
+        job_id, status = await run_blocking(_enqueue_export, instance_id, user.id, summarize_audit)
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": status})
+
+    # Return as hex (legacy). New clients use /export.pdf.
+    path, scratch = await render_export(instance_id, user.id, summarize_audit)
+    return send_hex_json(path, scratch, export_filename(instance_id))
+
+def _enqueue_export(instance_id: int, user_id: int, summarize: bool) -> tuple[int, str]:
+    with SessionLocal() as db:
+        if db.get(Instance, instance_id) is None:
+            raise HTTPException(status_code=404, detail="Instance not found")
+        try:
+            job = jobs.enqueue(db, instance_id, user_id, {"summarize_audit": summarize})
+        except Overloaded as e:
+            raise too_busy(e)
+        return job.id, job.status
+
+_LOW_MEMORY = {"status_code": 503, "detail": "Server is low on memory, retry shortly", "headers": {"Retry-After": "5"}}
+
+def _export_template(instance_id: int) -> int:
+    if over_limit():
+        metrics.EXPORT_REJECTED.inc(reason="memory_busy")
+        raise HTTPException(**_LOW_MEMORY)
+    with SessionLocal() as db:
+        template_id = db.query(Instance.template_id).filter(Instance.id == instance_id).scalar()
+    if template_id is None:
         raise HTTPException(status_code=404, detail="Instance not found")
+    return template_id
 
-    tpl = db.query(Template).filter(Template.id == inst.template_id).first()
-    if not tpl:
-        raise HTTPException(status_code=404, detail="Template not found")
+def _render_and_record(instance_id: int, user_id: int, summarize: bool) -> tuple[str, str]:
+    # The export pipeline is sync end to end (audit streaming, LibreOffice, pypdf), so it runs
+    # whole on the blocking executor with a session from the sync pool.
+    scratch = make_scratch()
+    try:
+        with SessionLocal() as db, RssWatch() as watch:
+            path = render_instance_pdf_file(db, instance_id, user_id, scratch, summarize, watch)
+            db.commit()
+        return path, scratch
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+async def render_export(instance_id: int, user_id: int, summarize: bool) -> tuple[str, str]:
+    """Render an export into a fresh scratch directory and commit its audit event; returns (pdf path, scratch).
 
-    values = db.query(InstanceValue).filter(InstanceValue.instance_id == instance_id).all()
-    filled_xlsx = fill_values(tpl.file_bytes, [{"sheet_name": v.sheet_name, "cell_ref": v.cell_ref, "value": v.value} for v in values])
+    Waits for an interactive slot of the export scheduler on the event loop (429 when the queue is full),
+    then renders on the blocking executor. Refused with 503 while the process is over EXPORT_RSS_LIMIT_MB,
+    and abandoned the same way when it goes over mid-export. The scratch directory is the caller's to
+    remove (the file responses do it).
+    """
+    template_id = await run_blocking(_export_template, instance_id)
+    try:
+        async with get_scheduler().slot(user_id, template_id):
+            return await run_blocking(_render_and_record, instance_id, user_id, summarize)
+    except Overloaded as e:
+        raise too_busy(e)
+    except ExportError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except MemoryLimitExceeded:
+        raise HTTPException(**_LOW_MEMORY)
 
-    main_pdf = xlsx_to_pdf(filled_xlsx)
+@router.post("/instances/{instance_id}/export.pdf")
+async def export_pdf_binary(
+    instance_id: int,
+    request: Request,
+    summarize_audit: bool = False,
+    user: Principal = Depends(get_current_user),
+):
+    # No If-None-Match here: every POST renders and records its export event, which also lands in the appendix.
+    path, scratch = await render_export(instance_id, user.id, summarize_audit)
+    return send_scratch_file(path, scratch, "application/pdf", export_filename(instance_id))
 
-    # Build audit table (include user email)
-    audits = db.query(AuditEvent, User).join(User, User.id == AuditEvent.user_id)        .filter(AuditEvent.instance_id == instance_id)        .order_by(AuditEvent.created_at.asc()).all()
+@router.post("/exports/batch", status_code=202)
+def export_batch(payload: BatchExportReq, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    if not payload.instance_ids and payload.template_id is None:
+        raise HTTPException(status_code=422, detail="Provide instance_ids or template_id")
+    try:
+        job = jobs.enqueue_batch(db, user.id, payload.model_dump(mode="json"))
+    except Overloaded as e:
+        raise too_busy(e)
+    return {"job_id": job.id, "status": job.status}
 
-    audit_rows = [{
-        "created_at": ae.created_at.isoformat()+"Z",
-        "user_email": u.email,
-        "event_type": ae.event_type,
-        "sheet_name": ae.sheet_name,
-        "cell_ref": ae.cell_ref,
-        "old_value": ae.old_value,
-        "new_value": ae.new_value,
-    } for ae, u in audits if ae.event_type in ("edit","save","export","create")]
+def _get_job(db: Session, job_id: int, user: Principal) -> ExportJob:
+    job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+    if not job or (job.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
 
-    audit_pdf = build_audit_pdf(audit_rows)
-    out_pdf = merge_pdf_with_audit(main_pdf, audit_pdf)
+def _finished_job(db: Session, job_id: int, user: Principal, single_only: bool = False) -> ExportJob:
+    job = _get_job(db, job_id, user)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    if single_only and job.kind != "single":
+        raise HTTPException(status_code=409, detail="Batch results are served from /export-jobs/{id}/file")
+    return job
 
-    # store an export audit event
-    db.add(AuditEvent(instance_id=instance_id, user_id=user.id, event_type="export"))
-    db.commit()
+@router.get("/export-jobs/{job_id}", response_model=ExportJobResp)
+def export_job_status(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    return _get_job(db, job_id, user)
+
+def _result_file(job: ExportJob) -> str:
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Export result is no longer available")
+    return job.result_path
+
+def _send_result(request: Request, job: ExportJob):
+    media_type = "application/zip" if job.result_filename.endswith(".zip") else "application/pdf"
+    if not job.result_path and job.result_bytes is not None:  # finished before results moved to EXPORT_RESULTS_DIR
+        return send_bytes(request, job.result_bytes, media_type, job.result_filename)
+    # FileResponse handles Range and ETag from the file's stat
+    return FileResponse(_result_file(job), media_type=media_type, filename=job.result_filename)
+
+@router.get("/export-jobs/{job_id}/result", response_model=ExportResp)
+def export_job_result(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = _finished_job(db, job_id, user, single_only=True)
+    if not job.result_path and job.result_bytes is not None:
+        return {"filename": job.result_filename, "pdf_hex": job.result_bytes.hex()}
+    return send_hex_json(_result_file(job), None, job.result_filename)
+
+@router.get("/export-jobs/{job_id}/result.pdf")
+def export_job_result_binary(job_id: int, request: Request, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    return _send_result(request, _finished_job(db, job_id, user, single_only=True))
+
+@router.get("/export-jobs/{job_id}/file")
+def export_job_file(job_id: int, request: Request, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    return _send_result(request, _finished_job(db, job_id, user))
 
-    # Return as hex (MVP). Frontend will download.
-    filename = f"instance-{instance_id}.pdf"
-    return {"filename": filename, "pdf_hex": out_pdf.hex()}
+@router.post("/export-jobs/{job_id}/cancel", response_model=ExportJobResp)
+def cancel_export_job(job_id: int, user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = _get_job(db, job_id, user)
+    if not jobs.cancel(db, job):
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    db.refresh(job)
+    return job
@@ -0,0 +1,270 @@
+"""Async implementations of the hot routes, mounted ahead of ``routes.router`` when DB_ASYNC is on.
+
+Same paths, parameters and responses as the sync handlers; only the execution
+model differs. Queries run on the asyncio engine, the set-based write helpers
+run through ``AsyncSession.run_sync`` on the same connection, and parsing,
+recalculation, hashing and the export pipeline go to the dedicated executors
+(see ``executors.py``). Routes without an async twin (uploads, mapping, batch
+exports, legacy hex transports) keep being served by the sync router.
+"""
+import json, logging
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.orm import undefer
+from .db import get_async_db
+from .config import get_settings
+from .models import User, Template, TemplateCell, Instance, InstanceValue, AuditEvent, ExportJob
+from .security import verify_password, create_access_token
+from .deps import get_current_user_async
+from .principals import Principal
+from .schemas import (
+    LoginReq, TokenResp, MeResp, InstanceCreateReq, InstanceResp,
+    InstanceSaveReq, InstanceSaveResp, ExportJobResp,
+)
+from .snapshot import build_snapshot
+from .exports import export_filename
+from .recalc import recalculate_values
+from .streaming import send_bytes, send_scratch_file
+from .blobstore import load_blob
+from .bulk import upsert_instance_values
+from .pagination import keyset_statement, keyset_result, CursorError, DEFAULT_LIMIT, MAX_LIMIT
+from .executors import run_cpu, run_blocking
+from . import auditlog, instancesnap
+from .routes import _template_item, _value_item, _audit_item, checked_values, check_ready, render_export
+
+router = APIRouter(include_in_schema=False)  # the sync twins document the same contracts
+log = logging.getLogger(__name__)
+
+async def _page(db, stmt, columns, cursor: Optional[str], limit: int, descending: bool = False):
+    try:
+        stmt = keyset_statement(stmt, columns, cursor, limit, descending)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return keyset_result((await db.scalars(stmt)).all(), columns, limit)
+
+async def _get_template(db, template_id: int, snapshot: bool = False) -> Template:
+    stmt = select(Template).where(Template.id == template_id)
+    if snapshot:
+        stmt = stmt.options(undefer(Template.snapshot_json))
+    tpl = (await db.scalars(stmt)).first()
+    if not tpl:
+        raise HTTPException(status_code=404, detail="Template not found")
+    check_ready(tpl)
+    return tpl
+
+async def _get_instance(db, instance_id: int) -> Instance:
+    inst = await db.get(Instance, instance_id)
+    if not inst:
+        raise HTTPException(status_code=404, detail="Instance not found")
+    return inst
+
+async def _mapped_types(db, template_id: int) -> dict:
+    rows = await db.execute(select(TemplateCell.sheet_name, TemplateCell.cell_ref, TemplateCell.data_type)
+                            .where(TemplateCell.template_id == template_id))
+    return {(sheet, ref): dt for sheet, ref, dt in rows}
+
+@router.post("/auth/login", response_model=TokenResp)
+async def login(payload: LoginReq, db=Depends(get_async_db)):
+    user = (await db.scalars(select(User).where(User.email == payload.email, User.is_active == True))).first()
+    # bcrypt is deliberately slow; never on the event loop
+    if not user or not await run_cpu(verify_password, payload.password, user.password_hash):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+    return TokenResp(access_token=token)
+
+@router.get("/me", response_model=MeResp)
+async def me(user: Principal = Depends(get_current_user_async)):
+    return MeResp(id=user.id, email=user.email, role=user.role)
+
+@router.get("/templates")
+async def list_templates(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    rows, next_cursor = await _page(db, select(Template), [Template.created_at, Template.id], cursor, limit, descending=True)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_template_item(t) for t in rows]
+
+@router.get("/templates/{template_id}/mapped-cells")
+async def get_mapped_cells(template_id: int, user: Principal = Depends(get_current_user_async), db=Depends(get_async_db)):
+    cells = (await db.scalars(select(TemplateCell).where(TemplateCell.template_id == template_id))).all()
+    return [{"sheet_name": c.sheet_name, "cell_ref": c.cell_ref, "label": c.label, "data_type": c.data_type} for c in cells]
+
+async def _snapshot_index(db, tpl: Template) -> dict:
+    if not tpl.snapshot_json:  # uploaded before snapshots existed
+        tpl.snapshot_json = await run_cpu(lambda: build_snapshot(load_blob(tpl.file_sha256)))
+        await db.commit()
+    return json.loads(tpl.snapshot_json)
+
+@router.get("/templates/{template_id}/snapshot")
+async def get_template_snapshot(template_id: int, request: Request, user: Principal = Depends(get_current_user_async), db=Depends(get_async_db)):
+    tpl = await _get_template(db, template_id, snapshot=True)
+    index = await _snapshot_index(db, tpl)
+    cells = (await db.scalars(select(TemplateCell).where(TemplateCell.template_id == template_id)
+                              .order_by(TemplateCell.sheet_name, TemplateCell.cell_ref))).all()
+    index["template_id"] = template_id
+    index["mapped_cells"] = [{"sheet_name": c.sheet_name, "cell_ref": c.cell_ref, "label": c.label, "data_type": c.data_type} for c in cells]
+    for sheet in index["sheets"]:
+        sheet["url"] = f"/templates/{template_id}/snapshot/sheets/{sheet['index']}"
+    body = json.dumps(index, ensure_ascii=False).encode()
+    return await run_cpu(send_bytes, request, body, "application/json", f"template-{template_id}-snapshot.json", compress=True)
+
+@router.get("/templates/{template_id}/snapshot/sheets/{sheet_index}")
+async def get_template_snapshot_sheet(
+    template_id: int,
+    sheet_index: int,
+    request: Request,
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    tpl = await _get_template(db, template_id, snapshot=True)
+    sheets = (await _snapshot_index(db, tpl))["sheets"]
+    if not 0 <= sheet_index < len(sheets):
+        raise HTTPException(status_code=404, detail="Sheet not found")
+    sha = sheets[sheet_index]["sha256"]
+    # the blob is only read when the client's copy is stale, and that read may hit disk, S3 or the DB
+    return await run_blocking(
+        send_bytes, request, lambda: load_blob(sha), "application/json", f"template-{template_id}-sheet-{sheet_index}.json",
+        etag=sha[:32], gzipped=True,
+    )
+
+@router.post("/instances", response_model=InstanceResp)
+async def create_instance(payload: InstanceCreateReq, user: Principal = Depends(get_current_user_async), db=Depends(get_async_db)):
+    await _get_template(db, payload.template_id)
+    inst = Instance(template_id=payload.template_id, created_by=user.id, title=payload.title)
+    db.add(inst)
+    await db.flush()
+    auditlog.record(db, instance_id=inst.id, user_id=user.id, event_type="create",
+                    meta_json=json.dumps({"template_id": payload.template_id}))
+    await db.commit()
+    return InstanceResp(id=inst.id, template_id=inst.template_id, title=inst.title)
+
+@router.get("/instances/{instance_id}")
+async def get_instance(
+    instance_id: int,
+    request: Request,
+    response: Response,
+    view: Literal["full", "values"] = "full",
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    inst = await _get_instance(db, instance_id)
+    tag = instancesnap.etag(inst, view, await db.scalar(auditlog.last_event(inst.id, inst.created_at)) if view == "full" else 0)
+    if instancesnap.not_modified(request, tag):
+        return Response(status_code=304, headers=instancesnap.headers(tag))
+    out = {
+        "id": inst.id,
+        "template_id": inst.template_id,
+        "title": inst.title,
+        "version": inst.version,
+        "values": instancesnap.items(await db.run_sync(instancesnap.load, inst)),
+    }
+    if view == "full":
+        audit = (await db.scalars(select(AuditEvent).where(AuditEvent.instance_id == instance_id, auditlog.since(inst.created_at))
+                                  .order_by(AuditEvent.created_at.asc(), AuditEvent.id.asc()))).all()
+        out["audit"] = [_audit_item(a) for a in audit]
+    await db.commit()  # a snapshot rebuilt on read
+    response.headers.update(instancesnap.headers(tag))
+    return out
+
+@router.get("/instances/{instance_id}/values")
+async def list_instance_values(
+    instance_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    await _get_instance(db, instance_id)
+    stmt = select(InstanceValue).where(InstanceValue.instance_id == instance_id)
+    rows, next_cursor = await _page(db, stmt, [InstanceValue.sheet_name, InstanceValue.cell_ref], cursor, limit)
+    return {"items": [_value_item(v) for v in rows], "next_cursor": next_cursor}
+
+@router.get("/instances/{instance_id}/audit")
+async def list_instance_audit(
+    instance_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    order: Literal["asc", "desc"] = "asc",
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    inst = await _get_instance(db, instance_id)
+    stmt = select(AuditEvent).where(AuditEvent.instance_id == instance_id, auditlog.since(inst.created_at))
+    rows, next_cursor = await _page(db, stmt, [AuditEvent.created_at, AuditEvent.id], cursor, limit, descending=order == "desc")
+    return {"items": [_audit_item(a) for a in rows], "next_cursor": next_cursor}
+
+@router.post("/instances/{instance_id}/save", response_model=InstanceSaveResp)
+async def save_instance(
+    instance_id: int,
+    payload: InstanceSaveReq,
+    user: Principal = Depends(get_current_user_async),
+    db=Depends(get_async_db),
+):
+    if payload.mode == "delta" and payload.base_version is None:
+        raise HTTPException(status_code=422, detail="delta saves require base_version")
+
+    bump = update(Instance).where(Instance.id == instance_id)
+    if payload.base_version is not None:
+        bump = bump.where(Instance.version == payload.base_version)
+    version = (await db.execute(bump.values(version=Instance.version + 1).returning(Instance.version))).scalar()
+    if version is None:
+        current = (await db.execute(select(Instance.version).where(Instance.id == instance_id))).scalar()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Instance not found")
+        raise HTTPException(status_code=409, detail={"message": "Instance was modified by someone else", "version": current})
+
+    template_id = (await db.execute(select(Instance.template_id).where(Instance.id == instance_id))).scalar()
+    types = await _mapped_types(db, template_id)
+    values = checked_values([v.model_dump() for v in payload.values], types)
+    audit = [{
+        "instance_id": instance_id,
+        "user_id": user.id,
+        "event_type": a.event_type,
+        "sheet_name": a.sheet_name,
+        "cell_ref": a.cell_ref,
+        "old_value": a.old_value,
+        "new_value": a.new_value,
+        "meta_json": a.meta_json or "{}",
+    } for a in payload.audit]
+    audit.append({"instance_id": instance_id, "user_id": user.id, "event_type": "save",
+                  "meta_json": json.dumps({"values_count": len(payload.values), "mode": payload.mode, "version": version})})
+
+    def write(session):
+        upsert_instance_values(session, instance_id, values)
+        auditlog.record_many(session, audit)
+        return instancesnap.store(session, instance_id, version)
+    rows = await db.run_sync(write)
+    await db.commit()
+
+    computed = []
+    if get_settings().RECALC_ENABLED and payload.values:
+        try:
+            sha = (await db.execute(select(Template.file_sha256).where(Template.id == template_id))).scalar()
+            computed = await run_cpu(recalculate_values, sha, rows, [(v.sheet_name, v.cell_ref) for v in payload.values],
+                                     types)
+        except Exception:
+            log.exception("recalculation failed for instance %s", instance_id)
+    return InstanceSaveResp(version=version, computed=computed)
+
+@router.post("/instances/{instance_id}/export.pdf")
+async def export_pdf_binary(
+    instance_id: int,
+    request: Request,
+    summarize_audit: bool = False,
+    user: Principal = Depends(get_current_user_async),
+):
+    path, scratch = await render_export(instance_id, user.id, summarize_audit)
+    return send_scratch_file(path, scratch, "application/pdf", export_filename(instance_id))
+
+@router.get("/export-jobs/{job_id}", response_model=ExportJobResp)
+async def export_job_status(job_id: int, user: Principal = Depends(get_current_user_async), db=Depends(get_async_db)):
+    job = await db.get(ExportJob, job_id)
+    if not job or (job.user_id != user.id and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
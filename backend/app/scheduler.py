@@ -0,0 +1,223 @@
+"""Admission control for export rendering in one API process.
+
+Every render holds a slot: inline exports (``/export``, ``/export.pdf``) as
+``interactive``, background jobs claimed by the dispatcher as ``bulk``. The
+number of slots is EXPORT_CONCURRENCY, or when that is 0 the smaller of the
+CPU count and the memory available to the container divided by
+EXPORT_SLOT_MEMORY_MB. Bulk work never takes the last EXPORT_INTERACTIVE_RESERVED
+slots and is not started while inline exports are waiting.
+
+Inline exports that find no free slot wait in a fair queue: the next slot goes
+to the user who was served least recently, and within a user to the template
+served least recently, so one user exporting a hundred instances delays others
+by at most one render each. Past EXPORT_QUEUE_MAX waiters (or after waiting
+EXPORT_QUEUE_TIMEOUT seconds) a request is refused with ``Overloaded``, which
+the routes turn into 429 with a Retry-After estimated from recent render times.
+
+Queued inline exports wait on the event loop, not in a thread: the routes take
+the slot first and only then hand the render to the blocking executor
+(executors.py). Waiters therefore cost no threads, and at most ``capacity``
+renders occupy BLOCKING_EXECUTOR_WORKERS threads, so the capacity should stay
+below that pool's size to leave room for its other blocking calls.
+"""
+import asyncio, math, os, threading, time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from . import metrics
+from .config import get_settings
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"export capacity exhausted ({reason})")
+        self.reason, self.retry_after = reason, retry_after
+
+def _memory_bytes() -> int | None:
+    # the container's limit (cgroup v2, then v1) when there is one, else the machine's memory
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        return None
+
+def default_capacity() -> int:
+    s = get_settings()
+    if s.EXPORT_CONCURRENCY > 0:
+        return s.EXPORT_CONCURRENCY
+    slots = os.cpu_count() or 1
+    mem = _memory_bytes()
+    if mem and s.EXPORT_SLOT_MEMORY_MB > 0:
+        slots = min(slots, mem // (s.EXPORT_SLOT_MEMORY_MB * 1024 * 1024))
+    return max(int(slots), 1)
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+class _Waiter:
+    __slots__ = ("user_id", "template_id", "loop", "future", "granted")
+
+    def __init__(self, user_id: int, template_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id, self.template_id = user_id, template_id
+        self.loop, self.future = loop, loop.create_future()
+        self.granted = False
+
+    def wake(self):
+        # release() runs on the event loop for inline exports and on dispatcher threads for jobs
+        self.loop.call_soon_threadsafe(_resolve, self.future)
+
+class ExportScheduler:
+    def __init__(self, capacity: int, reserved: int, queue_max: int, queue_timeout: float):
+        self.capacity = capacity
+        self.bulk_limit = max(capacity - reserved, 1)
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._running = {"interactive": 0, "bulk": 0}
+        # user -> template -> waiters, both levels in least-recently-served order
+        self._flows: OrderedDict[int, OrderedDict[int, deque]] = OrderedDict()
+        self._waiting = 0
+        self._render_seconds = 5.0  # moving average behind Retry-After
+        self.rejected = 0
+
+    def _in_use(self) -> int:
+        return self._running["interactive"] + self._running["bulk"]
+
+    def _publish(self):
+        metrics.EXPORT_QUEUE_DEPTH.set(self._waiting, queue="inline")
+        for priority, n in self._running.items():
+            metrics.EXPORT_SLOTS.set(n, priority=priority)
+
+    def retry_after(self, ahead: int | None = None) -> int:
+        ahead = self._waiting if ahead is None else ahead
+        return min(max(math.ceil(self._render_seconds * (ahead + 1) / self.capacity), 1), 300)
+
+    def _refuse(self, reason: str, retry_after: int):
+        self.rejected += 1
+        metrics.EXPORT_REJECTED.inc(reason=reason)
+        raise Overloaded(reason, retry_after)
+
+    # ------------------------------------------------------------ interactive
+
+    async def acquire(self, user_id: int, template_id: int):
+        """Take an interactive slot, waiting in the fair queue when none is free.
+
+        The wait is an awaitable on the event loop, so a queued export holds no thread; only the
+        renders themselves (at most ``capacity``) occupy the blocking executor.
+        """
+        t = time.perf_counter()
+        with self._lock:
+            if not self._waiting and self._in_use() < self.capacity:
+                self._running["interactive"] += 1
+                self._publish()
+                metrics.EXPORT_QUEUE_WAIT.observe(0, priority="interactive")
+                return
+            if self._waiting >= self.queue_max:
+                self._refuse("queue_full", self.retry_after())
+            w = _Waiter(user_id, template_id, asyncio.get_running_loop())
+            self._flows.setdefault(user_id, OrderedDict()).setdefault(template_id, deque()).append(w)
+            self._waiting += 1
+            self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(w.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not w.granted:
+                    self._drop(w)
+                    self._publish()
+                    self._refuse("queue_timeout", self.retry_after())
+        except asyncio.CancelledError:  # the client went away while queued
+            with self._lock:
+                granted = w.granted
+                if not granted:
+                    self._drop(w)
+                    self._publish()
+            if granted:
+                self.release("interactive")
+            raise
+        metrics.EXPORT_QUEUE_WAIT.observe(time.perf_counter() - t, priority="interactive")
+
+    def _drop(self, w: _Waiter):
+        templates = self._flows[w.user_id]
+        templates[w.template_id].remove(w)
+        if not templates[w.template_id]:
+            del templates[w.template_id]
+        if not templates:
+            del self._flows[w.user_id]
+        self._waiting -= 1
+
+    def _next(self) -> _Waiter:
+        user_id, templates = next(iter(self._flows.items()))
+        template_id, waiters = next(iter(templates.items()))
+        w = waiters.popleft()
+        # both move to the back of their line: served most recently
+        if waiters:
+            templates.move_to_end(template_id)
+        else:
+            del templates[template_id]
+        if templates:
+            self._flows.move_to_end(user_id)
+        else:
+            del self._flows[user_id]
+        self._waiting -= 1
+        return w
+
+    def _grant(self):
+        while self._waiting and self._in_use() < self.capacity:
+            w = self._next()
+            w.granted = True
+            self._running["interactive"] += 1
+            w.wake()
+
+    def release(self, priority: str = "interactive", seconds: float | None = None):
+        with self._lock:
+            self._running[priority] -= 1
+            if seconds is not None:
+                self._render_seconds += (seconds - self._render_seconds) * 0.2
+            self._grant()
+            self._publish()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, template_id: int):
+        await self.acquire(user_id, template_id)
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release("interactive", time.perf_counter() - t)
+
+    # ------------------------------------------------------------ bulk
+
+    def reserve_bulk(self, wanted: int) -> int:
+        """Take up to ``wanted`` bulk slots without waiting; returns how many were taken."""
+        with self._lock:
+            if self._waiting:
+                return 0
+            n = max(min(wanted, self.capacity - self._in_use(), self.bulk_limit - self._running["bulk"]), 0)
+            self._running["bulk"] += n
+            self._publish()
+            return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"capacity": self.capacity, "bulk_limit": self.bulk_limit, "interactive": self._running["interactive"],
+                    "bulk": self._running["bulk"], "waiting": self._waiting, "users_waiting": len(self._flows),
+                    "render_seconds_avg": round(self._render_seconds, 3), "rejected": self.rejected}
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> ExportScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            s = get_settings()
+            _scheduler = ExportScheduler(default_capacity(), s.EXPORT_INTERACTIVE_RESERVED, s.EXPORT_QUEUE_MAX,
+                                         s.EXPORT_QUEUE_TIMEOUT)
+        return _scheduler
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from datetime import datetime
 
 class LoginReq(BaseModel):
     email: str
@@ -18,6 +19,8 @@ class TemplateResp(BaseModel):
     id: int
     name: str
     original_filename: str
+    status: str = "ready"  # processing while a large upload is converted in the background, or failed
+    error: str = ""
 
 class MapCell(BaseModel):
     sheet_name: str = "Sheet1"
@@ -53,6 +56,84 @@ class AuditItem(BaseModel):
 class InstanceSaveReq(BaseModel):
     values: List[ValueItem]
     audit: List[AuditItem] = []
+    mode: Literal["full", "delta"] = "full"  # delta: only changed cells, base_version required
+    base_version: Optional[int] = None  # reject the save if the instance moved past this version
+
+class ComputedCell(BaseModel):
+    sheet_name: str
+    cell_ref: str
+    value: Optional[float | int | bool | str] = None
+    error: Optional[str] = None  # Excel error code such as "#DIV/0!", or "unsupported"
+
+class InstanceSaveResp(BaseModel):
+    ok: bool = True
+    version: int
+    computed: List[ComputedCell] = []  # formula cells downstream of the saved values
 
 class ExportResp(BaseModel):
     filename: str
+    pdf_hex: str
+
+class ExportJobResp(BaseModel):
+    id: int
+    kind: str = "single"
+    instance_id: Optional[int] = None
+    status: str
+    attempts: int
+    progress_done: int = 0
+    progress_total: int = 0
+    error: str = ""
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class ImportJobResp(BaseModel):
+    id: int
+    status: str
+    attempts: int
+    progress_done: int = 0  # data rows processed so far
+    progress_total: int = 0
+    imported: int = 0
+    rejected: int = 0  # rows listed in the error report
+    unknown_columns: List[str] = []  # header columns that match no mapped cell (ignored)
+    error: str = ""
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class BatchExportReq(BaseModel):
+    instance_ids: List[int] = []
+    template_id: Optional[int] = None
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+    title_contains: Optional[str] = None
+    format: Literal["zip", "pdf"] = "zip"  # zip of PDFs, or one PDF with a bookmark per instance
+    include_audit: bool = True
+    summarize_audit: bool = False
+
+class CellRef(BaseModel):
+    sheet_name: str = "Sheet1"
+    cell_ref: str
+
+class AggregateReq(BaseModel):
+    cells: List[CellRef] = Field(min_length=1, max_length=50)
+    period: Optional[Literal["day", "week", "month", "year"]] = None  # bucket instances by created_at
+    group_by: Optional[CellRef] = None  # bucket by the text of another cell of the same instance
+    created_from: Optional[datetime] = None
+    created_to: Optional[datetime] = None
+
+class AggregateRow(BaseModel):
+    sheet_name: str
+    cell_ref: str
+    period: Optional[str] = None
+    group: Optional[str] = None
+    count: int  # instances with the cell filled in
+    numeric_count: int  # of those, values stored as numbers (behind sum/avg/min/max)
+    sum: Optional[float] = None
+    avg: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    date_min: Optional[str] = None
+    date_max: Optional[str] = None
+
+class AggregateResp(BaseModel):
+    rows: List[AggregateRow]
@@ -1,4 +1,4 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 
@@ -10,14 +10,21 @@ def hash_password(p: str) -> str:
 def verify_password(p: str, hashed: str) -> bool:
     return pwd_context.verify(p, hashed)
 
-def create_access_token(subject: str, secret: str, expires_minutes: int = 60*24) -> str:
-    now = datetime.utcnow()
+def create_access_token(subject: str, secret: str, expires_minutes: int = 60*24, user_id: int | None = None, role: str | None = None) -> str:
+    now = datetime.now(timezone.utc)
     payload = {"sub": subject, "iat": int(now.timestamp()), "exp": int((now + timedelta(minutes=expires_minutes)).timestamp())}
+    if user_id is not None and role is not None:
+        payload.update(uid=user_id, role=role)
     return jwt.encode(payload, secret, algorithm="HS256")
 
-def decode_token(token: str, secret: str) -> str:
+def decode_claims(token: str, secret: str) -> dict:
     try:
         payload = jwt.decode(token, secret, algorithms=["HS256"])
-        return payload["sub"]
     except JWTError as e:
         raise ValueError("Invalid token") from e
+    if "sub" not in payload:
+        raise ValueError("Invalid token")
+    return payload
+
+def decode_token(token: str, secret: str) -> str:
+    return decode_claims(token, secret)["sub"]
@@ -0,0 +1,75 @@
+"""Compact per-sheet JSON snapshots of a template, built once at upload.
+
+The editor used to download the whole workbook and parse it in the browser.
+Instead, each sheet is reduced to its used range: a dense grid of display
+values (formula cells carry their cached result), the formulas themselves,
+merged ranges and column widths. Every sheet is stored gzipped as its own
+blob, so the client fetches the small index first and then sheets on demand.
+The index is kept on ``Template.snapshot_json``; the mapped-cell overlay is
+added when it is served, since mappings change after upload.
+"""
+import gzip, io, json
+from datetime import date, datetime, time
+from .blobstore import put_blob
+
+SNAPSHOT_VERSION = 1
+
+def _plain(v):
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    return str(v)
+
+def _sheet(ws, cached_ws) -> dict:
+    from openpyxl.utils import get_column_letter
+    grid, formulas = [], {}
+    max_col = used_rows = 0
+    for row, cached_row in zip(ws.iter_rows(), cached_ws.iter_rows(values_only=True)):
+        out, used = [], 0
+        for i, (cell, cached) in enumerate(zip(row, cached_row), 1):
+            v = cell.value
+            if isinstance(v, str) and v.startswith("="):
+                formulas[cell.coordinate] = v
+                v = cached
+                used = i  # keep formula cells inside the used range even without a cached result
+            elif v is not None:
+                used = i
+            out.append(_plain(v))
+        del out[used:]
+        max_col = max(max_col, used)
+        grid.append(out)
+        if used:
+            used_rows = len(grid)
+    del grid[used_rows:]
+    widths = {}
+    for dim in ws.column_dimensions.values():
+        if dim.width and not dim.hidden:
+            for idx in range(dim.min or 0, (dim.max or 0) + 1):
+                if 0 < idx <= max(max_col, 1):
+                    widths[get_column_letter(idx)] = round(dim.width, 2)
+    return {
+        "name": ws.title,
+        "rows": len(grid),
+        "cols": max_col,
+        "values": grid,
+        "formulas": formulas,
+        "merged": [str(r) for r in ws.merged_cells.ranges],
+        "col_widths": widths,
+    }
+
+def _gz_json(obj) -> bytes:
+    return gzip.compress(json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode(), compresslevel=6, mtime=0)
+
+def build_snapshot(xlsx_bytes: bytes) -> str:
+    """Store one gzipped JSON blob per sheet and return the index as a JSON string."""
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(xlsx_bytes))
+    cached = load_workbook(io.BytesIO(xlsx_bytes), data_only=True)
+    sheets = []
+    for i, ws in enumerate(wb.worksheets):
+        sheet = _sheet(ws, cached[ws.title])
+        sheets.append({"index": i, "name": sheet["name"], "rows": sheet["rows"], "cols": sheet["cols"],
+                       "sha256": put_blob(_gz_json(sheet))})
+    active = wb.worksheets.index(wb.active) if wb.active in wb.worksheets else 0
+    return json.dumps({"version": SNAPSHOT_VERSION, "active": active, "sheets": sheets})
@@ -1,13 +1,16 @@
-import os, tempfile, subprocess, shutil
-from typing import Tuple
-from openpyxl import load_workbook
-from openpyxl.utils import coordinate_from_string
-from pypdf import PdfReader, PdfWriter
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+import os, shutil, tempfile
+from typing import Iterable, Tuple
 from io import BytesIO
+from . import converter, metrics
+from .config import get_settings
+from .xlsxpatch import patch_values
 
+# openpyxl, pypdf and reportlab (auditpdf) are imported where they are used: they account for a
+# good part of the API's import time, and most processes (or cold starts) never export.
+
+@metrics.timed("convert_to_xlsx")
 def convert_to_xlsx(input_bytes: bytes, filename: str) -> Tuple[bytes, str]:
+    metrics.payload("upload", input_bytes)
     # If already xlsx, return
     if filename.lower().endswith(".xlsx"):
         return input_bytes, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -18,76 +21,98 @@ def convert_to_xlsx(input_bytes: bytes, filename: str) -> Tuple[bytes, str]:
         with open(inp, "wb") as f:
             f.write(input_bytes)
 
-        subprocess.check_call([
-            "soffice", "--headless", "--nologo", "--nolockcheck", "--nodefault", "--norestore",
-            "--convert-to", "xlsx", "--outdir", td, inp
-        ])
-        out = os.path.join(td, os.path.splitext(os.path.basename(filename))[0] + ".xlsx")
+        out = converter.convert(inp, td, "xlsx")
         with open(out, "rb") as f:
             data = f.read()
         return data, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
+@metrics.timed("fill_values")
 def fill_values(template_xlsx: bytes, values: list[dict]) -> bytes:
-    # values: [{sheet_name, cell_ref, value}]
+    # values: [{sheet_name, cell_ref, value, data_type?}]
+    if get_settings().FILL_ENGINE == "xml":
+        try:
+            return metrics.payload("filled_xlsx", patch_values(template_xlsx, values))
+        except (ValueError, KeyError):
+            pass  # workbook layout the XML patcher doesn't handle
+    return metrics.payload("filled_xlsx", fill_values_openpyxl(template_xlsx, values))
+
+@metrics.timed("fill_values")
+def fill_values_file(template_path: str, values: list[dict], out_path: str) -> str:
+    """``fill_values`` from a workbook on disk to ``out_path``."""
+    if get_settings().FILL_ENGINE == "xml":
+        try:
+            return metrics.payload_file("filled_xlsx", patch_values(template_path, values, out_path))
+        except (ValueError, KeyError):
+            pass
+    from openpyxl import load_workbook
+    wb = load_workbook(template_path)
+    _apply(wb, values)
+    wb.save(out_path)
+    return metrics.payload_file("filled_xlsx", out_path)
+
+def _apply(wb, values: list[dict]):
+    for item in values:
+        ws = wb[item["sheet_name"]] if item["sheet_name"] in wb.sheetnames else wb.active
+        ws[item["cell_ref"]] = item["value"]
+
+def fill_values_openpyxl(template_xlsx: bytes, values: list[dict]) -> bytes:
+    from openpyxl import load_workbook
     with tempfile.TemporaryDirectory() as td:
         path = os.path.join(td, "workbook.xlsx")
         with open(path, "wb") as f:
             f.write(template_xlsx)
 
         wb = load_workbook(path)
-        for item in values:
-            ws = wb[item["sheet_name"]] if item["sheet_name"] in wb.sheetnames else wb.active
-            ws[item["cell_ref"]] = item["value"]
+        _apply(wb, values)
         wb.save(path)
         with open(path, "rb") as f:
             return f.read()
 
+@metrics.timed("xlsx_to_pdf")
 def xlsx_to_pdf(xlsx_bytes: bytes) -> bytes:
     with tempfile.TemporaryDirectory() as td:
         xlsx_path = os.path.join(td, "filled.xlsx")
         with open(xlsx_path, "wb") as f:
             f.write(xlsx_bytes)
 
-        subprocess.check_call([
-            "soffice", "--headless", "--nologo", "--nolockcheck", "--nodefault", "--norestore",
-            "--convert-to", "pdf", "--outdir", td, xlsx_path
-        ])
-        pdf_path = os.path.join(td, "filled.pdf")
+        pdf_path = converter.convert(xlsx_path, td, "pdf")
         with open(pdf_path, "rb") as f:
-            return f.read()
+            return metrics.payload("pdf_main", f.read())
 
-def build_audit_pdf(audit_rows: list[dict]) -> bytes:
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    w, h = A4
-    y = h - 50
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(50, y, "Trilha de Auditoria")
-    y -= 25
-    c.setFont("Helvetica", 9)
-    headers = ["Data/Hora (UTC)", "Usuário", "Evento", "Planilha", "Célula", "De", "Para"]
-    c.drawString(50, y, " | ".join(headers))
-    y -= 15
-    c.line(50, y, w-50, y)
-    y -= 15
-
-    for r in audit_rows:
-        line = f'{r.get("created_at","")} | {r.get("user_email","")} | {r.get("event_type","")} | {r.get("sheet_name","")} | {r.get("cell_ref","")} | {str(r.get("old_value",""))[:25]} | {str(r.get("new_value",""))[:25]}'
-        c.drawString(50, y, line)
-        y -= 12
-        if y < 60:
-            c.showPage()
-            y = h - 50
-            c.setFont("Helvetica-Bold", 14)
-            c.drawString(50, y, "Trilha de Auditoria (continuação)")
-            y -= 25
-            c.setFont("Helvetica", 9)
-
-    c.showPage()
-    c.save()
-    return buf.getvalue()
+@metrics.timed("xlsx_to_pdf")
+def xlsx_file_to_pdf(xlsx_path: str, out_dir: str) -> str:
+    """Convert a workbook on disk; returns the PDF's path in ``out_dir``."""
+    return metrics.payload_file("pdf_main", converter.convert(xlsx_path, out_dir, "pdf"))
+
+@metrics.timed("build_audit_pdf")
+def build_audit_pdf(audit_rows: Iterable[dict], summarize: bool = False) -> bytes:
+    from .auditpdf import spooled_audit_pdf
+    with spooled_audit_pdf(audit_rows, summarize) as f:
+        return metrics.payload("pdf_audit", f.read())
+
+@metrics.timed("build_audit_pdf")
+def build_audit_pdf_file(audit_rows: Iterable[dict], out_path: str, summarize: bool = False) -> str:
+    from .auditpdf import spooled_audit_pdf
+    with spooled_audit_pdf(audit_rows, summarize) as f, open(out_path, "wb") as out:
+        shutil.copyfileobj(f, out, 1 << 20)
+    return metrics.payload_file("pdf_audit", out_path)
+
+@metrics.timed("merge_pdf_with_audit")
+def merge_pdf_files(main_path: str, audit_path: str, out_path: str) -> str:
+    """Append the audit PDF to the main one, on disk: the readers parse objects from the files on demand."""
+    from pypdf import PdfReader, PdfWriter
+    w = PdfWriter()
+    with open(main_path, "rb") as f1, open(audit_path, "rb") as f2:
+        for reader in (PdfReader(f1), PdfReader(f2)):
+            for p in reader.pages:
+                w.add_page(p)
+        with open(out_path, "wb") as out:
+            w.write(out)
+    return metrics.payload_file("pdf_merged", out_path)
 
+@metrics.timed("merge_pdf_with_audit")
 def merge_pdf_with_audit(pdf_main: bytes, pdf_audit: bytes) -> bytes:
+    from pypdf import PdfReader, PdfWriter
     r1 = PdfReader(BytesIO(pdf_main))
     r2 = PdfReader(BytesIO(pdf_audit))
     w = PdfWriter()
@@ -97,4 +122,4 @@ def merge_pdf_with_audit(pdf_main: bytes, pdf_audit: bytes) -> bytes:
         w.add_page(p)
     out = BytesIO()
     w.write(out)
-    return out.getvalue()
+    return metrics.payload("pdf_merged", out.getvalue())
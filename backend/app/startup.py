@@ -0,0 +1,104 @@
+"""Startup timing, background warm-up and the state behind /healthz and /readyz.
+
+Phases are in seconds. ``migrate`` and ``launch`` (interpreter and uvicorn up to
+the import of app.main) come from the timestamps scripts/start.sh exports,
+``import`` is app.main's own import and ``startup`` its startup hooks. With
+PREWARM on, a background thread then opens PREWARM_DB_CONNECTIONS pooled
+connections, imports the spreadsheet/PDF libraries the routes load lazily and
+starts the LibreOffice workers, one ``prewarm_*`` phase each, so the first
+export after a cold start does not pay for them; the process reports ready once
+that finished. ``total`` runs from the container start (or the import) to ready.
+The phases are logged, observed in planilhex_startup_seconds and returned by
+/readyz.
+"""
+import json, logging, os, threading, time
+from contextlib import contextmanager
+from sqlalchemy import text
+from . import metrics
+from .config import get_settings
+
+log = logging.getLogger("planilhex.startup")
+
+phases: dict[str, float] = {}
+_origin = time.time()  # replaced by the container start time when start.sh provides it
+_warm = threading.Event()
+
+def record(name: str, seconds: float):
+    phases[name] = round(seconds, 3)
+    metrics.STARTUP_SECONDS.observe(seconds, phase=name)
+
+@contextmanager
+def phase(name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t)
+
+def record_launch(import_started: float):
+    """``migrate`` and ``launch`` from start.sh's wall-clock timestamps; absent when started another way."""
+    global _origin
+    _origin = import_started
+    try:
+        started = float(os.environ["PLANILHEX_START_TIME"])
+        migrated = float(os.environ["PLANILHEX_MIGRATED_TIME"])
+    except (KeyError, ValueError):
+        return
+    _origin = started
+    record("migrate", migrated - started)
+    record("launch", import_started - migrated)
+
+def _warm_db():
+    from .db import engine
+    conns = []
+    try:
+        for _ in range(max(get_settings().PREWARM_DB_CONNECTIONS, 1)):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()  # back to the pool, connected
+
+def _warm_imports():
+    import openpyxl, pypdf  # noqa: F401
+    from . import auditpdf, recalc  # noqa: F401  (reportlab)
+
+def _warm_soffice():
+    from .converter import get_pool
+    get_pool().warm()
+
+def _prewarm():
+    for name, step in (("prewarm_db", _warm_db), ("prewarm_imports", _warm_imports), ("prewarm_soffice", _warm_soffice)):
+        try:
+            with phase(name):
+                step()
+        except Exception:
+            log.exception("startup: %s failed, continuing", name)
+    _ready()
+
+def _ready():
+    record("total", time.time() - _origin)
+    _warm.set()
+    log.info("startup phases (s): %s", json.dumps(phases))
+
+def finish():
+    """Called by the last startup hook: starts the warm-up, or marks the process ready without it."""
+    if get_settings().PREWARM:
+        threading.Thread(target=_prewarm, name="prewarm", daemon=True).start()
+    else:
+        _ready()
+
+def readiness() -> tuple[bool, dict]:
+    """(ready, body): the database answers and the warm-up, if any, has finished; also names the converter mode."""
+    from .db import engine
+    from .converter import MODE
+    checks = {"prewarm": "done" if _warm.is_set() else "running", "converter": MODE}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"unavailable: {type(e).__name__}"
+    ok = checks["database"] == "ok" and _warm.is_set()
+    return ok, {"status": "ready" if ok else "starting", "checks": checks, "startup": phases}
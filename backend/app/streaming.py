@@ -0,0 +1,120 @@
+"""Binary download responses with ETag, single-range and optional gzip support."""
+import gzip, hashlib, json, shutil
+from typing import Callable
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+
+CHUNK_SIZE = 64 * 1024
+# ``compress`` only applies to these; workbooks (xlsx, ods) are zip archives already
+COMPRESSIBLE_TYPES = ("application/json", "application/pdf")
+
+def _chunks(data: bytes, start: int, end: int):
+    view = memoryview(data)
+    for i in range(start, end, CHUNK_SIZE):
+        yield bytes(view[i:min(i + CHUNK_SIZE, end)])
+
+def _parse_range(header: str, size: int):
+    """Return (start, end_exclusive) for a single ``bytes=`` range, None if unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        return None
+    return start, min(end, size)
+
+def send_bytes(
+    request: Request,
+    data: bytes | Callable[[], bytes],
+    media_type: str,
+    filename: str,
+    etag: str | None = None,
+    compress: bool = False,
+    gzipped: bool = False,
+) -> Response:
+    """``data`` may be a loader, called only when the client's cached copy is stale (requires ``etag``).
+
+    ``gzipped`` marks ``data`` as already gzip-compressed: it is sent as-is to clients that accept
+    gzip and decompressed for the rest. ``compress`` is ignored outside COMPRESSIBLE_TYPES.
+    """
+    compress = compress and media_type in COMPRESSIBLE_TYPES
+    if etag is None:
+        data = data() if callable(data) else data
+        etag = hashlib.sha256(data).hexdigest()[:32]
+    etag = f'"{etag}"'
+    gz_etag = etag[:-1] + '-gz"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "private, no-cache",
+    }
+    if compress or gzipped:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in if_none_match or gz_etag in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    if callable(data):
+        data = data()
+    if gzipped:
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            headers.pop("Accept-Ranges")
+            headers.update({"Content-Encoding": "gzip", "ETag": gz_etag, "Content-Length": str(len(data))})
+            return StreamingResponse(_chunks(data, 0, len(data)), media_type=media_type, headers=headers)
+        data = gzip.decompress(data)
+    size = len(data)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        rng = _parse_range(range_header, size)
+        if rng is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(_chunks(data, start, end), status_code=206, media_type=media_type, headers=headers)
+
+    if compress and "gzip" in request.headers.get("accept-encoding", ""):
+        data = gzip.compress(data, compresslevel=6)
+        size = len(data)
+        headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = gz_etag
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_chunks(data, 0, size), media_type=media_type, headers=headers)
+
+def send_scratch_file(path: str, scratch: str, media_type: str, filename: str) -> FileResponse:
+    """Stream a file from an export's scratch directory (Range included) and remove the directory afterwards."""
+    return FileResponse(path, media_type=media_type, filename=filename,
+                        background=BackgroundTask(shutil.rmtree, scratch, ignore_errors=True))
+
+def _hex_json(path: str, filename: str, scratch: str | None):
+    try:
+        yield b'{"filename": ' + json.dumps(filename).encode() + b', "pdf_hex": "'
+        with open(path, "rb") as f:
+            while block := f.read(CHUNK_SIZE):
+                yield block.hex().encode()
+        yield b'"}'
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+def send_hex_json(path: str, scratch: str | None, filename: str) -> StreamingResponse:
+    """The legacy ``{filename, pdf_hex}`` body, hex-encoded block by block from the file.
+
+    ``scratch`` is removed afterwards; pass None to keep the file (job results).
+    """
+    return StreamingResponse(_hex_json(path, filename, scratch), media_type="application/json")
@@ -0,0 +1,90 @@
+"""Validation and typed shadows of instance values.
+
+``InstanceValue.value`` keeps exactly what the operator typed. Cells mapped as
+``number`` or ``date`` also get the parsed value in ``num_value`` /
+``date_value`` when they are written, so reports aggregate in SQL instead of
+parsing strings in Python. A save batch is coerced in one pass: repeated
+strings are parsed once, plain decimals skip the locale-aware parser, and every
+invalid cell is reported together rather than failing on the first one.
+"""
+import math, re
+from datetime import datetime
+
+_PLAIN_NUMBER = re.compile(r"[+-]?\d+(?:\.\d+)?")
+_DECIMAL = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?")
+_GROUPED_DOT = re.compile(r"[+-]?\d{1,3}(?:\.\d{3})+(?:,\d+)?")  # 1.234.567 / 1.234,56
+_GROUPED_COMMA = re.compile(r"[+-]?\d{1,3}(?:,\d{3})+(?:\.\d+)?")  # 1,234,567 / 1,234.56
+_DATE_FORMATS = ("%d/%m/%Y", "%d/%m/%Y %H:%M")
+TYPES = ("text", "number", "date")
+
+def _unlocalize(v: str) -> str:
+    if _GROUPED_DOT.fullmatch(v) and (v.count(".") > 1 or "," in v):
+        return v.replace(".", "").replace(",", ".")
+    if _GROUPED_COMMA.fullmatch(v) and (v.count(",") > 1 or "." in v):
+        return v.replace(",", "")
+    if v.count(",") == 1 and "." not in v:
+        return v.replace(",", ".")
+    return v
+
+def parse_number(value: str) -> float | None:
+    """A finite float from an operator-typed number, or None.
+
+    A lone comma is the decimal separator (``"1234,56"``). A separator followed by groups of
+    three digits and then the other separator is grouping: ``"1.234,56"`` and ``"1,234.56"`` are
+    both 1234.56, as are several of the same (``"1.234.567"``). Spaces are ignored and exponents
+    accepted; NaN, infinities and anything that overflows are not numbers.
+    """
+    v = value.strip().replace(" ", "").replace("\u00a0", "")
+    if not _PLAIN_NUMBER.fullmatch(v):
+        v = _unlocalize(v)
+        if not _DECIMAL.fullmatch(v):
+            return None
+    n = float(v)
+    return n if math.isfinite(n) else None
+
+def parse_date(value: str) -> datetime | None:
+    """ISO 8601 or pt-BR ``dd/mm/yyyy[ HH:MM]``, naive (an offset is dropped, not applied)."""
+    v = value.strip()
+    try:
+        d = datetime.fromisoformat(v)
+    except ValueError:
+        for fmt in _DATE_FORMATS:
+            try:
+                d = datetime.strptime(v, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    return d.replace(tzinfo=None)
+
+def coerce_value(value: str, data_type: str) -> tuple[float | None, datetime | None, bool]:
+    """(num_value, date_value, valid) for one stored string."""
+    v = (value or "").strip()
+    if not v or data_type not in ("number", "date"):
+        return None, None, True
+    if data_type == "number":
+        n = parse_number(v)
+        return n, None, n is not None
+    d = parse_date(v)
+    return None, d, d is not None
+
+def coerce_batch(items: list[dict], types: dict) -> tuple[list[dict], list[dict]]:
+    """Add ``num_value``/``date_value`` to ``{sheet_name, cell_ref, value}`` items per their mapped type.
+
+    Returns (items, errors); each error names the cell, its expected type and the rejected value.
+    """
+    memo: dict[tuple, tuple] = {}
+    out, errors = [], []
+    for item in items:
+        data_type = types.get((item["sheet_name"], item["cell_ref"].upper()), "text")
+        key = (data_type, item["value"])
+        parsed = memo.get(key)
+        if parsed is None:
+            parsed = memo[key] = coerce_value(item["value"], data_type)
+        num, date, valid = parsed
+        if not valid:
+            errors.append({"sheet_name": item["sheet_name"], "cell_ref": item["cell_ref"], "data_type": data_type,
+                           "value": item["value"]})
+        out.append({**item, "num_value": num, "date_value": date})
+    return out, errors
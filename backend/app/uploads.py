@@ -0,0 +1,91 @@
+"""Template uploads: conversion to xlsx, deduplication and background processing.
+
+Every template records the SHA-256 of the file as uploaded (``source_sha256``).
+Uploading bytes that were already processed reuses that template's converted
+workbook and snapshot, so LibreOffice and the snapshot builder run once per
+distinct file and the results share storage through the blob store. Files that
+need conversion and are larger than TEMPLATE_BACKGROUND_BYTES are stored as-is
+and converted by a ``convert`` job; the template stays ``processing`` (and is
+refused by the routes that read its workbook) until the job marks it ``ready``,
+or ``failed`` if the file cannot be turned into a workbook.
+"""
+import json
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, undefer
+from .config import get_settings
+from .models import Template, ExportJob
+from .blobstore import put_blob, load_blob, sha256_hex
+from .spreadsheet import convert_to_xlsx
+from .snapshot import build_snapshot
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+class WorkbookError(ValueError):
+    """The upload converted (or was xlsx) but is not a usable workbook."""
+
+def needs_conversion(filename: str) -> bool:
+    return not filename.lower().endswith(".xlsx")
+
+def find_processed(db: Session, source_sha256: str) -> Template | None:
+    return db.scalars(
+        select(Template).options(undefer(Template.snapshot_json))
+        .where(Template.source_sha256 == source_sha256, Template.status == "ready").limit(1)
+    ).first()
+
+def process(raw: bytes, filename: str) -> dict:
+    """Convert and snapshot an upload; returns the Template fields it determines."""
+    xlsx_bytes, mime = convert_to_xlsx(raw, filename)
+    try:
+        snapshot_json = build_snapshot(xlsx_bytes)
+    except Exception as e:
+        raise WorkbookError("Could not read the workbook") from e
+    if not json.loads(snapshot_json)["sheets"]:
+        raise WorkbookError("The workbook has no worksheets")
+    return {"mime_type": mime, "file_sha256": put_blob(xlsx_bytes), "file_size": len(xlsx_bytes),
+            "snapshot_json": snapshot_json}
+
+def _reused(tpl: Template) -> dict:
+    return {"mime_type": tpl.mime_type, "file_sha256": tpl.file_sha256, "file_size": tpl.file_size,
+            "snapshot_json": tpl.snapshot_json}
+
+def create_template(db: Session, name: str, filename: str, raw: bytes, user_id: int) -> Template:
+    """Create the template for an upload: reused, processed inline, or queued for a convert job."""
+    source = sha256_hex(raw)
+    fields = {"name": name, "original_filename": filename, "source_sha256": source, "created_by": user_id}
+    done = find_processed(db, source)
+    if done is not None:
+        tpl = Template(**fields, **_reused(done))
+    elif needs_conversion(filename) and len(raw) > get_settings().TEMPLATE_BACKGROUND_BYTES:
+        put_blob(raw)  # the job converts it from the blob store, keyed by source_sha256
+        tpl = Template(**fields, mime_type=XLSX_MIME, file_sha256="", status="processing")
+    else:
+        tpl = Template(**fields, **process(raw, filename))
+    db.add(tpl)
+    db.flush()
+    if tpl.status == "processing":
+        db.add(ExportJob(kind="convert", user_id=user_id, params_json=json.dumps({"template_id": tpl.id}),
+                         max_attempts=get_settings().EXPORT_MAX_ATTEMPTS))
+    db.commit()
+    db.refresh(tpl)
+    return tpl
+
+def set_failed(db: Session, template_id: int, error: str):
+    db.execute(update(Template).where(Template.id == template_id, Template.status == "processing")
+               .values(status="failed", error=error[:2000]))
+    db.commit()
+
+def run_conversion(db: Session, job: ExportJob):
+    """Body of a ``convert`` job. Conversion errors propagate so the job is retried."""
+    tpl = db.get(Template, json.loads(job.params_json)["template_id"])
+    if tpl is None or tpl.status != "processing":
+        return
+    done = find_processed(db, tpl.source_sha256)  # an identical upload may have finished meanwhile
+    if done is not None:
+        fields = _reused(done)
+    else:
+        try:
+            fields = process(load_blob(tpl.source_sha256), tpl.original_filename)
+        except WorkbookError as e:
+            set_failed(db, tpl.id, str(e))  # retrying will not make the file readable
+            return
+    db.execute(update(Template).where(Template.id == tpl.id).values(status="ready", error="", **fields))
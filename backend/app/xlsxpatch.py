@@ -0,0 +1,308 @@
+"""Fill cells in an .xlsx by patching the sheet XML inside the zip.
+
+Only the worksheets that receive values (plus the shared string table and the
+workbook's calc settings) are rewritten; every other member is copied through
+unchanged, so features openpyxl would drop on a load/save round trip survive.
+Formula cached values are stripped and the workbook is flagged for a full
+recalculation on open, so LibreOffice/Excel never show stale totals.
+"""
+import copy, re, shutil, zipfile
+from datetime import datetime
+from html import unescape
+from io import BytesIO
+from xml.sax.saxutils import escape
+from .typed import parse_number, parse_date
+
+_ATTR = re.compile(r'([\w:]+)="([^"]*)"')
+_SHEET = re.compile(r"<sheet\b([^>]*)/?>")
+_REL = re.compile(r"<Relationship\b([^>]*)/?>")
+_SHEET_DATA = re.compile(r"<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>", re.S)
+_ROW = re.compile(r"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+_CELL = re.compile(r"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_FORMULA_CELL = re.compile(r"(<c\b[^>]*(?<!/)>)((?:(?!</c>).)*?<f\b(?:(?!</c>).)*?)</c>", re.S)
+_CACHED_VALUE = re.compile(r"<v>.*?</v>|<v\s*/>", re.S)
+_SI = re.compile(r"<si\b")
+_EMPTY_SST = re.compile(r"<sst\b([^>]*?)\s*/>")
+_CELL_XFS = re.compile(r"<cellXfs\b[^>]*>(.*?)</cellXfs>", re.S)
+_XF = re.compile(r"<xf\b([^>]*?)(/>|>.*?</xf>)", re.S)
+_NUM_FMT = re.compile(r"<numFmt\b([^>]*)/>")
+_DATE_CODE = re.compile(r"[dmyhs]", re.I)
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+EPOCH_1900 = datetime(1899, 12, 30)
+EPOCH_1904 = datetime(1904, 1, 1)
+
+def _attrs(s: str) -> dict:
+    return {k: unescape(v) for k, v in _ATTR.findall(s)}
+
+def _xml_text(value: str) -> str:
+    return escape(_INVALID_XML_CHARS.sub("", value))
+
+def _number_text(value: str) -> str | None:
+    """``<v>`` text for a number cell; None (written as a string) unless it parses to a finite number."""
+    n = parse_number(value)
+    if n is None:
+        return None
+    return repr(int(n)) if n.is_integer() and abs(n) < 1e15 else repr(n)
+
+def _date_serial(d: datetime, date1904: bool) -> str:
+    delta = d.replace(tzinfo=None) - (EPOCH_1904 if date1904 else EPOCH_1900)
+    serial = delta.days + delta.seconds / 86400
+    return repr(int(serial)) if serial.is_integer() else repr(serial)
+
+def _col(cell_ref: str) -> int:
+    from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+    return column_index_from_string(coordinate_from_string(cell_ref)[0])
+
+class _SharedStrings:
+    def __init__(self, xml: str | None):
+        self.xml = xml
+        self.count = len(_SI.findall(xml)) if xml else 0
+        self.added: list[str] = []
+        self._index: dict[str, int] = {}
+
+    @property
+    def available(self) -> bool:
+        return self.xml is not None
+
+    def add(self, text: str) -> int:
+        if text not in self._index:
+            self._index[text] = self.count + len(self.added)
+            self.added.append(text)
+        return self._index[text]
+
+    def render(self) -> str:
+        items = "".join(f'<si><t xml:space="preserve">{_xml_text(t)}</t></si>' for t in self.added)
+        total = self.count + len(self.added)
+        # an empty table may be written self-closing (LibreOffice does): open it up to append to it
+        xml = _EMPTY_SST.sub(r"<sst\1></sst>", self.xml, count=1).replace("</sst>", items + "</sst>")
+        head_end = xml.index(">", xml.index("<sst"))
+        head = re.sub(r'\s(count|uniqueCount)="\d+"', "", xml[:head_end])
+        return head + f' count="{total}" uniqueCount="{total}"' + xml[head_end:]
+
+class _Styles:
+    """Gives date-typed cells a date number format when their current style has none."""
+    def __init__(self, xml: str | None):
+        self.xml = xml
+        self.modified = False
+        self._date_xf: dict[str, str] = {}
+        if xml is None:
+            return
+        m = _CELL_XFS.search(xml)
+        self.xfs = list(_XF.finditer(m.group(1))) if m else []
+        self.added: list[str] = []
+        custom = {}
+        for nm in _NUM_FMT.finditer(xml):
+            a = _attrs(nm.group(1))
+            custom[int(a.get("numFmtId", -1))] = a.get("formatCode", "")
+        # strip quoted literals and [colour] tokens before looking for date letters
+        self.custom_dates = {i for i, code in custom.items() if _DATE_CODE.search(re.sub(r'"[^"]*"|\[[^\]]*\]', "", code))}
+
+    def _is_date(self, xf_attrs: str) -> bool:
+        fmt = int(_attrs(xf_attrs).get("numFmtId", 0))
+        return fmt in BUILTIN_DATE_FORMATS or fmt in self.custom_dates
+
+    def date_style(self, style: str | None) -> str | None:
+        if self.xml is None or not self.xfs:
+            return style
+        key = style or "0"
+        if key in self._date_xf:
+            return self._date_xf[key]
+        idx = int(key)
+        base = self.xfs[idx] if idx < len(self.xfs) else self.xfs[0]
+        if self._is_date(base.group(1)):
+            result = style
+        else:
+            attrs = re.sub(r'\s(numFmtId|applyNumberFormat)="[^"]*"', "", base.group(1))
+            self.added.append(f'<xf{attrs} numFmtId="14" applyNumberFormat="1"{base.group(2)}')
+            result = str(len(self.xfs) + len(self.added) - 1)
+            self.modified = True
+        self._date_xf[key] = result
+        return result
+
+    def render(self) -> str:
+        m = _CELL_XFS.search(self.xml)
+        total = len(self.xfs) + len(self.added)
+        open_tag = re.sub(r'\scount="\d+"', "", self.xml[m.start():m.start(1)])
+        return (self.xml[:m.start()] + open_tag[:-1] + f' count="{total}">' + m.group(1) + "".join(self.added)
+                + "</cellXfs>" + self.xml[m.end():])
+
+class _Workbook:
+    def __init__(self, zf: zipfile.ZipFile):
+        names = set(zf.namelist())
+        wb_xml = zf.read("xl/workbook.xml").decode("utf-8")
+        rels_xml = zf.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+        targets = {}
+        for m in _REL.finditer(rels_xml):
+            a = _attrs(m.group(1))
+            target = a.get("Target", "")
+            targets[a.get("Id")] = target.lstrip("/") if target.startswith("/") else "xl/" + target
+        self.sheets: dict[str, str] = {}
+        for m in _SHEET.finditer(wb_xml):
+            a = _attrs(m.group(1))
+            rid = next((v for k, v in a.items() if k.endswith(":id")), None)
+            if rid in targets:
+                self.sheets[a["name"]] = targets[rid]
+        active = re.search(r'<workbookView\b[^>]*\bactiveTab="(\d+)"', wb_xml)
+        order = list(self.sheets)
+        self.active = order[int(active.group(1))] if active and int(active.group(1)) < len(order) else order[0]
+        self.date1904 = bool(re.search(r'<workbookPr\b[^>]*\bdate1904="(1|true)"', wb_xml))
+        self.wb_xml = wb_xml
+        self.rels_xml = rels_xml
+        self.has_calc_chain = "xl/calcChain.xml" in names
+        self.sst_path = "xl/sharedStrings.xml" if "xl/sharedStrings.xml" in names else None
+        self.styles_path = "xl/styles.xml" if "xl/styles.xml" in names else None
+
+    def recalc_workbook_xml(self) -> str:
+        m = re.search(r"<calcPr\b([^>]*?)(/?)>", self.wb_xml)
+        if m:
+            attrs = re.sub(r'\sfullCalcOnLoad="[^"]*"', "", m.group(1))
+            return self.wb_xml[:m.start()] + f'<calcPr{attrs} fullCalcOnLoad="1"{m.group(2)}>' + self.wb_xml[m.end():]
+        xml = self.wb_xml
+        calc = '<calcPr calcId="191029" fullCalcOnLoad="1"/>'
+        # calcPr must precede these elements per the schema
+        m = re.search(r"<(oleSize|customWorkbookViews|pivotCaches|smartTagPr|smartTagTypes|webPublishing|fileRecoveryPr|webPublishObjects|extLst)\b", xml)
+        if m:
+            return xml[:m.start()] + calc + xml[m.start():]
+        return xml.replace("</workbook>", calc + "</workbook>")
+
+def _cell_xml(ref: str, style: str | None, value: str, data_type: str, sst: _SharedStrings, styles: _Styles, date1904: bool) -> str:
+    s = f' s="{style}"' if style is not None else ""
+    if value == "":
+        return f'<c r="{ref}"{s}/>'
+    if data_type == "number":
+        n = _number_text(value)
+        if n is not None:
+            return f'<c r="{ref}"{s}><v>{n}</v></c>'
+    elif data_type == "date":
+        d = parse_date(value)
+        if d is not None:
+            style = styles.date_style(style)
+            s = f' s="{style}"' if style is not None else ""
+            return f'<c r="{ref}"{s}><v>{_date_serial(d, date1904)}</v></c>'
+    if sst.available:
+        return f'<c r="{ref}"{s} t="s"><v>{sst.add(value)}</v></c>'
+    return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{_xml_text(value)}</t></is></c>'
+
+def _patch_row(row_attrs: str, body: str | None, cells: dict) -> str | None:
+    """``cells`` maps cell ref -> render(style); existing cells keep their style."""
+    existing = []
+    for m in _CELL.finditer(body or ""):
+        a = _attrs(m.group(1))
+        existing.append((a.get("r"), a.get("s"), m.group(0)))
+    out = {}
+    for ref, style, xml in existing:
+        if ref is None:
+            return None  # cells without explicit refs: let the caller fall back
+        out[ref] = xml
+    for ref, render in cells.items():
+        style = next((s for r, s, _ in existing if r == ref), None)
+        out[ref] = render(style)
+    attrs = re.sub(r'\sspans="[^"]*"', "", row_attrs)
+    ordered = sorted(out.items(), key=lambda kv: _col(kv[0]))
+    return f"<row{attrs}>" + "".join(x for _, x in ordered) + "</row>"
+
+def _patch_sheet(xml: str, cells: dict) -> str:
+    from openpyxl.utils.cell import coordinate_from_string
+    by_row: dict[int, dict] = {}
+    for ref, render in cells.items():
+        by_row.setdefault(coordinate_from_string(ref)[1], {})[ref] = render
+
+    m = _SHEET_DATA.search(xml)
+    if m is None:
+        raise ValueError("worksheet has no sheetData")
+    body = m.group(1) or ""
+    rows = []
+    for rm in _ROW.finditer(body):
+        r = _attrs(rm.group(1)).get("r")
+        if r is None:
+            raise ValueError("rows without explicit numbers are not supported")
+        rows.append((int(r), rm))
+
+    out = []
+    pending = sorted(by_row)
+    pos = 0
+    for num, rm in rows:
+        while pending and pending[0] < num:
+            n = pending.pop(0)
+            out.append(_patch_row(f' r="{n}"', None, by_row[n]))
+        out.append(body[pos:rm.start()])
+        if pending and pending[0] == num:
+            pending.pop(0)
+            patched = _patch_row(rm.group(1), rm.group(2), by_row[num])
+            if patched is None:
+                raise ValueError("cells without explicit refs are not supported")
+            out.append(patched)
+        else:
+            out.append(rm.group(0))
+        pos = rm.end()
+    out.append(body[pos:])
+    for n in pending:
+        out.append(_patch_row(f' r="{n}"', None, by_row[n]))
+    return xml[:m.start()] + "<sheetData>" + "".join(out) + "</sheetData>" + xml[m.end():]
+
+def _strip_cached_formula_values(xml: str) -> str:
+    return _FORMULA_CELL.sub(lambda m: m.group(1) + _CACHED_VALUE.sub("", m.group(2)) + "</c>", xml)
+
+def patch_values(template_xlsx: bytes | str, values: list[dict], out_path: str | None = None) -> bytes | str:
+    """values: [{sheet_name, cell_ref, value, data_type?}] -> filled workbook bytes.
+
+    ``template_xlsx`` may also be a file path; with ``out_path`` the workbook is written there (and the
+    path returned), copying untouched parts member by member instead of building it in memory.
+    Unknown sheet names go to the active sheet, matching the openpyxl engine.
+    Raises ValueError for sheet XML this patcher does not understand.
+    """
+    src = zipfile.ZipFile(template_xlsx if isinstance(template_xlsx, str) else BytesIO(template_xlsx))
+    wb = _Workbook(src)
+    sst = _SharedStrings(src.read(wb.sst_path).decode("utf-8") if wb.sst_path else None)
+    styles = _Styles(src.read(wb.styles_path).decode("utf-8") if wb.styles_path else None)
+
+    per_sheet: dict[str, dict] = {}
+    for item in values:
+        sheet = item["sheet_name"] if item["sheet_name"] in wb.sheets else wb.active
+        ref = item["cell_ref"].upper()
+        value, data_type = str(item["value"]), item.get("data_type") or "text"
+        per_sheet.setdefault(wb.sheets[sheet], {})[ref] = \
+            lambda style, ref=ref, value=value, data_type=data_type: _cell_xml(ref, style, value, data_type, sst, styles, wb.date1904)
+
+    replaced: dict[str, bytes] = {}
+    for info in src.infolist():
+        if not info.filename.startswith("xl/worksheets/") or not info.filename.endswith(".xml"):
+            continue
+        cells = per_sheet.get(info.filename)
+        raw = src.read(info.filename)
+        if cells is None and b"<f" not in raw:
+            continue
+        xml = raw.decode("utf-8")
+        if cells:
+            xml = _patch_sheet(xml, cells)
+        if "<f" in xml:
+            xml = _strip_cached_formula_values(xml)
+        replaced[info.filename] = xml.encode("utf-8")
+
+    if sst.added:
+        replaced[wb.sst_path] = sst.render().encode("utf-8")
+    if styles.modified:
+        replaced[wb.styles_path] = styles.render().encode("utf-8")
+    replaced["xl/workbook.xml"] = wb.recalc_workbook_xml().encode("utf-8")
+    dropped = set()
+    if wb.has_calc_chain:
+        # the chain may reference cells that no longer hold formulas; Excel rebuilds it
+        dropped.add("xl/calcChain.xml")
+        replaced["xl/_rels/workbook.xml.rels"] = re.sub(r"<Relationship\b[^>]*calcChain[^>]*/>", "", wb.rels_xml).encode("utf-8")
+        ct = src.read("[Content_Types].xml").decode("utf-8")
+        replaced["[Content_Types].xml"] = re.sub(r'<Override\b[^>]*PartName="/xl/calcChain.xml"[^>]*/>', "", ct).encode("utf-8")
+
+    out = out_path or BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename in dropped:
+                continue
+            data = replaced.get(info.filename)
+            if data is not None:
+                dst.writestr(info, data)
+            else:
+                with src.open(info) as part, dst.open(copy.copy(info), "w") as target:
+                    shutil.copyfileobj(part, target, 1 << 20)
+    return out_path or out.getvalue()
@@ -0,0 +1,48 @@
+"""Audit appendix rendering throughput and peak Python memory.
+
+Run from backend/:  python -m benchmarks.audit --events 100000
+"""
+import argparse, random, time, tracemalloc
+from datetime import datetime, timedelta
+from app.auditpdf import write_audit_pdf
+
+def make_events(n: int, cells: int = 200, users: int = 5):
+    rnd = random.Random(42)
+    t = datetime(2024, 1, 1)
+    for i in range(n):
+        t += timedelta(seconds=rnd.randint(1, 30))
+        yield {
+            "created_at": t.isoformat() + "Z",
+            "user_email": f"operator{rnd.randint(1, users)}@example.com",
+            "event_type": "edit" if i % 50 else "save",
+            "sheet_name": "Sheet1",
+            "cell_ref": f"B{rnd.randint(1, cells)}",
+            "old_value": str(rnd.randint(0, 10_000)),
+            "new_value": "observação " * rnd.randint(1, 12),
+        }
+
+class _Sink:
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--events", type=int, default=20_000)
+    p.add_argument("--summarize", action="store_true")
+    a = p.parse_args()
+
+    sink = _Sink()
+    tracemalloc.start()
+    t = time.perf_counter()
+    rows = write_audit_pdf(make_events(a.events), sink, a.summarize)
+    elapsed = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{a.events} events -> {rows} rows, {sink.size / 1e6:.1f} MB PDF")
+    print(f"{a.events / elapsed:,.0f} events/s, peak traced memory {peak / 1e6:.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Stand-in for the LibreOffice pool on machines without soffice.
+
+``install()`` replaces the process-wide converter pool, so everything that goes
+through ``converter.convert`` (template upload, exports) keeps working. PDFs
+get one page per sheet; ``delay`` adds a fixed per-conversion wait to mimic a
+warm LibreOffice worker. Only the current process is affected: background
+export jobs run in spawned workers and still need the real converter.
+"""
+import io, os, shutil, time
+from openpyxl import load_workbook
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+from app import converter
+
+class FakePool:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.conversions = 0
+
+    def convert(self, src: str, out_dir: str, fmt: str) -> str:
+        self.conversions += 1
+        dst = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + "." + fmt)
+        if fmt == "pdf":
+            with open(src, "rb") as f:
+                wb = load_workbook(io.BytesIO(f.read()), read_only=True)
+            c = canvas.Canvas(dst, pagesize=A4, pageCompression=1)
+            for ws in wb.worksheets:
+                c.drawString(40, 800, f"{ws.title}: {ws.max_row} x {ws.max_column}")
+                c.showPage()
+            c.save()
+            wb.close()
+        elif src.lower().endswith(".xlsx"):
+            shutil.copyfile(src, dst)
+        else:
+            raise converter.ConversionError(f"fake converter cannot read {os.path.basename(src)}", "exit_status")
+        if self.delay:
+            time.sleep(self.delay)
+        return dst
+
+    def warm(self):
+        pass
+
+    def shutdown(self, wipe: bool = False):
+        pass
+
+def install(delay: float = 0.0) -> FakePool:
+    pool = FakePool(delay)
+    with converter._pool_lock:
+        converter._pool = pool
+    return pool
@@ -0,0 +1,60 @@
+"""Compare the XML patch fill engine with the openpyxl load/save path.
+
+Run from backend/:  python -m benchmarks.fill --sheets 3 --rows 5000 --cols 20 --mapped 500
+"""
+import argparse, io, random, time
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from app.spreadsheet import fill_values_openpyxl
+from app.xlsxpatch import patch_values
+
+def make_workbook(sheets: int, rows: int, cols: int) -> bytes:
+    wb = Workbook()
+    wb.remove(wb.active)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        for r in range(1, rows + 1):
+            for c in range(1, cols):
+                ws.cell(row=r, column=c, value=r * c if c % 3 else f"t{r}-{c}")
+            ws.cell(row=r, column=cols, value=f"=SUM(A{r}:{get_column_letter(cols - 1)}{r})")
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def make_values(sheets: int, rows: int, cols: int, mapped: int) -> list[dict]:
+    rnd = random.Random(42)
+    values = []
+    for _ in range(mapped):
+        values.append({
+            "sheet_name": f"Sheet{rnd.randint(1, sheets)}",
+            "cell_ref": f"{get_column_letter(rnd.randint(1, cols - 1))}{rnd.randint(1, rows)}",
+            "value": str(rnd.randint(0, 10_000)),
+            "data_type": "number",
+        })
+    return values
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sheets", type=int, default=3)
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=15)
+    p.add_argument("--mapped", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=3)
+    a = p.parse_args()
+
+    xlsx = make_workbook(a.sheets, a.rows, a.cols)
+    values = make_values(a.sheets, a.rows, a.cols, a.mapped)
+    print(f"workbook: {len(xlsx) / 1e6:.1f} MB, {a.sheets}x{a.rows}x{a.cols}, {len(values)} mapped cells")
+    for name, fn in (("xml", lambda: patch_values(xlsx, values)), ("openpyxl", lambda: fill_values_openpyxl(xlsx, values))):
+        print(f"{name:>9}: {bench(fn, a.repeat) * 1000:8.1f} ms (best of {a.repeat})")
+
+if __name__ == "__main__":
+    main()
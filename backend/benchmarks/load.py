@@ -0,0 +1,140 @@
+"""End-to-end load scenarios against the FastAPI app, served in process.
+
+Every virtual user is a thread with its own ``TestClient`` and instance. The
+phases run one after another, all users in parallel within a phase:
+
+    login        POST /auth/login
+    open         GET the instance values, the template snapshot index and its first sheet
+    autosave     bursts of delta saves of ``burst`` cells each (with recalculation)
+    export       POST /instances/{id}/export.pdf, first call after the saves is a cache miss
+
+Run from backend/:  python -m benchmarks.load --users 8 --fake-converter [--database-url postgresql://...]
+"""
+import argparse, random, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from .report import summarize, print_results
+from .synth import PRESETS, make_template, make_mapping, make_values
+
+BENCH_EMAIL = "bench-admin@example.com"
+BENCH_PASSWORD = "bench-password"
+
+def _seed_user():
+    from app.db import Base, engine, SessionLocal
+    from app.models import User
+    from app.security import hash_password
+
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        if db.query(User).filter(User.email == BENCH_EMAIL).first() is None:
+            db.add(User(email=BENCH_EMAIL, password_hash=hash_password(BENCH_PASSWORD), role="admin"))
+            db.commit()
+
+def _login(client) -> float:
+    t = time.perf_counter()
+    r = client.post("/auth/login", json={"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    elapsed = time.perf_counter() - t
+    r.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+    return elapsed
+
+class _User:
+    def __init__(self, app, index: int):
+        from fastapi.testclient import TestClient
+
+        self.client = TestClient(app)
+        self.rnd = random.Random(index)
+        self.instance_id = None
+        self.version = 0
+
+    def timed(self, method: str, url: str, **kw) -> float:
+        t = time.perf_counter()
+        r = self.client.request(method, url, **kw)
+        elapsed = time.perf_counter() - t
+        r.raise_for_status()
+        self.last = r
+        return elapsed
+
+def run(template_xlsx: bytes, mapping: list[dict], users: int = 4, logins: int = 3, opens: int = 5,
+        saves: int = 20, burst: int = 5, exports: int = 2) -> dict:
+    from app.main import app
+
+    _seed_user()
+    admin = _User(app, -1)
+    _login(admin.client)
+    results = {}
+    results["api.upload_template"] = summarize([admin.timed(
+        "POST", "/templates?name=benchmark", files={"file": ("benchmark.xlsx", template_xlsx)})])
+    template_id = admin.last.json()["id"]
+    admin.timed("POST", f"/templates/{template_id}/map", json={"cells": mapping})
+
+    vus = [_User(app, i) for i in range(users)]
+    samples: dict[str, list[float]] = {}
+    lock = threading.Lock()
+
+    def record(name: str, elapsed: float):
+        with lock:
+            samples.setdefault(name, []).append(elapsed)
+
+    def phase(name: str, fn):
+        t = time.perf_counter()
+        with ThreadPoolExecutor(users) as ex:
+            for f in [ex.submit(fn, u) for u in vus]:
+                f.result()
+        wall = time.perf_counter() - t
+        results[name] = summarize(samples.get(name, []))
+        if results[name]["n"]:
+            results[name]["rps"] = round(results[name]["n"] / wall, 2)
+
+    def login(u: _User):
+        for _ in range(logins):
+            record("api.login", _login(u.client))
+        u.timed("POST", "/instances", json={"template_id": template_id, "title": "benchmark"})
+        u.instance_id = u.last.json()["id"]
+
+    def open_instance(u: _User):
+        for _ in range(opens):
+            elapsed = u.timed("GET", f"/instances/{u.instance_id}", params={"view": "values"})
+            elapsed += u.timed("GET", f"/templates/{template_id}/snapshot")
+            elapsed += u.timed("GET", f"/templates/{template_id}/snapshot/sheets/0")
+            record("api.open_instance", elapsed)
+
+    def autosave(u: _User):
+        for _ in range(saves):
+            cells = make_values(u.rnd.sample(mapping, min(burst, len(mapping))), seed=u.rnd.random())
+            body = {"values": [{k: c[k] for k in ("sheet_name", "cell_ref", "value")} for c in cells],
+                    "mode": "delta", "base_version": u.version}
+            record("api.autosave", u.timed("POST", f"/instances/{u.instance_id}/save", json=body))
+            u.version = u.last.json()["version"]
+
+    def export(u: _User):
+        for _ in range(exports):
+            record("api.export_pdf", u.timed("POST", f"/instances/{u.instance_id}/export.pdf"))
+
+    for name, fn in (("api.login", login), ("api.open_instance", open_instance),
+                     ("api.autosave", autosave), ("api.export_pdf", export)):
+        phase(name, fn)
+    return results
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--size", choices=sorted(PRESETS), default="small")
+    p.add_argument("--users", type=int, default=4)
+    p.add_argument("--saves", type=int, default=20)
+    p.add_argument("--burst", type=int, default=5)
+    p.add_argument("--exports", type=int, default=2)
+    p.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    p.add_argument("--fake-converter", action="store_true")
+    a = p.parse_args()
+
+    from .suite import configure_env
+    configure_env(a.database_url)
+    if a.fake_converter:
+        from .fakeconv import install
+        install()
+    size = PRESETS[a.size]
+    xlsx = make_template(size["sheets"], size["rows"], size["cols"], size["formulas"])
+    mapping = make_mapping(size["sheets"], size["rows"], size["cols"], size["mapped"])
+    print_results(run(xlsx, mapping, a.users, saves=a.saves, burst=a.burst, exports=a.exports))
+
+if __name__ == "__main__":
+    main()
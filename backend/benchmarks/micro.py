@@ -0,0 +1,67 @@
+"""Micro-benchmarks of every public function in ``app.spreadsheet``.
+
+Run from backend/:  python -m benchmarks.micro --size medium [--fake-converter]
+"""
+import argparse, os, tempfile
+from .report import measure, print_results
+from .synth import PRESETS, make_template, make_mapping, make_values
+from .audit import make_events
+
+def _write(path: str, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def run(xlsx: bytes, values: list[dict], audit_events: int, repeat: int) -> dict:
+    from app import spreadsheet
+
+    filled = spreadsheet.fill_values(xlsx, values)
+    pdf_main = spreadsheet.xlsx_to_pdf(filled)
+    audit_rows = list(make_events(audit_events))
+    pdf_audit = spreadsheet.build_audit_pdf(audit_rows)
+    with tempfile.TemporaryDirectory() as td:
+        # the file variants are what the export pipeline runs; each case overwrites its own output
+        template_path = _write(os.path.join(td, "template.xlsx"), xlsx)
+        filled_path = _write(os.path.join(td, "filled.xlsx"), filled)
+        main_path = _write(os.path.join(td, "main.pdf"), pdf_main)
+        audit_path = _write(os.path.join(td, "audit.pdf"), pdf_audit)
+        out_dir = os.path.join(td, "out")
+        os.makedirs(out_dir)
+        files = {
+            "spreadsheet.fill_values_file": lambda: spreadsheet.fill_values_file(template_path, values, os.path.join(out_dir, "filled.xlsx")),
+            "spreadsheet.xlsx_file_to_pdf": lambda: spreadsheet.xlsx_file_to_pdf(filled_path, out_dir),
+            "spreadsheet.build_audit_pdf_file": lambda: spreadsheet.build_audit_pdf_file(audit_rows, os.path.join(out_dir, "audit.pdf")),
+            "spreadsheet.merge_pdf_files": lambda: spreadsheet.merge_pdf_files(main_path, audit_path, os.path.join(out_dir, "merged.pdf")),
+        }
+        results = {name: measure(fn, repeat) for name, fn in files.items()}
+    cases = {
+        "spreadsheet.convert_to_xlsx": lambda: spreadsheet.convert_to_xlsx(xlsx, "template.xlsx"),
+        "spreadsheet.fill_values": lambda: spreadsheet.fill_values(xlsx, values),
+        "spreadsheet.fill_values_openpyxl": lambda: spreadsheet.fill_values_openpyxl(xlsx, values),
+        "spreadsheet.xlsx_to_pdf": lambda: spreadsheet.xlsx_to_pdf(filled),
+        "spreadsheet.build_audit_pdf": lambda: spreadsheet.build_audit_pdf(audit_rows),
+        "spreadsheet.build_audit_pdf[summarize]": lambda: spreadsheet.build_audit_pdf(audit_rows, summarize=True),
+        "spreadsheet.merge_pdf_with_audit": lambda: spreadsheet.merge_pdf_with_audit(pdf_main, pdf_audit),
+    }
+    return {**results, **{name: measure(fn, repeat) for name, fn in cases.items()}}
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--size", choices=sorted(PRESETS), default="small")
+    p.add_argument("--audit-events", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--fake-converter", action="store_true")
+    a = p.parse_args()
+
+    from .suite import configure_env
+    configure_env(None)
+    if a.fake_converter:
+        from .fakeconv import install
+        install()
+    size = PRESETS[a.size]
+    xlsx = make_template(size["sheets"], size["rows"], size["cols"], size["formulas"])
+    values = make_values(make_mapping(size["sheets"], size["rows"], size["cols"], size["mapped"]))
+    print_results(run(xlsx, values, a.audit_events, a.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Template model build time and incremental recalculation latency.
+
+Run from backend/:  python -m benchmarks.recalc --rows 5000 --cols 15
+"""
+import argparse, time
+from app.recalc import TemplateModel
+from .fill import make_workbook, bench
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--sheets", type=int, default=1)
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=15)
+    p.add_argument("--repeat", type=int, default=5)
+    a = p.parse_args()
+
+    xlsx = make_workbook(a.sheets, a.rows, a.cols)
+    t = time.perf_counter()
+    model = TemplateModel(xlsx)
+    print(f"model build: {(time.perf_counter() - t) * 1000:8.1f} ms, {len(model.formulas)} formulas")
+    overrides = {("Sheet1", 2, r): float(r) for r in range(1, a.rows + 1, max(a.rows // 100, 1))}
+    one = {("Sheet1", 2, 1): 1.0}
+    print(f"  one input: {bench(lambda: model.recalc(one, set(one)), a.repeat) * 1000:8.2f} ms")
+    print(f"{len(overrides):>4} inputs: {bench(lambda: model.recalc(overrides, set(overrides)), a.repeat) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Timing statistics, JSON result files and baseline comparison."""
+import json, platform, statistics, sys, time
+from datetime import datetime, timezone
+
+def summarize(samples: list[float]) -> dict:
+    """Summary of a list of durations in seconds, reported in milliseconds."""
+    xs = sorted(samples)
+    if not xs:
+        return {"n": 0}
+    pct = lambda q: xs[min(len(xs) - 1, round(q * (len(xs) - 1)))]
+    return {
+        "n": len(xs),
+        "min_ms": round(xs[0] * 1000, 3),
+        "p50_ms": round(statistics.median(xs) * 1000, 3),
+        "p95_ms": round(pct(0.95) * 1000, 3),
+        "max_ms": round(xs[-1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(xs) * 1000, 3),
+    }
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+def document(config: dict, results: dict) -> dict:
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "machine": f"{platform.system()} {platform.machine()}",
+        "config": config,
+        "results": results,
+    }
+
+def write(path: str, doc: dict):
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def compare(current: dict, baseline: dict, threshold: float, metric: str = "p50_ms", min_delta_ms: float = 1.0) -> list[dict]:
+    """Per-benchmark comparison of ``metric``.
+
+    A benchmark regresses when it is more than ``threshold`` (a fraction) slower
+    than the baseline *and* at least ``min_delta_ms`` slower, so sub-millisecond
+    noise never fails a run. Benchmarks missing on either side are skipped.
+    """
+    out = []
+    for name, cur in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if not base or metric not in base or metric not in cur:
+            continue
+        b, c = base[metric], cur[metric]
+        ratio = c / b if b else float("inf")
+        out.append({"name": name, "baseline": b, "current": c, "ratio": round(ratio, 3),
+                    "regressed": ratio > 1 + threshold and c - b >= min_delta_ms})
+    if current.get("config") != baseline.get("config"):
+        print("warning: benchmark configuration differs from the baseline's", file=sys.stderr)
+    return out
+
+def print_results(results: dict):
+    width = max((len(n) for n in results), default=10)
+    for name, r in sorted(results.items()):
+        if not r.get("n"):
+            continue
+        extra = f"  {r['rps']:8.1f} req/s" if "rps" in r else ""
+        print(f"{name:<{width}}  p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  n={r['n']}{extra}")
+
+def print_comparison(rows: list[dict], threshold: float):
+    for r in rows:
+        flag = "REGRESSED" if r["regressed"] else ""
+        print(f"{r['name']:<40} {r['baseline']:9.2f} -> {r['current']:9.2f} ms  x{r['ratio']:<6} {flag}")
+    bad = sum(r["regressed"] for r in rows)
+    print(f"{bad} of {len(rows)} benchmarks regressed by more than {threshold:.0%}")
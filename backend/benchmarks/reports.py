@@ -0,0 +1,83 @@
+"""Cross-instance report queries over a large synthetic population.
+
+Seeds ``instances`` instances of one template straight into the database (a
+number cell, a date cell and a text cell used for grouping, spread over a
+year), then times ``app.reports.aggregate`` for the report shapes the API
+serves: totals, per month, per group, and a one-month window.
+
+Run from backend/:  python -m benchmarks.reports --instances 100000 [--database-url postgresql://...]
+"""
+import argparse, random
+from datetime import datetime, timedelta
+from .report import measure, print_results
+
+CELLS = [("Sheet1", "B2", "number"), ("Sheet1", "B3", "date"), ("Sheet1", "B4", "text")]
+GROUPS = ["north", "south", "east", "west", "central"]
+CHUNK = 5000
+
+def seed(instances: int, seed: int = 0) -> int:
+    """Create the template and its instances; returns the template id."""
+    from sqlalchemy import insert
+    from app.db import SessionLocal
+    from app.models import User, Template, TemplateCell, Instance, InstanceValue
+    from .load import _seed_user, BENCH_EMAIL
+
+    _seed_user()
+    rnd = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    with SessionLocal() as db:
+        uid = db.query(User.id).filter(User.email == BENCH_EMAIL).scalar()
+        tpl = Template(name="report-bench", original_filename="bench.xlsx", mime_type="application/vnd.ms-excel",
+                       file_sha256="0" * 64, created_by=uid)
+        db.add(tpl)
+        db.flush()
+        db.add_all(TemplateCell(template_id=tpl.id, sheet_name=s, cell_ref=r, data_type=t) for s, r, t in CELLS)
+        for lo in range(0, instances, CHUNK):
+            n = min(CHUNK, instances - lo)
+            created = [start + timedelta(minutes=rnd.randrange(365 * 24 * 60)) for _ in range(n)]
+            ids = db.scalars(insert(Instance).returning(Instance.id),
+                             [{"template_id": tpl.id, "created_by": uid, "created_at": c, "version": 1} for c in created]).all()
+            rows = []
+            for iid, c in zip(ids, created):
+                amount = round(rnd.uniform(1, 10000), 2)
+                rows += [
+                    {"instance_id": iid, "sheet_name": "Sheet1", "cell_ref": "B2", "value": str(amount), "num_value": amount},
+                    {"instance_id": iid, "sheet_name": "Sheet1", "cell_ref": "B3", "value": c.date().isoformat(),
+                     "date_value": datetime(c.year, c.month, c.day)},
+                    {"instance_id": iid, "sheet_name": "Sheet1", "cell_ref": "B4", "value": rnd.choice(GROUPS)},
+                ]
+            db.execute(insert(InstanceValue), rows)
+        db.commit()
+        return tpl.id
+
+def run(instances: int, repeat: int) -> dict:
+    from app.db import SessionLocal
+    from app.reports import aggregate
+
+    template_id = seed(instances)
+    number, date, group = [(s, r) for s, r, _ in CELLS]
+    cases = {
+        "reports.aggregate[total]": dict(cells=[number, date]),
+        "reports.aggregate[month]": dict(cells=[number], period="month"),
+        "reports.aggregate[group]": dict(cells=[number], group_cell=group),
+        "reports.aggregate[window]": dict(cells=[number], created_from=datetime(2026, 3, 1), created_to=datetime(2026, 4, 1)),
+    }
+    results = {}
+    with SessionLocal() as db:
+        for name, kwargs in cases.items():
+            results[f"{name}@{instances}"] = measure(lambda: aggregate(db, template_id, **kwargs), repeat)
+    return results
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--instances", type=int, default=100000)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    a = p.parse_args()
+
+    from .suite import configure_env
+    configure_env(a.database_url)
+    print_results(run(a.instances, a.repeat))
+
+if __name__ == "__main__":
+    main()
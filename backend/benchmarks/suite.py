@@ -0,0 +1,95 @@
+"""Full benchmark run: spreadsheet micro-benchmarks plus the API load scenarios.
+
+Results are written as JSON and compared against the baseline; the exit status
+is 1 if any benchmark's median got slower than the threshold, and 2 when there is
+no baseline to compare with (store one first with --update-baseline).
+
+Run from backend/:
+    python -m benchmarks.suite --size medium --fake-converter --out bench.json
+    python -m benchmarks.suite --size medium --fake-converter --update-baseline   # after an accepted change
+"""
+import argparse, os, sys, tempfile
+from . import report
+from .synth import PRESETS, make_template, make_mapping, make_values
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def configure_env(database_url: str | None):
+    """Point the app at ``database_url`` (or a fresh SQLite file) and fill in required settings."""
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    elif "DATABASE_URL" not in os.environ:
+        fd, path = tempfile.mkstemp(prefix="planilhex-bench-", suffix=".db")
+        os.close(fd)
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    for key, value in (("JWT_SECRET", "benchmark"), ("ADMIN_EMAIL", "admin@example.com"),
+                       ("ADMIN_PASSWORD", "admin"), ("CORS_ORIGINS", "*"), ("EXPORT_CACHE_BACKEND", "none")):
+        os.environ.setdefault(key, value)
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--size", choices=sorted(PRESETS), default="small")
+    for dim in ("sheets", "rows", "cols", "formulas", "mapped"):
+        p.add_argument(f"--{dim}", type=int, help=f"override the preset's {dim}")
+    p.add_argument("--repeat", type=int, default=5, help="micro-benchmark samples per function")
+    p.add_argument("--audit-events", type=int, default=2000)
+    p.add_argument("--users", type=int, default=4)
+    p.add_argument("--saves", type=int, default=20)
+    p.add_argument("--burst", type=int, default=5)
+    p.add_argument("--exports", type=int, default=2)
+    p.add_argument("--report-instances", type=int, default=0, help="also time report queries over this many instances")
+    p.add_argument("--skip-micro", action="store_true")
+    p.add_argument("--skip-load", action="store_true")
+    p.add_argument("--database-url", help="defaults to a throwaway SQLite file")
+    p.add_argument("--fake-converter", action="store_true", help="run without LibreOffice")
+    p.add_argument("--fake-delay", type=float, default=0.0, help="seconds added to every fake conversion")
+    p.add_argument("--out", default="benchmark-results.json")
+    p.add_argument("--baseline", default=DEFAULT_BASELINE)
+    p.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    p.add_argument("--threshold", type=float, default=0.25, help="allowed median slowdown, as a fraction")
+    p.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    a = p.parse_args()
+    if not a.update_baseline and not os.path.exists(a.baseline):
+        p.error(f"no baseline at {a.baseline}; run once with --update-baseline to store one")
+
+    configure_env(a.database_url)
+    if a.fake_converter:
+        from .fakeconv import install
+        install(a.fake_delay)
+    size = {dim: getattr(a, dim) if getattr(a, dim) is not None else v for dim, v in PRESETS[a.size].items()}
+    xlsx = make_template(size["sheets"], size["rows"], size["cols"], size["formulas"])
+    mapping = make_mapping(size["sheets"], size["rows"], size["cols"], size["mapped"])
+
+    results = {}
+    if not a.skip_micro:
+        from .micro import run as run_micro
+        results.update(run_micro(xlsx, make_values(mapping), a.audit_events, a.repeat))
+    if not a.skip_load:
+        from .load import run as run_load
+        results.update(run_load(xlsx, mapping, a.users, saves=a.saves, burst=a.burst, exports=a.exports))
+    if a.report_instances:
+        from .reports import run as run_reports
+        results.update(run_reports(a.report_instances, a.repeat))
+
+    config = {**size, "audit_events": a.audit_events, "users": a.users, "saves": a.saves, "burst": a.burst,
+              "exports": a.exports, "report_instances": a.report_instances, "fake_converter": a.fake_converter, "fake_delay": a.fake_delay,
+              "database": os.environ["DATABASE_URL"].split(":", 1)[0]}
+    doc = report.document(config, results)
+    report.print_results(results)
+    report.write(a.out, doc)
+    print(f"results written to {a.out}")
+
+    if a.update_baseline:
+        report.write(a.baseline, doc)
+        print(f"baseline updated: {a.baseline}")
+        return
+    rows = report.compare(doc, report.load(a.baseline), a.threshold, min_delta_ms=a.min_delta_ms)
+    report.print_comparison(rows, a.threshold)
+    if not rows:
+        print(f"error: no benchmark of this run is in {a.baseline}; nothing was compared", file=sys.stderr)
+        sys.exit(2)
+    if any(r["regressed"] for r in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Synthetic templates of configurable size for the benchmark suite.
+
+A template has ``sheets`` sheets of ``rows`` rows. Each row holds ``cols``
+constant cells followed by ``formulas`` formula cells (row sums, products,
+conditionals and a running total that chains down the sheet, so recalculation
+has real dependencies). ``mapped`` input cells are spread over the constant
+area.
+"""
+import io, random
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+PRESETS = {
+    "small": {"sheets": 1, "rows": 200, "cols": 8, "formulas": 2, "mapped": 50},
+    "medium": {"sheets": 3, "rows": 2000, "cols": 15, "formulas": 3, "mapped": 200},
+    "large": {"sheets": 5, "rows": 10000, "cols": 20, "formulas": 4, "mapped": 1000},
+}
+
+def _formula(k: int, r: int, cols: int) -> str:
+    last = get_column_letter(cols)
+    kind = k % 4
+    if kind == 0:
+        return f"=SUM(A{r}:{last}{r})"
+    if kind == 1:
+        return f"=A{r}*B{r}+C{r}"
+    if kind == 2:
+        return f'=IF(A{r}>{r},"alto","baixo")'
+    col = get_column_letter(cols + k + 1)
+    return f"=A{r}" if r == 2 else f"={col}{r - 1}+A{r}"  # running total
+
+def make_template(sheets: int, rows: int, cols: int, formulas: int) -> bytes:
+    wb = Workbook()
+    wb.remove(wb.active)
+    for s in range(sheets):
+        ws = wb.create_sheet(f"Sheet{s + 1}")
+        ws.append([f"Col {get_column_letter(c)}" for c in range(1, cols + formulas + 1)])
+        for r in range(2, rows + 1):
+            row = [r * c if c % 3 else f"t{r}-{c}" for c in range(1, cols + 1)]
+            row += [_formula(k, r, cols) for k in range(formulas)]
+            ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def make_mapping(sheets: int, rows: int, cols: int, mapped: int, seed: int = 42) -> list[dict]:
+    """Distinct mapped input cells, as accepted by ``POST /templates/{id}/map``."""
+    rnd = random.Random(seed)
+    cells, seen = [], set()
+    total = sheets * max(rows - 1, 1) * cols
+    while len(cells) < min(mapped, total):
+        sheet, c, r = rnd.randint(1, sheets), rnd.randint(1, cols), rnd.randint(2, max(rows, 2))
+        if (sheet, c, r) in seen:
+            continue
+        seen.add((sheet, c, r))
+        cells.append({"sheet_name": f"Sheet{sheet}", "cell_ref": f"{get_column_letter(c)}{r}",
+                      "data_type": "text" if c % 3 == 0 else "number"})
+    return cells
+
+def make_values(mapping: list[dict], seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    return [{**m, "value": f"v{rnd.randint(0, 999)}" if m["data_type"] == "text" else str(rnd.randint(0, 10_000))}
+            for m in mapping]
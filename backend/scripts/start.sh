@@ -8,8 +8,12 @@ export PYTHONPATH=/app
 echo "DATABASE_URL = $DATABASE_URL"
 echo "JWT_SECRET   = $JWT_SECRET"
 
+# phase timestamps for the startup report (app/startup.py)
+export PLANILHEX_START_TIME=$(date +%s.%N)
+
 echo "Running migrations..."
-alembic upgrade head
+python -m app.migrate
+export PLANILHEX_MIGRATED_TIME=$(date +%s.%N)
 
 echo "Starting API..."
 exec uvicorn app.main:app --host 0.0.0.0 --port ${PORT:-8000}
@@ -0,0 +1,7 @@
+import os, tempfile
+
+# The settings, the engine and the router set are fixed at import, so they go in before any app module loads.
+_db = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.update(DATABASE_URL=f"sqlite:///{_db}", DB_ASYNC="true")
+for key in ("JWT_SECRET", "ADMIN_EMAIL", "ADMIN_PASSWORD", "CORS_ORIGINS"):
+    os.environ.setdefault(key, "test")
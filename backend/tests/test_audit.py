@@ -0,0 +1,79 @@
+from datetime import date, datetime
+import pytest
+from sqlalchemy import select, func
+from app import auditlog
+from app.auditarchive import add_months, archivable_months, archives_for, run_archive
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.exports import iter_audit_rows
+from app.models import AuditArchive, AuditArchiveInstance, AuditEvent, Instance, Template, User
+
+@pytest.fixture
+def db():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        db.add(User(id=1, email="ana@example.com", password_hash="-", role="operator"))
+        db.add(Template(id=1, name="t", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                        file_sha256="0" * 64, created_by=1))
+        for i in (1, 2, 3):
+            db.add(Instance(id=i, template_id=1, created_by=1, created_at=datetime(2024, 1, 1)))
+        db.commit()
+        yield db
+
+def _count(db, instance_id=None):
+    stmt = select(func.count(AuditEvent.id))
+    if instance_id is not None:
+        stmt = stmt.where(AuditEvent.instance_id == instance_id)
+    return db.scalar(stmt)
+
+def test_month_arithmetic_and_partition_names():
+    assert auditlog.next_month(date(2024, 12, 1)) == date(2025, 1, 1)
+    assert add_months(date(2024, 2, 1), -14) == date(2022, 12, 1)
+    assert auditlog.partition_name(auditlog.month_start(datetime(2024, 3, 31, 23))) == "audit_events_y2024m03"
+    assert auditlog.PARTITION.fullmatch("audit_events_y2024m03") and not auditlog.PARTITION.fullmatch("audit_events_default")
+
+def test_events_are_written_with_the_commit_and_dropped_with_a_rollback(monkeypatch, db):
+    auditlog.record(db, instance_id=1, user_id=1, event_type="edit", cell_ref="A1")
+    assert _count(db) == 0
+    db.rollback()
+    db.commit()
+    assert _count(db) == 0
+    auditlog.record(db, instance_id=1, user_id=1, event_type="edit", cell_ref="A1", new_value="x")
+    db.commit()
+    assert db.scalars(select(AuditEvent.new_value)).all() == ["x"]
+    monkeypatch.setattr(get_settings(), "AUDIT_BUFFER_ROWS", 3)
+    auditlog.record_many(db, [dict(instance_id=1, user_id=1, event_type="edit")] * 3)
+    assert _count(db) == 4  # a full buffer goes out ahead of the commit, in the same transaction
+    db.rollback()
+    assert _count(db) == 1
+
+def test_archived_months_round_trip_into_exports(monkeypatch, db, tmp_path):
+    pytest.importorskip("pyarrow")
+    s = get_settings()
+    monkeypatch.setattr(s, "EXPORT_SCRATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(s, "AUDIT_ARCHIVE_ROW_GROUP", 2)
+    now = datetime.utcnow()
+    old = [(1, datetime(2024, 1, 5), "A1"), (2, datetime(2024, 1, 6), "B1"), (1, datetime(2024, 1, 7), "A2"),
+           (2, datetime(2024, 2, 3), "B2"), (1, datetime(2024, 2, 9), "A3"), (2, datetime(2024, 2, 1), "B3")]
+    auditlog.write(db, [{**auditlog.DEFAULTS, "instance_id": i, "user_id": 1, "event_type": "edit",
+                         "cell_ref": ref, "new_value": ref.lower(), "created_at": at} for i, at, ref in old])
+    auditlog.record(db, instance_id=1, user_id=1, event_type="save", cell_ref="A4")
+    db.commit()
+    months, cutoff = archivable_months(db), add_months(auditlog.month_start(now), -s.AUDIT_ARCHIVE_AFTER_MONTHS)
+    assert months[:2] == [date(2024, 1, 1), date(2024, 2, 1)] and months[-1] == add_months(cutoff, -1)
+
+    result = run_archive(db)
+    assert result["archived"] == [{"month": "2024-01", "rows": 3}, {"month": "2024-02", "rows": 3}]
+    assert _count(db) == 1  # only the live save is left
+    assert db.scalars(select(AuditArchive.row_count).order_by(AuditArchive.period_start)).all() == [3, 3]
+    assert sorted(db.execute(select(AuditArchiveInstance.archive_id, AuditArchiveInstance.instance_id)).all()) \
+        == [(1, 1), (1, 2), (2, 1), (2, 2)]
+    assert archives_for(db, 3, datetime(2024, 1, 1)) == []
+
+    rows = list(iter_audit_rows(db, 1))
+    assert [r["cell_ref"] for r in rows] == ["A1", "A2", "A3", "A4"]
+    assert rows[0] == {"created_at": "2024-01-05T00:00:00Z", "user_email": "ana@example.com", "event_type": "edit",
+                       "sheet_name": "", "cell_ref": "A1", "old_value": "", "new_value": "a1"}
+    assert [r["cell_ref"] for r in iter_audit_rows(db, 2)] == ["B1", "B3", "B2"]
+    assert run_archive(db)["archived"] == []
@@ -0,0 +1,70 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template, TemplateCell, Instance, InstanceValue
+from app.bulk import upsert_instance_values
+from app.security import create_access_token
+from app.main import app
+
+@pytest.fixture
+def instance(monkeypatch):
+    monkeypatch.setattr(get_settings(), "RECALC_ENABLED", False)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(email="admin@example.com", password_hash="-", role="admin")
+        db.add(user)
+        db.flush()
+        tpl = Template(name="t", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                       file_sha256="0" * 64, created_by=user.id)
+        db.add(tpl)
+        db.flush()
+        db.add_all([TemplateCell(template_id=tpl.id, cell_ref=ref, data_type="number") for ref in ("A1", "A2", "A3")])
+        inst = Instance(template_id=tpl.id, created_by=user.id)
+        db.add(inst)
+        db.commit()
+        token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+        return inst.id, TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+def _stored(instance_id: int) -> dict:
+    with SessionLocal() as db:
+        rows = db.execute(select(InstanceValue.cell_ref, InstanceValue.value, InstanceValue.version, InstanceValue.num_value)
+                          .where(InstanceValue.instance_id == instance_id))
+        return {ref: (value, version, num) for ref, value, version, num in rows}
+
+def test_upsert_collapses_duplicates_and_bumps_versions(instance):
+    instance_id, _ = instance
+    with SessionLocal() as db:
+        n = upsert_instance_values(db, instance_id, [
+            {"sheet_name": "Sheet1", "cell_ref": "a1", "value": "1"},
+            {"sheet_name": "Sheet1", "cell_ref": "A1", "value": "2"},  # the last occurrence wins
+            {"sheet_name": "Sheet1", "cell_ref": "A2", "value": "3"},
+        ])
+        db.commit()
+        assert n == 2
+        upsert_instance_values(db, instance_id, [{"sheet_name": "Sheet1", "cell_ref": "A2", "value": "4"}])
+        db.commit()
+    assert {ref: v[:2] for ref, v in _stored(instance_id).items()} == {"A1": ("2", 1), "A2": ("4", 2)}
+
+def test_delta_save_writes_only_the_sent_cells(instance):
+    instance_id, client = instance
+    r = client.post(f"/instances/{instance_id}/save",
+                    json={"values": [{"cell_ref": "A1", "value": "1"}, {"cell_ref": "A2", "value": "2"}]})
+    assert r.status_code == 200 and r.json()["version"] == 1
+
+    r = client.post(f"/instances/{instance_id}/save",
+                    json={"mode": "delta", "base_version": 1, "values": [{"cell_ref": "A2", "value": "1.234,5"}]})
+    assert r.status_code == 200 and r.json()["version"] == 2
+    assert _stored(instance_id) == {"A1": ("1", 1, 1.0), "A2": ("1.234,5", 2, 1234.5)}
+
+def test_stale_delta_save_is_rejected(instance):
+    instance_id, client = instance
+    client.post(f"/instances/{instance_id}/save", json={"values": [{"cell_ref": "A1", "value": "1"}]})
+    r = client.post(f"/instances/{instance_id}/save",
+                    json={"mode": "delta", "base_version": 0, "values": [{"cell_ref": "A1", "value": "9"}]})
+    assert r.status_code == 409 and r.json()["detail"]["version"] == 1
+    assert client.post(f"/instances/{instance_id}/save",
+                       json={"mode": "delta", "values": [{"cell_ref": "A1", "value": "9"}]}).status_code == 422
+    assert _stored(instance_id)["A1"][0] == "1"
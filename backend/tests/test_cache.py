@@ -0,0 +1,37 @@
+import os
+from app.cache import ArtifactCache, DiskBackend
+
+def _builder(scratch, calls: list):
+    def build():
+        calls.append(1)
+        path = os.path.join(scratch, "built.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4 artifact")
+        return path
+    return build
+
+def test_second_request_is_served_from_the_cache(tmp_path):
+    cache = ArtifactCache(DiskBackend(str(tmp_path / "cache"), 1 << 20))
+    calls = []
+    for name in ("a.pdf", "b.pdf"):
+        path = cache.get_or_build_copy("main", "k", _builder(str(tmp_path), calls), str(tmp_path / name))
+        assert path == str(tmp_path / name) and open(path, "rb").read() == b"%PDF-1.4 artifact"
+    assert len(calls) == 1 and cache.stats() == {"main": {"hits": 1, "misses": 1}}
+
+def test_entry_evicted_before_the_copy_is_rebuilt(tmp_path):
+    backend = DiskBackend(str(tmp_path / "cache"), 1 << 20)
+    cache = ArtifactCache(backend)
+    calls = []
+    build = _builder(str(tmp_path), calls)
+    cache.get_or_build_copy("main", "k", build, str(tmp_path / "a.pdf"))
+
+    lookup = backend.path
+    def path_then_evict(key):
+        path = lookup(key)
+        os.remove(path)  # another process evicts the entry right after the lookup
+        return path
+    backend.path = path_then_evict
+
+    path = cache.get_or_build_copy("main", "k", build, str(tmp_path / "b.pdf"))
+    assert open(path, "rb").read() == b"%PDF-1.4 artifact" and len(calls) == 2
+    assert os.path.exists(tmp_path / "cache" / "main-k")
@@ -0,0 +1,177 @@
+import pytest
+from app.formulas import (
+    parse, references, compute, to_number, Unsupported, ExcelError, DIV0, VALUE, REF, NA, NUM, FUNCTIONS,
+)
+
+CELLS = {
+    ("S", 1, 1): 1.0, ("S", 2, 1): 2.0, ("S", 3, 1): "x",     # A1 B1 C1
+    ("S", 1, 2): 3.0, ("S", 2, 2): True, ("S", 3, 2): None,   # A2 B2 C2
+    ("S", 1, 3): "4", ("S", 2, 3): 5.0, ("S", 3, 3): "",      # A3 B3 C3
+    ("S", 1, 4): DIV0,                                        # A4
+    ("My Sheet", 1, 1): 10.0,
+    ("T", 1, 1): 1.0, ("T", 2, 1): "one",                     # lookup table T!A1:B3
+    ("T", 1, 2): 2.0, ("T", 2, 2): "two",
+    ("T", 1, 3): 3.0, ("T", 2, 3): "three",
+}
+
+def run(formula: str, cells=CELLS):
+    def lookup(sheet, col, row):
+        return cells.get((sheet, col, row))
+
+    def bounds(sheet):
+        return max((r for s, _, r in cells if s == sheet), default=1)
+    return compute(parse(formula, "S"), lookup, bounds)
+
+# ------------------------------------------------------------------ parsing
+
+@pytest.mark.parametrize("formula", [
+    "=Total*2",          # defined name
+    "=NOW()",            # volatile / unknown function
+    "=FOO(1)",
+    "=R1C1",
+    "=Table1[Col]",
+    "=1+",
+    "=(1+2",
+    "=1 2",
+    "=SUM(1;2)",
+])
+def test_unsupported(formula):
+    with pytest.raises(Unsupported):
+        parse(formula, "S")
+
+def test_parse_tree():
+    assert parse("=A1+2", "S") == ("bin", "+", ("ref", "S", 1, 1), ("const", 2.0))
+    assert parse("1", "S") == ("const", 1.0)  # the leading = is optional
+    assert parse('="a""b"', "S") == ("const", 'a"b')
+    assert parse("=TRUE", "S") == ("const", True)
+    assert parse("=#N/A", "S") == ("const", NA)
+    assert parse("=_xlfn.CONCAT(1)", "S") == ("call", "CONCAT", [("const", 1.0)])
+    assert parse("=SUM(,1)", "S") == ("call", "SUM", [("const", None), ("const", 1.0)])
+
+def test_references():
+    tree = parse("=SUM($A$1:B2, 'My Sheet'!A1, Other!C:C) + -A3%", "S")
+    assert sorted(references(tree), key=str) == sorted([
+        ("range", "S", 1, 1, 2, 2),
+        ("ref", "My Sheet", 1, 1),
+        ("range", "Other", 3, 1, 3, None),
+        ("ref", "S", 1, 3),
+    ], key=str)
+
+# --------------------------------------------------------------- precedence
+
+@pytest.mark.parametrize("formula, expected", [
+    ("=2+3*4", 14.0),
+    ("=(2+3)*4", 20.0),
+    ("=2^3^2", 64.0),      # left-associative, as in Excel
+    ("=-2^2", 4.0),        # unary minus binds tighter than ^
+    ("=10-4-3", 3.0),
+    ("=8/4/2", 1.0),
+    ("=50%*4", 2.0),
+    ("=2*50%", 1.0),
+    ('="a"&1+1', "a2"),   # & below arithmetic
+    ("=1+1=2", True),      # comparison lowest
+    ('="B">"a"', True),   # text compares case-insensitively
+    ("=1<\"a\"", True),    # numbers sort before text, text before booleans
+    ('="a"<TRUE', True),
+    ("=+3", 3.0),
+])
+def test_precedence(formula, expected):
+    assert run(formula) == expected
+
+# ------------------------------------------------------------------- ranges
+
+def test_ranges():
+    assert run("=SUM(A1:B3)") == 11.0            # text, booleans and "4" in a range are skipped
+    assert run("=SUM($A$1:$B$3)") == 11.0
+    assert run("=SUM(B:B)") == 7.0               # whole column up to the last used row
+    assert run("='My Sheet'!A1*2") == 20.0
+    assert run("=A1:A1+1") == 2.0                # a single-cell range is a scalar
+    assert run("=A1:A2+1") == VALUE
+    assert run("=C2") == 0.0                     # a blank cell shows 0
+    assert run("=A3+1") == 5.0                   # text read as a number when used directly
+
+# ------------------------------------------------------------------- errors
+
+def test_errors():
+    assert run("=1/0") == DIV0
+    assert run("=A4+1") == DIV0                  # errors propagate
+    assert run("=SUM(A1:A4)") == DIV0
+    assert run('="x"+1') == VALUE
+    assert run("=C1*2") == VALUE
+    assert run("=10^400") == NUM                 # overflow
+    assert run("=ABS()") == VALUE                # wrong number of arguments
+    assert run("=IF(1,2,3,4)") == VALUE
+    assert isinstance(run("=#REF!"), ExcelError) and run("=#REF!") == REF
+    assert run("=IF(TRUE,1,1/0)") == 1.0         # the untaken branch is not evaluated
+
+# ----------------------------------------------------------------- coercion
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,5", 1.5), ("1.234,56", 1234.56), ("1,234.56", 1234.56), (" 7 ", 7.0), (None, 0.0), (True, 1.0), (2, 2.0),
+])
+def test_to_number(value, expected):
+    assert to_number(value) == pytest.approx(expected)
+
+@pytest.mark.parametrize("value", ["", "abc", "nan", "inf", "1e400"])
+def test_to_number_rejects(value):
+    with pytest.raises(ExcelError):
+        to_number(value)
+
+# ---------------------------------------------------------------- functions
+
+FUNCTION_CASES = {
+    "SUM": [("=SUM(1,2,A1)", 4.0), ('=SUM("1,5",1)', 2.5)],
+    "AVERAGE": [("=AVERAGE(A1:B3)", 11.0 / 4), ("=AVERAGE(C1:C3)", DIV0)],
+    "MIN": [("=MIN(A1:B3)", 1.0), ("=MIN(C1:C3)", 0.0)],
+    "MAX": [("=MAX(A1:B3,7)", 7.0)],
+    "PRODUCT": [("=PRODUCT(A1:B1,3)", 6.0)],
+    "COUNT": [("=COUNT(A1:C3)", 4.0), ('=COUNT("4","x",1)', 2.0)],
+    "COUNTA": [("=COUNTA(A1:C3)", 8.0)],
+    "COUNTBLANK": [("=COUNTBLANK(A1:C3)", 2.0), ("=COUNTBLANK(1)", VALUE)],
+    "IF": [("=IF(A1>0,\"pos\",\"neg\")", "pos"), ("=IF(0,1)", False), ("=IF(1)", True)],
+    "AND": [("=AND(TRUE,1)", True), ("=AND(A1:B2)", True), ("=AND(C1:C3)", VALUE)],
+    "OR": [("=OR(FALSE,0)", False), ("=OR(0,\"true\")", True)],
+    "NOT": [("=NOT(0)", True)],
+    "ABS": [("=ABS(-2.5)", 2.5)],
+    "ROUND": [("=ROUND(2.675,2)", 2.68), ("=ROUND(-2.5,0)", -3.0), ("=ROUND(1234,-2)", 1200.0)],
+    "ROUNDUP": [("=ROUNDUP(1.21,1)", 1.3), ("=ROUNDUP(-1.21,1)", -1.3)],
+    "ROUNDDOWN": [("=ROUNDDOWN(1.29,1)", 1.2)],
+    "INT": [("=INT(-1.5)", -2.0)],
+    "MOD": [("=MOD(-3,2)", 1.0), ("=MOD(1,0)", DIV0)],
+    "POWER": [("=POWER(2,10)", 1024.0), ("=POWER(-8,0.5)", NUM), ("=POWER(0,-1)", DIV0)],
+    "SQRT": [("=SQRT(9)", 3.0), ("=SQRT(-1)", NUM)],
+    "CONCATENATE": [("=CONCATENATE(\"a\",1,TRUE)", "a1TRUE")],
+    "CONCAT": [("=CONCAT(A1:B1,\"!\")", "12!")],
+    "LEN": [("=LEN(\"abc\")", 3.0), ("=LEN(1.5)", 3.0)],
+    "UPPER": [("=UPPER(\"ab\")", "AB")],
+    "LOWER": [("=LOWER(\"AB\")", "ab")],
+    "TRIM": [("=TRIM(\"  a   b \")", "a b")],
+    "LEFT": [("=LEFT(\"abc\",2)", "ab"), ("=LEFT(\"abc\")", "a"), ("=LEFT(\"abc\",-1)", VALUE)],
+    "RIGHT": [("=RIGHT(\"abc\",2)", "bc"), ("=RIGHT(\"abc\",0)", "")],
+    "MID": [("=MID(\"abcdef\",2,3)", "bcd"), ("=MID(\"abc\",0,1)", VALUE)],
+    "SUMIF": [("=SUMIF(A1:A3,\">1\")", 3.0), ("=SUMIF(T!B1:B3,\"t*\",T!A1)", 5.0), ("=SUMIF(A1:A3,\"<>1\")", 3.0)],
+    "COUNTIF": [("=COUNTIF(A1:C3,\"x\")", 1.0), ("=COUNTIF(A1:B3,\">=2\")", 3.0), ("=COUNTIF(C1:C3,\"\")", 2.0),
+                ("=COUNTIF(T!A1:A3,\">1,5\")", 2.0)],
+    "SUMPRODUCT": [("=SUMPRODUCT(T!A1:A3,T!A1:A3)", 14.0), ("=SUMPRODUCT(A1:A2,A1:A3)", VALUE)],
+    "VLOOKUP": [("=VLOOKUP(2,T!A1:B3,2,FALSE)", "two"), ("=VLOOKUP(2.5,T!A1:B3,2)", "two"),
+                ("=VLOOKUP(9,T!A1:B3,2,FALSE)", NA), ("=VLOOKUP(0,T!A1:B3,2)", NA), ("=VLOOKUP(1,T!A1:B3,3)", REF)],
+    "DATE": [("=DATE(2024,1,1)", 45292.0), ("=DATE(2023,13,1)", 45292.0), ("=DATE(99,1,1)", 36161.0), ("=DATE(1900,1,-5)", NUM)],
+    "ISBLANK": [("=ISBLANK(C2)", True), ("=ISBLANK(C3)", False)],
+    "ISNUMBER": [("=ISNUMBER(A1)", True), ("=ISNUMBER(A3)", False)],
+    "ISTEXT": [("=ISTEXT(A3)", True)],
+    "ISERROR": [("=ISERROR(A4)", True), ("=ISERROR(1/0)", True), ("=ISERROR(1)", False)],
+    "IFERROR": [("=IFERROR(1/0,\"div\")", "div"), ("=IFERROR(A1,0)", 1.0)],
+    "TRUE": [("=TRUE()", True)],
+    "FALSE": [("=FALSE()", False)],
+}
+
+def test_every_function_has_cases():
+    assert set(FUNCTION_CASES) == set(FUNCTIONS)
+
+@pytest.mark.parametrize("formula, expected", [case for cases in FUNCTION_CASES.values() for case in cases])
+def test_function(formula, expected):
+    result = run(formula)
+    if isinstance(expected, float):
+        assert result == pytest.approx(expected)
+    else:
+        assert result == expected
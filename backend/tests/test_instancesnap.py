@@ -0,0 +1,84 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+from app import auditlog, instancesnap
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template, Instance, InstanceSnapshot
+from app.bulk import upsert_instance_values
+from app.security import create_access_token
+from app.main import app
+
+@pytest.fixture
+def instance(monkeypatch):
+    monkeypatch.setattr(get_settings(), "RECALC_ENABLED", False)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(email="admin@example.com", password_hash="-", role="admin")
+        db.add(user)
+        db.flush()
+        tpl = Template(name="t", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                       file_sha256="0" * 64, created_by=user.id)
+        db.add(tpl)
+        db.flush()
+        inst = Instance(template_id=tpl.id, created_by=user.id)
+        db.add(inst)
+        db.commit()
+        token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+        return inst.id, TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+def _save(client, instance_id, values, **extra):
+    return client.post(f"/instances/{instance_id}/save",
+                       json={"values": [{"cell_ref": ref, "value": v} for ref, v in values.items()], **extra})
+
+def test_unchanged_instance_answers_304_until_it_is_saved(instance):
+    instance_id, client = instance
+    assert _save(client, instance_id, {"A1": "1", "B2": "x"}).status_code == 200
+    r = client.get(f"/instances/{instance_id}?view=values")
+    tag = r.headers["ETag"]
+    assert r.status_code == 200 and r.headers["Cache-Control"] == "private, no-cache"
+    assert [(v["cell_ref"], v["value"]) for v in r.json()["values"]] == [("A1", "1"), ("B2", "x")]
+
+    r = client.get(f"/instances/{instance_id}?view=values", headers={"If-None-Match": tag})
+    assert r.status_code == 304 and r.headers["ETag"] == tag and not r.content
+    full = client.get(f"/instances/{instance_id}").headers["ETag"]
+    assert full != tag
+
+    assert _save(client, instance_id, {"A1": "2"}, mode="delta", base_version=1).status_code == 200
+    r = client.get(f"/instances/{instance_id}?view=values", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and r.headers["ETag"] != tag and r.json()["version"] == 2
+    assert [v["value"] for v in r.json()["values"]] == ["2", "x"]
+    assert client.get(f"/instances/{instance_id}", headers={"If-None-Match": full}).status_code == 200
+
+def test_full_view_tag_follows_the_audit_trail(instance):
+    instance_id, client = instance
+    tag = client.get(f"/instances/{instance_id}").headers["ETag"]
+    values_tag = client.get(f"/instances/{instance_id}?view=values").headers["ETag"]
+    with SessionLocal() as db:
+        auditlog.record(db, instance_id=instance_id, user_id=1, event_type="export")
+        db.commit()
+    r = client.get(f"/instances/{instance_id}", headers={"If-None-Match": tag})
+    assert r.status_code == 200 and [a["event_type"] for a in r.json()["audit"]] == ["export"]
+    assert client.get(f"/instances/{instance_id}?view=values", headers={"If-None-Match": values_tag}).status_code == 304
+
+def test_save_against_a_stale_version_is_refused(instance):
+    instance_id, client = instance
+    assert _save(client, instance_id, {"A1": "1"}).status_code == 200
+    assert _save(client, instance_id, {"A1": "2"}, base_version=1).status_code == 200
+    r = _save(client, instance_id, {"A1": "3"}, mode="delta", base_version=1)
+    assert r.status_code == 409 and r.json()["detail"]["version"] == 2
+    assert [v["value"] for v in client.get(f"/instances/{instance_id}?view=values").json()["values"]] == ["2"]
+
+def test_stale_snapshot_is_rebuilt_on_read(instance):
+    instance_id, client = instance
+    assert _save(client, instance_id, {"A1": "1"}).status_code == 200
+    with SessionLocal() as db:
+        # a write that predates the snapshot table: values and version move, the snapshot does not
+        upsert_instance_values(db, instance_id, [{"sheet_name": "Sheet1", "cell_ref": "A2", "value": "new"}])
+        db.execute(update(Instance).where(Instance.id == instance_id).values(version=Instance.version + 1))
+        db.commit()
+        assert instancesnap.load_rows(db, instance_id) == [("Sheet1", "A1", "1"), ("Sheet1", "A2", "new")]
+        db.commit()
+        assert db.scalar(select(InstanceSnapshot.version).where(InstanceSnapshot.instance_id == instance_id)) == 2
+        assert instancesnap.load_rows(db, 999) == []
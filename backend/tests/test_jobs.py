@@ -0,0 +1,154 @@
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import pytest
+from sqlalchemy import select
+from app import batch, jobs
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, ExportJob
+from app.scheduler import ExportScheduler
+
+class _Recorder:
+    """Stands in for a pool class and records the size each instance was started with."""
+    def __init__(self, sizes: list, key: str):
+        self.sizes, self.key = sizes, key
+
+    def __call__(self, *args, **kwargs):
+        self.sizes.append(kwargs[self.key])
+        return MagicMock()
+
+class _FakeExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        fut = Future()
+        self.submitted.append((args, fut))
+        return fut
+
+@pytest.fixture
+def scheduler(monkeypatch, tmp_path):
+    s = get_settings()
+    monkeypatch.setattr(s, "EXPORT_BATCH_CONCURRENCY", 4)
+    monkeypatch.setattr(s, "EXPORT_RESULTS_DIR", str(tmp_path / "results"))
+    monkeypatch.setattr(s, "EXPORT_SCRATCH_DIR", str(tmp_path / "scratch"))
+    sched = ExportScheduler(capacity=4, reserved=1, queue_max=10, queue_timeout=1)
+    monkeypatch.setattr(jobs, "get_scheduler", lambda: sched)
+    return sched
+
+def _workers_started(monkeypatch, slots: int) -> tuple[int, int]:
+    """Run a batch job with ``slots`` up to its first window; returns (soffice workers, fill processes)."""
+    soffice, fills = [], []
+    monkeypatch.setattr(batch, "ConverterPool", _Recorder(soffice, "size"))
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", _Recorder(fills, "max_workers"))
+    monkeypatch.setattr(batch, "resolve_instance_ids", lambda db, params: list(range(1, 11)))
+    monkeypatch.setattr(batch, "is_cancelled", lambda db, job_id: True)
+    with pytest.raises(batch.BatchCancelled):
+        batch.run_batch(MagicMock(), SimpleNamespace(id=1, params_json='{"format": "zip"}'), slots)
+    return sum(soffice), sum(fills)
+
+def test_batch_jobs_stay_within_scheduler_capacity(monkeypatch, scheduler):
+    dispatcher = jobs.Dispatcher()
+    dispatcher.size = 3
+    executor = _FakeExecutor()
+    monkeypatch.setattr(dispatcher, "_pool", lambda: executor)
+    monkeypatch.setattr(dispatcher, "_claim", lambda free: [(i, 100 + i, "batch") for i in range(1, free + 1)])
+    dispatcher._claim_and_submit()
+
+    granted = [args[1] for args, _ in executor.submitted]
+    assert len(granted) == 3 and sum(granted) == scheduler.stats()["bulk"] <= scheduler.bulk_limit
+    soffice = fills = 0
+    for slots in granted:
+        s, f = _workers_started(monkeypatch, slots)
+        assert s <= slots and f <= slots
+        soffice, fills = soffice + s, fills + f
+    assert soffice <= scheduler.capacity and fills <= scheduler.capacity
+
+    for _, fut in executor.submitted:
+        fut.set_result({})
+    assert scheduler.stats()["bulk"] == 0
+
+def test_batch_job_widens_with_free_slots(monkeypatch, scheduler):
+    dispatcher = jobs.Dispatcher()
+    executor = _FakeExecutor()
+    monkeypatch.setattr(dispatcher, "_pool", lambda: executor)
+    monkeypatch.setattr(dispatcher, "_claim", lambda free: [(1, 100, "batch")])
+    dispatcher._claim_and_submit()
+
+    [(args, fut)] = executor.submitted
+    assert args == (1, 3)  # the bulk limit: one slot stays reserved for inline exports
+    assert _workers_started(monkeypatch, args[1]) == (3, 3)
+    fut.set_result({})
+    assert scheduler.stats()["bulk"] == 0
+
+def _running_job(started_at: datetime | None = None, heartbeat_at: datetime | None = None) -> int:
+    with SessionLocal() as db:
+        user = db.scalar(select(User).where(User.email == "jobs@example.com"))
+        if user is None:
+            user = User(email="jobs@example.com", password_hash="-", role="operator")
+            db.add(user)
+            db.flush()
+        job = ExportJob(kind="batch", user_id=user.id, status="running", attempts=1,
+                        started_at=started_at or datetime.utcnow(), heartbeat_at=heartbeat_at)
+        db.add(job)
+        db.commit()
+        return job.id
+
+@pytest.fixture
+def tables():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+def _job(job_id: int) -> ExportJob:
+    with SessionLocal() as db:
+        return db.get(ExportJob, job_id)
+
+def test_cancelled_job_is_requeued_at_once(monkeypatch, scheduler, tables):
+    job_id = _running_job()
+    dispatcher = jobs.Dispatcher()
+    executor = _FakeExecutor()
+    monkeypatch.setattr(dispatcher, "_pool", lambda: executor)
+    monkeypatch.setattr(dispatcher, "_claim", lambda free: [(job_id, 1, "single")])
+    dispatcher._claim_and_submit()
+
+    [(_, fut)] = executor.submitted
+    fut.cancel()  # the pool was shut down with the job still in its queue
+    job = _job(job_id)
+    assert (job.status, job.attempts, job.started_at) == ("queued", 0, None)
+    assert scheduler.stats()["bulk"] == 0
+
+def test_job_that_broke_its_pool_is_retried_at_once(monkeypatch, scheduler, tables):
+    job_id = _running_job()
+    dispatcher = jobs.Dispatcher()
+    executor = _FakeExecutor()
+    executor.shutdown = lambda **kw: None
+    monkeypatch.setattr(dispatcher, "_pool", lambda: executor)
+    monkeypatch.setattr(dispatcher, "_claim", lambda free: [(job_id, 1, "single")])
+    dispatcher._claim_and_submit()
+
+    [(_, fut)] = executor.submitted
+    fut.set_exception(BrokenProcessPool("worker died"))
+    job = _job(job_id)
+    assert job.status == "queued" and job.attempts == 1 and "BrokenProcessPool" in job.error
+
+def test_only_jobs_with_a_quiet_worker_are_requeued(monkeypatch, tables):
+    monkeypatch.setattr(get_settings(), "EXPORT_HEARTBEAT_TIMEOUT", 120)
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    alive = _running_job(started_at=long_ago, heartbeat_at=datetime.utcnow())  # a long batch on another replica
+    lost = _running_job(started_at=long_ago, heartbeat_at=long_ago + timedelta(minutes=5))
+    never_reported = _running_job(started_at=long_ago)
+    jobs.Dispatcher()._requeue_stale()
+    assert _job(alive).status == "running"
+    assert _job(lost).status == "queued" and _job(never_reported).status == "queued"
+
+def test_worker_heartbeat_keeps_the_job_fresh(monkeypatch, tables):
+    monkeypatch.setattr(get_settings(), "EXPORT_HEARTBEAT_INTERVAL", 0.01)
+    long_ago = datetime.utcnow() - timedelta(hours=2)
+    job_id = _running_job(started_at=long_ago, heartbeat_at=long_ago)
+    with jobs.heartbeat(job_id):
+        time.sleep(0.2)
+    assert _job(job_id).heartbeat_at > datetime.utcnow() - timedelta(seconds=10)
@@ -0,0 +1,86 @@
+import asyncio, json
+import pytest
+from sqlalchemy import select
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template, TemplateCell, Instance, InstanceValue, AuditEvent
+from app.principals import Principal
+from app.routes import save_instance
+from app.schemas import InstanceSaveReq
+from app.live import LiveHub
+
+@pytest.fixture
+def instance(monkeypatch):
+    monkeypatch.setattr(get_settings(), "RECALC_ENABLED", False)
+    monkeypatch.setattr(get_settings(), "LIVE_FLUSH_INTERVAL", 3600)  # the test flushes by hand
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        users = [User(email=f"{name}@example.com", password_hash="-", role="operator") for name in ("rest", "live", "other")]
+        db.add_all(users)
+        db.flush()
+        tpl = Template(name="t", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                       file_sha256="0" * 64, created_by=users[0].id)
+        db.add(tpl)
+        db.flush()
+        db.add(TemplateCell(template_id=tpl.id, sheet_name="Sheet1", cell_ref="A1", data_type="text"))
+        inst = Instance(template_id=tpl.id, created_by=users[0].id)
+        db.add(inst)
+        db.commit()
+        return inst.id, [Principal.from_user(u) for u in users]
+
+def _messages(viewer) -> list[dict]:
+    out = []
+    while not viewer.queue.empty():
+        out.append(json.loads(viewer.queue.get_nowait()))
+    return out
+
+@pytest.mark.parametrize("values", [["live"], ["live", "live again"]])
+def test_live_edit_superseded_by_rest_save_is_reported(instance, values):
+    instance_id, (rest, live, other) = instance
+
+    async def scenario():
+        hub = LiveHub()
+        room, author = await hub.join(instance_id, live)
+        _, watcher = await hub.join(instance_id, other)
+        # a REST save lands after the room loaded the cell, so the room still holds the old version
+        with SessionLocal() as db:
+            save_instance(instance_id, InstanceSaveReq(values=[{"sheet_name": "Sheet1", "cell_ref": "A1", "value": "rest"}]),
+                          user=rest, db=db)
+        _messages(author), _messages(watcher)
+        for base, value in enumerate(values):  # one flush interval; the room acks on its own copy
+            reply = room.edit(author, {"sheet_name": "Sheet1", "cell_ref": "A1", "value": value, "base_version": base})
+            assert reply == {"type": "ack", "sheet_name": "Sheet1", "cell_ref": "A1", "version": base + 1}
+        await room.flush()
+        room._flusher.cancel()
+        return room, _messages(author), _messages(watcher)
+
+    room, to_author, to_watcher = asyncio.run(scenario())
+    stored = {"sheet_name": "Sheet1", "cell_ref": "A1", "value": "rest", "version": 1}
+    assert {"type": "conflict", **stored} in to_author
+    assert {"type": "cell", **stored, "user": None} in to_watcher
+    assert room.cells[("Sheet1", "A1")] == ["rest", 1]
+    with SessionLocal() as db:
+        assert db.scalar(select(InstanceValue.value).where(InstanceValue.instance_id == instance_id)) == "rest"
+        edits = db.scalars(select(AuditEvent).where(AuditEvent.event_type == "edit")).all()
+        assert edits == []
+
+def test_live_edits_are_written_over_their_own_base(instance):
+    instance_id, (_, live, _) = instance
+
+    async def scenario():
+        hub = LiveHub()
+        room, author = await hub.join(instance_id, live)
+        for base, value in enumerate(["a", "b"]):
+            room.edit(author, {"sheet_name": "Sheet1", "cell_ref": "A1", "value": value, "base_version": base})
+        await room.flush()
+        room.edit(author, {"sheet_name": "Sheet1", "cell_ref": "A1", "value": "c", "base_version": 2})
+        await room.flush()
+        room._flusher.cancel()
+        return [m["type"] for m in _messages(author)]
+
+    assert "conflict" not in asyncio.run(scenario())
+    with SessionLocal() as db:
+        row = db.execute(select(InstanceValue.value, InstanceValue.version).where(InstanceValue.instance_id == instance_id)).one()
+        assert tuple(row) == ("c", 3)
+        assert len(db.scalars(select(AuditEvent).where(AuditEvent.event_type == "edit")).all()) == 2
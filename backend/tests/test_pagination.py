@@ -0,0 +1,64 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template, Instance, InstanceValue
+from app.pagination import encode_cursor, decode_cursor, keyset_page, CursorError
+from app.security import create_access_token
+from app.main import app
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(email="admin@example.com", password_hash="-", role="admin")
+        db.add(user)
+        db.flush()
+        same_time = datetime(2026, 1, 1)  # ties on created_at are broken by id
+        db.add_all([Template(name=f"t{i}", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                             file_sha256="0" * 64, created_by=user.id, created_at=same_time) for i in range(5)])
+        db.commit()
+        token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 3, 1, 12, 30, 5, 123), 42, "Sheet 1"]
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1]), encode_cursor([{"$x": 1}, 2])])
+def test_bad_cursor(cursor):
+    with pytest.raises(CursorError):
+        decode_cursor(cursor, 2)
+
+def test_templates_follow_next_cursor_header(client):
+    names, cursor, pages = [], None, 0
+    while True:
+        r = client.get("/templates", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        names += [t["name"] for t in r.json()]
+        pages += 1
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == 3 and names == [f"t{i}" for i in reversed(range(5))]  # newest (highest id) first
+    assert client.get("/templates", params={"cursor": "garbage"}).status_code == 400
+
+def test_keyset_page_on_a_sync_query(client):
+    with SessionLocal() as db:
+        inst = Instance(template_id=1, created_by=1)
+        db.add(inst)
+        db.flush()
+        refs = ["A1", "A2", "B1", "B10", "B2"]
+        db.add_all([InstanceValue(instance_id=inst.id, sheet_name="S", cell_ref=ref, value="x") for ref in reversed(refs)])
+        db.commit()
+        columns = [InstanceValue.sheet_name, InstanceValue.cell_ref]
+        q = db.query(InstanceValue).filter(InstanceValue.instance_id == inst.id)
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(q, columns, cursor, 2)
+            seen += [v.cell_ref for v in rows]
+            if cursor is None:
+                break
+        assert seen == sorted(refs)
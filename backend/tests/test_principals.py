@@ -0,0 +1,73 @@
+import time
+import pytest
+from app import principals
+from app.db import Base, engine, SessionLocal
+from app.models import User
+from app.principals import Principal, PrincipalCache, get_principal_cache
+
+class _Loader:
+    def __init__(self, principal):
+        self.principal, self.calls = principal, 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.principal
+
+ALICE = Principal(id=1, email="alice@example.com", role="operator")
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(principals.time, "monotonic", lambda: now[0])
+    cache, load = PrincipalCache(ttl=30, max_entries=10), _Loader(ALICE)
+    assert cache.get(ALICE.email, 1, None, load) == ALICE
+    assert cache.get(ALICE.email, 1, None, load) == ALICE and load.calls == 1
+    now[0] += 31
+    cache.get(ALICE.email, 1, None, load)
+    assert load.calls == 2
+
+def test_rejections_and_inactive_users_are_not_cached():
+    cache = PrincipalCache(ttl=30, max_entries=10)
+    missing, inactive = _Loader(None), _Loader(Principal(id=1, email=ALICE.email, role="operator", is_active=False))
+    for load in (missing, inactive):
+        assert cache.get(ALICE.email, 1, None, load) is None
+        assert cache.get(ALICE.email, 1, None, load) is None and load.calls == 2
+
+def test_claims_of_tokens_issued_before_a_change_are_not_trusted():
+    cache, load = PrincipalCache(ttl=30, max_entries=10), _Loader(ALICE)
+    claims = {"uid": 1, "role": "admin"}
+    old_iat = int(time.time()) - 60
+    assert cache.get(ALICE.email, old_iat, claims, load).role == "admin" and load.calls == 0
+    cache.invalidate(ALICE.email)
+    assert cache.get(ALICE.email, old_iat, claims, load) == ALICE and load.calls == 1  # loaded, not trusted
+    assert cache.get(ALICE.email, int(time.time()) + 5, claims, load).role == "admin"  # a fresh token is
+
+@pytest.fixture
+def user():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    get_principal_cache().clear()
+    with SessionLocal() as db:
+        u = User(email=ALICE.email, password_hash="-", role="operator")
+        db.add(u)
+        db.commit()
+        return u.id
+
+def _cached(load) -> Principal:
+    return get_principal_cache().get(ALICE.email, 1, None, load)
+
+def test_user_changes_invalidate_once_committed(user):
+    load = _Loader(ALICE)
+    _cached(load)
+    with SessionLocal() as db:
+        db.get(User, user).role = "admin"
+        db.flush()
+        _cached(load)
+        assert load.calls == 1  # flushed but not committed: still the cached principal
+        db.rollback()
+    _cached(load)
+    assert load.calls == 1  # rolled back: nothing changed
+    with SessionLocal() as db:
+        db.get(User, user).is_active = False
+        db.commit()
+    _cached(load)
+    assert load.calls == 2
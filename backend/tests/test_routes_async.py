@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("aiosqlite")
+from fastapi.testclient import TestClient
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template
+from app.security import create_access_token
+from app.main import app
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(email="admin@example.com", password_hash="-", role="admin")
+        db.add(user)
+        db.flush()
+        for name, status in [("ready", "ready"), ("busy", "processing"), ("broken", "failed")]:
+            db.add(Template(name=name, original_filename=f"{name}.xlsx", mime_type="application/vnd.ms-excel",
+                            file_sha256="0" * 64, status=status, created_by=user.id))
+        db.commit()
+        token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+def test_list_templates_status(client):
+    assert get_settings().DB_ASYNC  # served by routes_async, which is mounted ahead of routes
+    r = client.get("/templates")
+    assert r.status_code == 200
+    assert {t["name"]: t["status"] for t in r.json()} == {"ready": "ready", "busy": "processing", "broken": "failed"}
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app import routes
+from app.config import get_settings
+from app.db import Base, engine, SessionLocal
+from app.models import User, Template, Instance
+from app.scheduler import ExportScheduler, Overloaded
+from app.security import create_access_token
+from app.main import app
+
+def test_waiters_are_served_round_robin_per_user_then_template():
+    async def scenario():
+        sched = ExportScheduler(capacity=1, reserved=0, queue_max=10, queue_timeout=5)
+        await sched.acquire(0, 0)
+        order = []
+
+        async def export(user_id, template_id, name):
+            await sched.acquire(user_id, template_id)
+            order.append(name)
+            sched.release("interactive", 0.1)
+
+        # user 1 queues four exports over two templates before user 2 asks for one
+        tasks = [asyncio.ensure_future(export(u, t, n)) for u, t, n in
+                 [(1, 10, "1/10a"), (1, 10, "1/10b"), (1, 11, "1/11"), (1, 10, "1/10c"), (2, 10, "2/10")]]
+        await asyncio.sleep(0)
+        assert sched.stats()["waiting"] == 5 and sched.stats()["users_waiting"] == 2
+        sched.release("interactive")
+        await asyncio.gather(*tasks)
+        return order, sched.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["1/10a", "2/10", "1/11", "1/10b", "1/10c"]
+    assert stats["interactive"] == 0 and stats["waiting"] == 0
+
+def test_full_queue_and_timeout_are_refused_with_retry_after():
+    async def scenario():
+        sched = ExportScheduler(capacity=1, reserved=0, queue_max=1, queue_timeout=0.05)
+        await sched.acquire(0, 0)
+        waiter = asyncio.ensure_future(sched.acquire(1, 1))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await sched.acquire(2, 2)
+        with pytest.raises(Overloaded) as timed_out:
+            await waiter
+        return full.value, timed_out.value, sched.stats()
+
+    full, timed_out, stats = asyncio.run(scenario())
+    assert full.reason == "queue_full" and full.retry_after == 10  # 5 s average render x (1 waiting + 1) / 1 slot
+    assert timed_out.reason == "queue_timeout" and timed_out.retry_after >= 1
+    assert stats["waiting"] == 0 and stats["rejected"] == 2
+
+def test_bulk_work_leaves_the_reserved_slots_and_yields_to_waiters():
+    async def scenario():
+        sched = ExportScheduler(capacity=3, reserved=1, queue_max=10, queue_timeout=5)
+        assert sched.reserve_bulk(5) == 2
+        await sched.acquire(1, 1)  # the reserved slot
+        waiter = asyncio.ensure_future(sched.acquire(2, 2))
+        await asyncio.sleep(0)
+        sched.release("bulk")
+        assert sched.reserve_bulk(1) == 0  # an inline export is waiting
+        await waiter
+        return sched.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["bulk"], stats["interactive"]) == (1, 2)
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with SessionLocal() as db:
+        user = User(email="admin@example.com", password_hash="-", role="admin")
+        db.add(user)
+        db.flush()
+        tpl = Template(name="t", original_filename="t.xlsx", mime_type="application/vnd.ms-excel",
+                       file_sha256="0" * 64, created_by=user.id)
+        db.add(tpl)
+        db.flush()
+        db.add(Instance(template_id=tpl.id, created_by=user.id))
+        db.commit()
+        token = create_access_token(user.email, get_settings().JWT_SECRET, user_id=user.id, role=user.role)
+    return TestClient(app, headers={"Authorization": f"Bearer {token}"})
+
+def test_busy_export_gets_429_with_retry_after(monkeypatch, client):
+    sched = ExportScheduler(capacity=1, reserved=0, queue_max=0, queue_timeout=5)
+    sched.reserve_bulk(1)  # a background job holds the only slot
+    monkeypatch.setattr(routes, "get_scheduler", lambda: sched)
+    r = client.post("/instances/1/export.pdf")
+    assert r.status_code == 429 and r.headers["Retry-After"] == "5"
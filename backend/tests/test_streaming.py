@@ -0,0 +1,30 @@
+import gzip
+import pytest
+from starlette.requests import Request
+from app.streaming import send_bytes
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def _request(**headers) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/",
+                    "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]})
+
+@pytest.mark.parametrize("media_type", ["application/json", "application/pdf"])
+def test_compresses_json_and_pdf(media_type):
+    body = b'{"a": 1}' * 100
+    r = send_bytes(_request(accept_encoding="gzip"), body, media_type, "f", compress=True)
+    assert r.headers["content-encoding"] == "gzip" and r.headers["vary"] == "Accept-Encoding"
+    assert r.headers["etag"].endswith('-gz"')
+    assert int(r.headers["content-length"]) < len(body)
+
+@pytest.mark.parametrize("media_type", [XLSX, "application/vnd.oasis.opendocument.spreadsheet", "application/zip"])
+def test_leaves_zip_payloads_alone(media_type):
+    body = b"PK\x03\x04" + b"\0" * 1000
+    r = send_bytes(_request(accept_encoding="gzip"), body, media_type, "f", compress=True)
+    assert "content-encoding" not in r.headers and "vary" not in r.headers
+    assert r.headers["content-length"] == str(len(body))
+
+def test_gzipped_payload_is_decompressed_for_other_clients():
+    body = b"x" * 100
+    r = send_bytes(_request(), gzip.compress(body), "application/json", "f", etag="e", gzipped=True)
+    assert "content-encoding" not in r.headers and r.headers["content-length"] == str(len(body))
@@ -0,0 +1,70 @@
+import math
+from datetime import datetime
+import pytest
+from app.typed import parse_number, parse_date, coerce_value, coerce_batch
+
+@pytest.mark.parametrize("value, expected", [
+    ("42", 42.0),
+    ("-3.5", -3.5),
+    ("+3", 3.0),
+    (".5", 0.5),
+    ("1,5", 1.5),
+    ("-2,5", -2.5),
+    ("1234,56", 1234.56),
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("1.234.567", 1234567.0),
+    ("1,234,567", 1234567.0),
+    ("1.234.567,8", 1234567.8),
+    ("1,234,567.8", 1234567.8),
+    ("1 234", 1234.0),
+    ("1 234,5", 1234.5),
+    ("1e3", 1000.0),
+    ("1,5e3", 1500.0),
+    ("1,234", 1.234),  # a lone comma is the decimal separator
+    ("1.234", 1.234),
+])
+def test_parse_number(value, expected):
+    assert parse_number(value) == pytest.approx(expected)
+
+@pytest.mark.parametrize("value", [
+    "nan", "NaN", "inf", "-inf", "Infinity", "1e400", "-1e400",
+    "abc", "", "1,2,3", "12,34.5", "1.23.4", "1,23,456.7", "1_000", "0x10", "1e", "--1",
+])
+def test_parse_number_rejects(value):
+    assert parse_number(value) is None
+
+def test_parse_number_is_always_finite():
+    for value in ("9" * 308 + "0", "1e308", "1.7976931348623157e308"):
+        n = parse_number(value)
+        assert n is None or math.isfinite(n)
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-01-31", datetime(2026, 1, 31)),
+    ("2026-01-31T10:20:00", datetime(2026, 1, 31, 10, 20)),
+    ("2026-01-31T10:20:00+03:00", datetime(2026, 1, 31, 10, 20)),
+    ("31/01/2026", datetime(2026, 1, 31)),
+    ("31/01/2026 10:20", datetime(2026, 1, 31, 10, 20)),
+])
+def test_parse_date(value, expected):
+    assert parse_date(value) == expected
+
+@pytest.mark.parametrize("value", ["31/13/2026", "2026-02-30", "tomorrow", "01/31/2026"])
+def test_parse_date_rejects(value):
+    assert parse_date(value) is None
+
+def test_coerce_value():
+    assert coerce_value("1,234.56", "number") == (1234.56, None, True)
+    assert coerce_value("nan", "number") == (None, None, False)
+    assert coerce_value("", "number") == (None, None, True)
+    assert coerce_value("anything", "text") == (None, None, True)
+    assert coerce_value("31/01/2026", "date") == (None, datetime(2026, 1, 31), True)
+
+def test_coerce_batch_reports_every_invalid_cell():
+    types = {("S", "A1"): "number", ("S", "A2"): "number", ("S", "A3"): "date"}
+    items = [{"sheet_name": "S", "cell_ref": "a1", "value": "inf"},
+             {"sheet_name": "S", "cell_ref": "A2", "value": "1.234,5"},
+             {"sheet_name": "S", "cell_ref": "A3", "value": "never"}]
+    out, errors = coerce_batch(items, types)
+    assert [o["num_value"] for o in out] == [None, 1234.5, None]
+    assert [(e["cell_ref"], e["data_type"]) for e in errors] == [("a1", "number"), ("A3", "date")]
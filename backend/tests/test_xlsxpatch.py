@@ -0,0 +1,61 @@
+from datetime import datetime
+from io import BytesIO
+import zipfile
+import pytest
+openpyxl = pytest.importorskip("openpyxl")
+from app.xlsxpatch import patch_values
+
+def _template() -> bytes:
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Sheet1"
+    ws["A1"] = 1
+    ws["B1"] = "label"
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+def _fill(values: list[dict]):
+    filled = patch_values(_template(), values)
+    return openpyxl.load_workbook(BytesIO(filled))["Sheet1"]
+
+def _cell(ref: str, value: str, data_type: str) -> dict:
+    return {"sheet_name": "Sheet1", "cell_ref": ref, "value": value, "data_type": data_type}
+
+def test_numbers_are_written_as_values():
+    ws = _fill([_cell("A1", "1,234.56", "number"), _cell("A2", "1.234,56", "number"),
+                _cell("A3", "2,5", "number"), _cell("A4", "7", "number")])
+    assert [ws[r].value for r in ("A1", "A2", "A3", "A4")] == [1234.56, 1234.56, 2.5, 7]
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "1e400", "not a number"])
+def test_non_finite_numbers_stay_text(value):
+    ws = _fill([_cell("A1", value, "number")])
+    assert ws["A1"].value == value
+
+def test_dates_and_text():
+    ws = _fill([_cell("A1", "31/01/2026", "date"), _cell("B1", "hello", "text"), _cell("C1", "1e3", "text")])
+    assert ws["A1"].value == datetime(2026, 1, 31)
+    assert ws["B1"].value == "hello"
+    assert ws["C1"].value == "1e3"
+
+SST_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"
+SST_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+
+def test_self_closing_shared_strings():
+    # an empty shared string table the way LibreOffice writes it, which openpyxl does not produce
+    src = zipfile.ZipFile(BytesIO(_template()))
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w") as out:
+        for info in src.infolist():
+            data = src.read(info)
+            if info.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SST_TYPE}"/></Types>'.encode())
+            elif info.filename == "xl/_rels/workbook.xml.rels":
+                data = data.replace(b"</Relationships>",
+                                    f'<Relationship Id="rIdSst" Type="{SST_REL}" Target="sharedStrings.xml"/></Relationships>'.encode())
+            out.writestr(info, data)
+        out.writestr("xl/sharedStrings.xml",
+                     '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="0" uniqueCount="0"/>')
+    filled = patch_values(buf.getvalue(), [_cell("C1", "new", "text")])
+    ws = openpyxl.load_workbook(BytesIO(filled))["Sheet1"]
+    assert ws["C1"].value == "new"
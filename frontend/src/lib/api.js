@@ -8,7 +8,7 @@ export function setToken(t) {
   localStorage.setItem("token", t);
 }
 
-export async function api(path, opts = {}) {
+async function request(path, opts = {}) {
   const headers = opts.headers ? {...opts.headers} : {};
   const token = getToken();
   if (token) headers["Authorization"] = `Bearer ${token}`;
@@ -17,13 +17,48 @@ export async function api(path, opts = {}) {
     let msg = `HTTP ${res.status}`;
     try {
       const data = await res.json();
-      msg = data.detail || msg;
+      msg = data.detail?.message || data.detail || msg;
     } catch {}
     throw new Error(msg);
   }
+  return res;
+}
+
+export async function api(path, opts = {}) {
+  const res = await request(path, opts);
   return res.json();
 }
 
+// List endpoints that page with an X-Next-Cursor header (GET /templates): fetches every page
+export async function apiAll(path, limit = 1000) {
+  const sep = path.includes("?") ? "&" : "?";
+  const items = [];
+  let cursor = null;
+  do {
+    const res = await request(`${path}${sep}limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`);
+    items.push(...await res.json());
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return items;
+}
+
+// Binary endpoints: returns {blob, filename}
+export async function apiBlob(path, opts = {}) {
+  const res = await request(path, opts);
+  const disposition = res.headers.get("Content-Disposition") || "";
+  const match = disposition.match(/filename="([^"]+)"/);
+  return { blob: await res.blob(), filename: match ? match[1] : null };
+}
+
+// WebSocket on the API host; the token travels as a query parameter since browsers cannot set headers here
+export function apiSocket(path) {
+  const base = new URL(API_URL, window.location.href);
+  base.protocol = base.protocol === "https:" ? "wss:" : "ws:";
+  const url = new URL(`${base.pathname.replace(/\/$/, "")}${path}`, base);
+  url.searchParams.set("token", getToken() || "");
+  return new WebSocket(url);
+}
+
 export async function login(email, password) {
   return api("/auth/login", {
     method: "POST",
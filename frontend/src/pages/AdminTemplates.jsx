@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import { api } from "../lib/api.js";
+import { api, apiAll } from "../lib/api.js";
 
 export default function AdminTemplates() {
   const [templates, setTemplates] = useState([]);
@@ -13,7 +13,7 @@ export default function AdminTemplates() {
   const [label, setLabel] = useState("");
 
   async function load() {
-    const t = await api("/templates");
+    const t = await apiAll("/templates");
     setTemplates(t);
   }
   useEffect(()=>{ load(); }, []);
@@ -32,7 +32,8 @@ export default function AdminTemplates() {
       setMsg("Erro ao enviar template");
       return;
     }
-    setMsg("Template enviado!");
+    // large .ods uploads are converted in the background (202); the list shows when they are ready
+    setMsg(res.status === 202 ? "Template enviado; conversão em andamento." : "Template enviado!");
     setName(""); setFile(null);
     await load();
   }
@@ -54,11 +55,16 @@ export default function AdminTemplates() {
   }
 
   async function saveMap() {
-    await api(`/templates/${selected.id}/map`, {
-      method:"POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({ cells: mapped })
-    });
+    try {
+      await api(`/templates/${selected.id}/map`, {
+        method:"POST",
+        headers: {"Content-Type":"application/json"},
+        body: JSON.stringify({ cells: mapped })
+      });
+    } catch (e) {
+      setMsg(`Erro ao salvar mapeamento: ${e.message}`);
+      return;
+    }
     setMsg("Mapeamento salvo!");
   }
 
@@ -85,6 +91,7 @@ export default function AdminTemplates() {
             <li key={t.id}>
               <button onClick={()=>selectTemplate(t)}>{t.name}</button>
               <small style={{marginLeft:8, color:"#666"}}>({t.original_filename})</small>
+              {t.status !== "ready" && <small style={{marginLeft:8}}>{t.status === "processing" ? "processando…" : "falhou"}</small>}
             </li>
           ))}
         </ul>
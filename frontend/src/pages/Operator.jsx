@@ -1,19 +1,11 @@
 import React, { useEffect, useMemo, useRef, useState } from "react";
-import { api } from "../lib/api.js";
+import { api, apiAll, apiBlob, apiSocket } from "../lib/api.js";
 import * as XLSX from "xlsx";
 import Handsontable from "handsontable";
 import { HotTable } from "@handsontable/react";
 import { HyperFormula } from "hyperformula";
 import "handsontable/dist/handsontable.full.min.css";
 
-function hexToUint8(hex) {
-  const bytes = new Uint8Array(hex.length / 2);
-  for (let i = 0; i < bytes.length; i++) {
-    bytes[i] = parseInt(hex.substr(i*2, 2), 16);
-  }
-  return bytes;
-}
-
 export default function Operator() {
   const [templates, setTemplates] = useState([]);
   const [selected, setSelected] = useState(null);
@@ -22,19 +14,111 @@ export default function Operator() {
 
   const [sheetData, setSheetData] = useState([[]]);
   const [sheetName, setSheetName] = useState("Sheet1");
+  const [sheets, setSheets] = useState([]);
+  const [layout, setLayout] = useState({ mergeCells: [], colWidths: undefined });
+  const sheetCacheRef = useRef({});
   const [audit, setAudit] = useState([]);
+  const [version, setVersion] = useState(0);
+  const dirtyRef = useRef(new Set());
+  // live editing channel: per-cell versions from the server, and who else has the instance open
+  const socketRef = useRef(null);
+  const cellVersionsRef = useRef({});
+  const [live, setLive] = useState(false);
+  const [viewers, setViewers] = useState([]);
 
   const hfRef = useRef(null);
+  const hotRef = useRef(null);
 
   async function loadTemplates() {
-    setTemplates(await api("/templates"));
+    setTemplates(await apiAll("/templates"));
   }
   useEffect(()=>{ loadTemplates(); }, []);
+  useEffect(()=>() => socketRef.current?.close(), []);
+
+  async function setCell(sheet, cellRef, value) {
+    const grid = await sheetCacheRef.current[sheet];
+    if (!grid) return;
+    const addr = XLSX.utils.decode_cell(cellRef);
+    while (grid.data.length <= addr.r) grid.data.push([]);
+    grid.data[addr.r][addr.c] = value;
+  }
+
+  function connectLive(instanceId) {
+    socketRef.current?.close();
+    cellVersionsRef.current = {};
+    const ws = apiSocket(`/instances/${instanceId}/live`);
+    socketRef.current = ws;
+    ws.onopen = () => setLive(true);
+    ws.onclose = () => { if (socketRef.current === ws) { setLive(false); setViewers([]); } };
+    ws.onmessage = async (ev) => {
+      const msg = JSON.parse(ev.data);
+      const key = `${msg.sheet_name}:${msg.cell_ref}`;
+      switch (msg.type) {
+        case "state":
+          for (const c of msg.cells) {
+            cellVersionsRef.current[`${c.sheet_name}:${c.cell_ref}`] = c.version;
+            await setCell(c.sheet_name, c.cell_ref, c.value);
+          }
+          setVersion(msg.version);
+          setViewers(msg.viewers);
+          break;
+        case "presence":
+          setViewers(msg.viewers);
+          return;
+        case "ack":
+          cellVersionsRef.current[key] = msg.version;
+          return;
+        case "cell":
+        case "conflict":  // someone else got there first: take their value
+          cellVersionsRef.current[key] = msg.version;
+          await setCell(msg.sheet_name, msg.cell_ref, msg.value);
+          break;
+        case "computed":
+          for (const c of msg.cells) if (!c.error) await setCell(c.sheet_name, c.cell_ref, c.value);
+          break;
+        case "saved":
+          setVersion(msg.version);
+          return;
+        default:
+          return;
+      }
+      hotRef.current?.hotInstance?.render();
+    };
+  }
+
+  function toGrid(sheet) {
+    const merged = sheet.merged.map(ref => {
+      const r = XLSX.utils.decode_range(ref);
+      return { row: r.s.r, col: r.s.c, rowspan: r.e.r - r.s.r + 1, colspan: r.e.c - r.s.c + 1 };
+    });
+    const widths = Object.keys(sheet.col_widths).length
+      ? Array.from({ length: Math.max(sheet.cols, 1) }, (_, c) => Math.round((sheet.col_widths[XLSX.utils.encode_col(c)] || 8.43) * 7 + 5))
+      : undefined;
+    return { data: sheet.values.length ? sheet.values : [[]], mergeCells: merged, colWidths: widths };
+  }
+
+  // sheets are fetched lazily and kept here, edits included (Handsontable mutates the data arrays in place)
+  function loadSheet(templateId, meta) {
+    const cache = sheetCacheRef.current;
+    if (!cache[meta.name]) {
+      cache[meta.name] = api(`/templates/${templateId}/snapshot/sheets/${meta.index}`).then(toGrid);
+    }
+    return cache[meta.name];
+  }
+
+  async function showSheet(meta, templateId = selected.id) {
+    const grid = await loadSheet(templateId, meta);
+    setSheetName(meta.name);
+    setSheetData(grid.data);
+    setLayout({ mergeCells: grid.mergeCells, colWidths: grid.colWidths });
+  }
 
   async function openTemplate(t) {
     setSelected(t);
-    const cells = await api(`/templates/${t.id}/mapped-cells`);
-    setMappedCells(cells);
+    sheetCacheRef.current = {};
+    const snapshot = await api(`/templates/${t.id}/snapshot`);
+    setMappedCells(snapshot.mapped_cells);
+    setSheets(snapshot.sheets);
 
     const inst = await api(`/instances`, {
       method:"POST",
@@ -42,15 +126,14 @@ export default function Operator() {
       body: JSON.stringify({ template_id: t.id, title: `${t.name} - preenchimento` })
     });
     setInstance(inst);
+    setVersion(0);
+    dirtyRef.current = new Set();
+    connectLive(inst.id);
 
-    const wbResp = await api(`/templates/${t.id}/workbook`);
-    const bytes = hexToUint8(wbResp.base64);
-    const workbook = XLSX.read(bytes, {type:"array"});
-    const first = workbook.SheetNames[0];
-    setSheetName(first);
-    const ws = workbook.Sheets[first];
-    const arr = XLSX.utils.sheet_to_json(ws, {header:1, blankrows:true});
-    setSheetData(arr.length ? arr : [[]]);
+    // render the active sheet first, then prefetch the rest in the background
+    const first = snapshot.sheets[snapshot.active] || snapshot.sheets[0];
+    if (first) await showSheet(first, t.id);
+    for (const meta of snapshot.sheets) loadSheet(t.id, meta).catch(() => {});
 
     // HyperFormula engine
     if (!hfRef.current) {
@@ -85,10 +168,23 @@ export default function Operator() {
 
   function onAfterChange(changes, source) {
     if (!changes || source === "loadData") return;
+    const ws = socketRef.current;
+    if (live && ws?.readyState === WebSocket.OPEN) {
+      // the server batches these into writes and audit rows itself
+      for (const [row, col, , newValue] of changes) {
+        const cellRef = XLSX.utils.encode_cell({r: row, c: col});
+        ws.send(JSON.stringify({
+          type: "edit", sheet_name: sheetName, cell_ref: cellRef, value: String(newValue ?? ""),
+          base_version: cellVersionsRef.current[`${sheetName}:${cellRef}`] || 0,
+        }));
+      }
+      return;
+    }
     const newAudit = [];
     for (const ch of changes) {
       const [row, col, oldValue, newValue] = ch;
       const cellRef = XLSX.utils.encode_cell({r: row, c: col});
+      dirtyRef.current.add(`${sheetName}:${cellRef}`);
       newAudit.push({
         event_type: "edit",
         sheet_name: sheetName,
@@ -103,30 +199,53 @@ export default function Operator() {
 
   async function save() {
     if (!instance) return;
-    // collect mapped values only
+    // send only mapped cells changed since the last save (delta protocol), across every loaded sheet
     const values = [];
     for (const c of mappedCells) {
-      if (c.sheet_name !== sheetName) continue;
+      if (!dirtyRef.current.has(`${c.sheet_name}:${c.cell_ref}`)) continue;
+      const grid = await sheetCacheRef.current[c.sheet_name];
+      if (!grid) continue;
       const addr = XLSX.utils.decode_cell(c.cell_ref);
-      const v = (sheetData[addr.r] && sheetData[addr.r][addr.c] != null) ? sheetData[addr.r][addr.c] : "";
-      values.push({ sheet_name: sheetName, cell_ref: c.cell_ref, value: String(v) });
+      const v = (grid.data[addr.r] && grid.data[addr.r][addr.c] != null) ? grid.data[addr.r][addr.c] : "";
+      values.push({ sheet_name: c.sheet_name, cell_ref: c.cell_ref, value: String(v) });
     }
-    await api(`/instances/${instance.id}/save`, {
-      method:"POST",
-      headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({ values, audit })
-    });
+    let res;
+    try {
+      res = await api(`/instances/${instance.id}/save`, {
+        method:"POST",
+        headers: {"Content-Type":"application/json"},
+        body: JSON.stringify({ values, audit, mode: "delta", base_version: version })
+      });
+    } catch (e) {
+      alert(`Erro ao salvar: ${e.message}`);
+      return;
+    }
+    setVersion(res.version);
+    dirtyRef.current = new Set();
+    // formula results recalculated by the server for the cells we just saved
+    for (const c of res.computed || []) {
+      if (!c.error) await setCell(c.sheet_name, c.cell_ref, c.value);
+    }
+    hotRef.current?.hotInstance?.render();
     alert("Salvo com sucesso.");
     setAudit([]);
   }
 
   async function exportPdf() {
     if (!instance) return;
-    const res = await api(`/instances/${instance.id}/export`, { method:"POST" });
-    // backend returns {filename, pdf_hex}
-    const bytes = hexToUint8(res.pdf_hex);
-    const blob = new Blob([bytes], {type:"application/pdf"});
-    const url = URL.createObjectURL(blob);
+    // export runs as a background job; poll until it finishes
+    const { job_id } = await api(`/instances/${instance.id}/export?async=true`, { method:"POST" });
+    let job;
+    do {
+      await new Promise(r => setTimeout(r, 1000));
+      job = await api(`/export-jobs/${job_id}`);
+    } while (job.status === "queued" || job.status === "running");
+    if (job.status !== "done") {
+      alert(`Falha na exportação: ${job.error || job.status}`);
+      return;
+    }
+    const res = await apiBlob(`/export-jobs/${job_id}/result.pdf`);
+    const url = URL.createObjectURL(res.blob);
     const a = document.createElement("a");
     a.href = url;
     a.download = res.filename || "export.pdf";
@@ -153,14 +272,23 @@ export default function Operator() {
             <>
               <hr/>
               <p><b>Template:</b> {selected.name}</p>
+              {sheets.length > 1 && (
+                <p>
+                  {sheets.map(m=>(
+                    <button key={m.index} onClick={()=>showSheet(m)} disabled={m.name===sheetName} style={{marginRight: 4}}>{m.name}</button>
+                  ))}
+                </p>
+              )}
               <p><b>Células mapeadas:</b> {mappedCells.filter(c=>c.sheet_name===sheetName).length}</p>
-              <button onClick={save} disabled={!instance}>Salvar</button>
+              <button onClick={save} disabled={!instance || live}>{live ? "Salvamento automático" : "Salvar"}</button>
               <button onClick={exportPdf} disabled={!instance} style={{marginLeft: 8}}>Exportar PDF</button>
               <div style={{marginTop: 10}}>
                 <small>Obs.: edição bloqueada fora das células mapeadas.</small>
               </div>
               <div style={{marginTop: 10}}>
-                <small>Audit pendente: {audit.length} eventos.</small>
+                {live
+                  ? <small>Editando agora: {viewers.join(", ")}</small>
+                  : <small>Audit pendente: {audit.length} eventos.</small>}
               </div>
             </>
           )}
@@ -170,11 +298,14 @@ export default function Operator() {
           {!selected ? <p>Selecione um template para carregar.</p> : (
             <div style={{border:"1px solid #ddd", borderRadius: 8, padding: 8}}>
               <HotTable
+                ref={hotRef}
                 data={sheetData}
                 colHeaders={true}
                 rowHeaders={true}
                 height={640}
                 licenseKey="non-commercial-and-evaluation"
+                mergeCells={layout.mergeCells}
+                colWidths={layout.colWidths}
                 beforeChange={onBeforeChange}
                 afterChange={onAfterChange}
                 cells={(row, col)=>({ readOnly: cellReadOnly(row, col) })}